@@ -16,6 +16,66 @@ class Settings(BaseSettings):
     API_SCHEME: str = "http"
     API_URL: str = "127.0.0.1:8000"
     QR_CODE_ENDPOINT: str = "/qr_code/{uuid}"
+    # encoded in new codes instead of the uuid url: fewer characters, a smaller QR version
+    QR_SHORT_ENDPOINT: str = "/r/{slug}"
+    QR_SLUG_LENGTH: int = 7
+
+    # total size of encoded png/svg images kept in memory per worker
+    QR_IMAGE_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    # on-disk image store shared by workers and nginx; disabled when unset
+    QR_IMAGE_DISK_CACHE_DIR: str | None = None
+    QR_IMAGE_DISK_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    # encoded module matrices (payload + error correction), shared by every scale, style and format
+    QR_MATRIX_CACHE_SIZE: int = 1024
+    # error correction of "auto" codes: the minimum level each module shape needs to scan reliably (at least
+    # QR_ECC_TARGET_GRADIENT with a gradient fill), raised to the strongest level that fits the same version
+    QR_ECC_TARGETS: dict[str, Literal["L", "M", "Q", "H"]] = {"square": "L", "rounded": "M", "dots": "Q"}
+    QR_ECC_TARGET_GRADIENT: Literal["L", "M", "Q", "H"] = "Q"
+    # "numpy" assembles images from pre-rendered module tiles; "qrcode" draws module by module (reference)
+    QR_RENDER_ENGINE: Literal["numpy", "qrcode"] = "numpy"
+    # zlib settings of every png encode: 0-9, and one of default/filtered/huffman_only/rle/fixed
+    QR_PNG_COMPRESS_LEVEL: int = 6
+    QR_PNG_COMPRESS_STRATEGY: Literal["default", "filtered", "huffman_only", "rle", "fixed"] = "default"
+    # png renders above this many pixels are streamed row by row instead of being rendered in one piece. Only long
+    # payloads get there: a short /r/ url is a version 2-3 code, 1320-1480 px wide even at scale 40, while 2048 px
+    # at scale 40 takes version 7, i.e. a public url of about 135 characters (75 for dots or gradients, whose
+    # error correction is stronger), as with short_url off and a long API_URL
+    QR_PNG_STREAM_MIN_PIXELS: int = 2048 * 2048
+    # lossless webp compression effort, 0-100: higher is smaller and slower
+    QR_WEBP_EFFORT: int = 80
+    # render worker processes (0 renders in a thread) and how many renders may wait before answering 503
+    QR_RENDER_WORKERS: int = 2
+    QR_RENDER_MAX_PENDING: int = 32
+    # editor style previews: pixel size of a module, and how many distinct styles are kept rendered
+    QR_PREVIEW_SCALE: int = 6
+    QR_PREVIEW_CACHE_SIZE: int = 256
+    # named thumbnail sizes of the image endpoint (`size=`), as image widths in pixels
+    QR_THUMBNAIL_SIZES: dict[Literal["thumb", "sm", "md"], int] = {"thumb": 64, "sm": 128, "md": 256}
+    # redirect targets cached per worker: how many, for how many seconds, and the longest a worker may go on
+    # serving a link that was changed (or a code that was deleted) through another worker
+    QR_REDIRECT_CACHE_SIZE: int = 10_000
+    QR_REDIRECT_CACHE_TTL: float = 300
+    QR_REDIRECT_CACHE_MAX_STALENESS: float = 5
+    # scans are appended to a journal file per worker (a new one past QR_SCAN_JOURNAL_SEGMENT_BYTES) and fsynced as a
+    # group every QR_SCAN_JOURNAL_SYNC_MS; a background applier writes them to the database every
+    # QR_SCAN_APPLY_INTERVAL_MS, or once QR_SCAN_BATCH_SIZE scans wait, a batch per transaction
+    QR_SCAN_JOURNAL_DIR: str = "./scan_journal"
+    QR_SCAN_JOURNAL_SYNC_MS: float = 5
+    QR_SCAN_JOURNAL_SEGMENT_BYTES: int = 16 * 1024 * 1024
+    QR_SCAN_APPLY_INTERVAL_MS: int = 1000
+    QR_SCAN_BATCH_SIZE: int = 500
+    # once this many scans wait to be applied a redirect waits for room ("block") or loses its scan ("drop"); a
+    # blocked redirect gives up waiting after QR_SCAN_JOURNAL_BLOCK_TIMEOUT_MS and drops its scan too
+    QR_SCAN_JOURNAL_MAX_BACKLOG: int = 100_000
+    QR_SCAN_JOURNAL_OVERFLOW: Literal["block", "drop"] = "block"
+    QR_SCAN_JOURNAL_BLOCK_TIMEOUT_MS: int = 1000
+    # scan events past the retention are deleted at start and then every QR_SCAN_RETENTION_INTERVAL_S, in chunks of
+    # QR_SCAN_RETENTION_CHUNK rows with a QR_SCAN_RETENTION_PAUSE_MS break between them
+    QR_SCAN_RETENTION_INTERVAL_S: int = 3600
+    QR_SCAN_RETENTION_CHUNK: int = 1000
+    QR_SCAN_RETENTION_PAUSE_MS: int = 50
+    # images of one zip export rendered (or read from cache) at the same time
+    QR_EXPORT_CONCURRENCY: int = 4
 
     CORS_ORIGINS: list[str] = []
     COOKIE_SECURE: bool = False
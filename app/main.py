@@ -26,7 +26,11 @@ from core.settings import settings
 from google_auth.providers import GoogleAuthProvider
 from google_auth.router import router as google_auth_router
 from qr_code.providers import QrCodeProvider
+from qr_code.router import metrics_router as qr_code_metrics_router
 from qr_code.router import router as qr_code_router
+from qr_code.router import short_router as qr_code_short_router
+from qr_code.scan_journal import ScanJournal
+from qr_code.scan_retention import ScanRetention
 from telegram_auth.providers import TelegramAuthProvider
 from telegram_auth.router import public_router as telegram_auth_public_router
 from telegram_auth.router import router as telegram_auth_router
@@ -41,6 +45,10 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name
 @asynccontextmanager
 async def lifespan(app: FastAPI, container: AsyncContainer):
     await asyncio.to_thread(upgrade_database)
+    # replays the scans a previous run journaled and did not get to apply
+    await container.get(ScanJournal)
+    # starts deleting expired scan events on a schedule
+    await container.get(ScanRetention)
     async with container(scope=Scope.REQUEST) as request_container:
         user_service = await request_container.get(UserService)
         session = await request_container.get(AsyncSession)
@@ -72,6 +80,8 @@ def create_app():
         return {"status": "ok"}
 
     app.include_router(qr_code_router, prefix="/qr_code")
+    app.include_router(qr_code_short_router, prefix="/r")
+    app.include_router(qr_code_metrics_router, prefix="/metrics")
     app.include_router(auth_router, prefix="/auth")
     app.include_router(user_router, prefix="/user")
     app.include_router(telegram_auth_router, prefix="/auth/telegram")
@@ -0,0 +1,51 @@
+"""short base62 slug on qr_code, backfilled for existing codes
+
+Revision ID: 0009
+Revises: 0008
+
+"""
+
+import secrets
+import string
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+# frozen copy of the app's slug format, so the migration does not change when the app does
+SLUG_ALPHABET = string.digits + string.ascii_letters
+SLUG_LENGTH = 7
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("qr_code", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("slug", sa.String(), nullable=True))
+        # existing codes keep encoding their uuid url; the model default turns it on for new ones
+        batch_op.add_column(sa.Column("short_url", sa.Boolean(), server_default=sa.false(), nullable=False))
+
+    qr_code = sa.table("qr_code", sa.column("id"), sa.column("slug"))
+    conn = op.get_bind()
+    ids = conn.execute(sa.select(qr_code.c.id)).scalars().all()
+    slugs: set[str] = set()
+    while len(slugs) < len(ids):
+        slugs.add("".join(secrets.choice(SLUG_ALPHABET) for _ in range(SLUG_LENGTH)))
+    if ids:
+        conn.execute(
+            sa.update(qr_code).where(qr_code.c.id == sa.bindparam("_id")).values(slug=sa.bindparam("_slug")),
+            [{"_id": id_, "_slug": slug} for id_, slug in zip(ids, slugs)],
+        )
+
+    with op.batch_alter_table("qr_code", schema=None) as batch_op:
+        batch_op.alter_column("slug", existing_type=sa.String(), nullable=False)
+        batch_op.create_index("ix_qr_code_slug", ["slug"], unique=True)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("qr_code", schema=None) as batch_op:
+        batch_op.drop_index("ix_qr_code_slug")
+        batch_op.drop_column("short_url")
+        batch_op.drop_column("slug")
@@ -0,0 +1,24 @@
+"""error correction setting on qr_code
+
+Revision ID: 0010
+Revises: 0009
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # existing codes keep the level they were rendered with so far; new ones default to "auto" in the model
+    op.add_column("qr_code", sa.Column("error_correction", sa.String(), server_default="M", nullable=False))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("qr_code", schema=None) as batch_op:
+        batch_op.drop_column("error_correction")
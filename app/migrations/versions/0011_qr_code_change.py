@@ -0,0 +1,28 @@
+"""qr_code_change log for cross-worker redirect cache invalidation
+
+Revision ID: 0011
+Revises: 0010
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0011"
+down_revision = "0010"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "qr_code_change",
+        sa.Column("id", sa.UUID(), primary_key=True),
+        sa.Column("qr_code_id", sa.UUID(), nullable=False),
+        sa.Column("ts", sa.BigInteger(), nullable=False),
+    )
+    op.create_index(op.f("ix_qr_code_change_ts"), "qr_code_change", ["ts"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_table("qr_code_change")
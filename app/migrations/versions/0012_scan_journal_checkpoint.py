@@ -0,0 +1,26 @@
+"""scan_journal_checkpoint: applied offsets of the scan journal segments
+
+Revision ID: 0012
+Revises: 0011
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0012"
+down_revision = "0011"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "scan_journal_checkpoint",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("offset", sa.BigInteger(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("scan_journal_checkpoint")
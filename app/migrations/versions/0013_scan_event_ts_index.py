@@ -0,0 +1,21 @@
+"""index scan_event.ts for the retention job
+
+Revision ID: 0013
+Revises: 0012
+
+"""
+
+from alembic import op
+
+revision = "0013"
+down_revision = "0012"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_scan_event_ts", "scan_event", ["ts"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_scan_event_ts", table_name="scan_event")
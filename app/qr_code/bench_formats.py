@@ -0,0 +1,53 @@
+"""Encode time and size of PNG vs lossless WebP for every style, solid and gradient.
+
+    cd app && python -m qr_code.bench_formats [--repeat N]
+
+Rendering is done once per case and left out; only the encoder runs in the timed loop.
+"""
+
+import argparse
+import statistics
+import time
+
+from qr_code.models import QR_STYLES, encode_png, encode_webp, raster, render_qr_image
+
+CASES = (
+    ("short", "https://example.com/menu"),
+    ("long", "https://example.com/" + "x" * 300),
+)
+FILLS = (("solid", None), ("gradient", "#1D4ED8"))
+SCALES = (10, 20)
+
+
+def _time(encode, image, repeat: int) -> tuple[float, int]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        content = encode(image)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, len(content)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'case':<6} {'scale':>5} {'style':<8} {'fill':<8} {'png ms':>8} {'png B':>8} {'webp ms':>8} {'webp B':>8}")
+    for case, data in CASES:
+        for scale in SCALES:
+            for style in QR_STYLES:
+                for fill, fill_color2 in FILLS:
+                    image = render_qr_image(data, "#2A5E8C", fill_color2, "#F5EFE6", style, scale)
+                    if fill_color2 is None and image.mode == "RGB":
+                        image = raster.to_palette(image) or image  # as render_qr_bytes does
+                    png_ms, png_size = _time(encode_png, image, args.repeat)
+                    webp_ms, webp_size = _time(encode_webp, image, args.repeat)
+                    print(
+                        f"{case:<6} {scale:>5} {style:<8} {fill:<8} "
+                        f"{png_ms:>8.1f} {png_size:>8} {webp_ms:>8.1f} {webp_size:>8}"
+                    )
+
+
+if __name__ == "__main__":
+    main()
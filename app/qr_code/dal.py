@@ -1,14 +1,14 @@
 from typing import Sequence
 from uuid import UUID
 
-from sqlalchemy import delete, select, update
+from sqlalchemy import BindParameter, Integer, bindparam, case, delete, or_, select, update
 
 from core.crud_base import CrudBase
 from core.repo_base import RepoBase
 from core.serializer import Serializer
 from core.types import DTO
-from qr_code.models import QrCode, ScanEvent
-from qr_code.tables import qr_code_table, scan_event_table
+from qr_code.models import QrCode, QrCodeChange, RedirectTarget, ScanEvent
+from qr_code.tables import qr_code_change_table, qr_code_table, scan_event_table, scan_journal_checkpoint_table
 
 
 class QrCodeCrud(CrudBase[UUID]):
@@ -18,16 +18,56 @@ class QrCodeCrud(CrudBase[UUID]):
         res = await self.session.execute(select(self.table).where(self.table.c.user_id == user_id))
         return res.mappings().all()
 
+    async def get_by_slug(self, slug: str) -> DTO:
+        res = await self.session.execute(select(self.table).where(self.table.c.slug == slug))
+        return res.mappings().one()
+
+    async def get_redirect(self, id_: UUID) -> DTO:
+        res = await self.session.execute(select(self.table.c.id, self.table.c.link).where(self.table.c.id == id_))
+        return res.mappings().one()
+
+    async def get_slug_redirect(self, slug: str) -> DTO:
+        res = await self.session.execute(select(self.table.c.id, self.table.c.link).where(self.table.c.slug == slug))
+        return res.mappings().one()
+
+    async def slug_exists(self, slug: str) -> bool:
+        res = await self.session.execute(select(self.table.c.id).where(self.table.c.slug == slug))
+        return res.first() is not None
+
+    async def get_style(self, id_: UUID) -> DTO:
+        res = await self.session.execute(
+            select(
+                self.table.c.fill_color,
+                self.table.c.fill_color2,
+                self.table.c.back_color,
+                self.table.c.style,
+                self.table.c.slug,
+                self.table.c.short_url,
+                self.table.c.error_correction,
+            ).where(self.table.c.id == id_)
+        )
+        return res.mappings().one()
+
     async def transfer_owner(self, from_user_id: UUID, to_user_id: UUID) -> None:
         await self.session.execute(
             update(self.table).where(self.table.c.user_id == from_user_id).values(user_id=to_user_id)
         )
 
-    async def increment_scan_count(self, id_: UUID, now: int) -> None:
+    async def add_scan_counts(self, counts: Sequence[DTO]) -> None:
+        """One executemany UPDATE; `counts` holds `_id`, `_count` (scans to add) and `_ts` (latest scan) per code."""
+        if not counts:
+            return
+        last_scan_at = self.table.c.last_scan_at
+        ts: BindParameter[int] = bindparam("_ts", type_=Integer)
         await self.session.execute(
             update(self.table)
-            .where(self.table.c.id == id_)
-            .values(scan_count=self.table.c.scan_count + 1, last_scan_at=now)
+            .where(self.table.c.id == bindparam("_id"))
+            .values(
+                scan_count=self.table.c.scan_count + bindparam("_count"),
+                # another worker may have written a later scan already
+                last_scan_at=case((or_(last_scan_at.is_(None), last_scan_at < ts), ts), else_=last_scan_at),
+            ),
+            counts,
         )
 
 
@@ -41,11 +81,62 @@ class QrCodeRepo(RepoBase[UUID, QrCode]):
         qr_code = await self.crud.get_all_user_qr_codes(user_id)
         return self.serializer.flat.deserialize(qr_code)
 
+    async def get_by_slug(self, slug: str) -> QrCode:
+        dto = await self.crud.get_by_slug(slug)
+        return self.serializer.deserialize(dto)
+
+    async def slug_exists(self, slug: str) -> bool:
+        return await self.crud.slug_exists(slug)
+
+    async def get_style(self, id_: UUID) -> dict:
+        # just the columns the image depends on, without building a QrCode
+        style = dict(await self.crud.get_style(id_))
+        if not style.pop("short_url"):
+            style["slug"] = None
+        return style
+
     async def transfer_owner(self, from_user_id: UUID, to_user_id: UUID) -> None:
         await self.crud.transfer_owner(from_user_id, to_user_id)
 
-    async def increment_scan_count(self, id_: UUID, now: int) -> None:
-        await self.crud.increment_scan_count(id_, now)
+    async def get_redirect(self, id_: UUID) -> RedirectTarget:
+        dto = await self.crud.get_redirect(id_)
+        return RedirectTarget(dto["id"], dto["link"])
+
+    async def get_slug_redirect(self, slug: str) -> RedirectTarget:
+        dto = await self.crud.get_slug_redirect(slug)
+        return RedirectTarget(dto["id"], dto["link"])
+
+    async def update_and_get(self, values: QrCode) -> QrCode:
+        # counters only move through add_scan_counts: writing back what was read would undo flushes made meanwhile
+        dto = self.serializer.serialize(values)
+        del dto["scan_count"], dto["last_scan_at"]
+        dto = await self.crud.update_and_get(dto)
+        return self.serializer.deserialize(dto)
+
+
+class QrCodeChangeCrud(CrudBase[UUID]):
+    table = qr_code_change_table
+
+    async def get_since(self, since_ts: int) -> Sequence[DTO]:
+        res = await self.session.execute(select(self.table).where(self.table.c.ts >= since_ts))
+        return res.mappings().all()
+
+    async def delete_older_than(self, cutoff_ts: int) -> None:
+        await self.session.execute(delete(self.table).where(self.table.c.ts < cutoff_ts))
+
+
+class QrCodeChangeRepo(RepoBase[UUID, QrCodeChange]):
+    crud: QrCodeChangeCrud
+
+    def __init__(self, crud: QrCodeChangeCrud, serializer: Serializer[QrCodeChange, DTO]):
+        super().__init__(crud, serializer, QrCodeChange)
+
+    async def get_since(self, since_ts: int) -> Sequence[QrCodeChange]:
+        dtos = await self.crud.get_since(since_ts)
+        return self.serializer.flat.deserialize(dtos)
+
+    async def delete_older_than(self, cutoff_ts: int) -> None:
+        await self.crud.delete_older_than(cutoff_ts)
 
 
 class ScanEventCrud(CrudBase[UUID]):
@@ -57,10 +148,11 @@ class ScanEventCrud(CrudBase[UUID]):
         )
         return [row[0] for row in res.all()]
 
-    async def delete_older_than(self, qr_code_id: UUID, cutoff_ts: int) -> None:
-        await self.session.execute(
-            delete(self.table).where(self.table.c.qr_code_id == qr_code_id, self.table.c.ts < cutoff_ts)
-        )
+    async def delete_expired(self, cutoff_ts: int, limit: int) -> int:
+        """Deletes up to `limit` events (of any code) older than `cutoff_ts`; returns how many it deleted."""
+        expired = select(self.table.c.id).where(self.table.c.ts < cutoff_ts).limit(limit).scalar_subquery()
+        res = await self.session.execute(delete(self.table).where(self.table.c.id.in_(expired)))
+        return res.rowcount
 
 
 class ScanEventRepo(RepoBase[UUID, ScanEvent]):
@@ -72,5 +164,13 @@ class ScanEventRepo(RepoBase[UUID, ScanEvent]):
     async def get_ts_since(self, qr_code_id: UUID, since: int) -> Sequence[int]:
         return await self.crud.get_ts_since(qr_code_id, since)
 
-    async def delete_older_than(self, qr_code_id: UUID, cutoff_ts: int) -> None:
-        await self.crud.delete_older_than(qr_code_id, cutoff_ts)
+
+class ScanJournalCheckpointCrud(CrudBase[str]):
+    table = scan_journal_checkpoint_table
+
+    async def get_offset(self, segment: str) -> int | None:
+        res = await self.session.execute(select(self.table.c.offset).where(self.table.c.id == segment))
+        return res.scalar_one_or_none()
+
+    async def set_offset(self, segment: str, offset: int) -> None:
+        await self.session.execute(update(self.table).where(self.table.c.id == segment).values(offset=offset))
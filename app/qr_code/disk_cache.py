@@ -0,0 +1,115 @@
+import contextlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+from qr_code.models import QrRender
+
+logger = logging.getLogger(__name__)
+
+
+class DiskImageCache:
+    """Content-addressed store of encoded QR images on the data volume.
+
+    Unlike RenderedImageCache it survives restarts and is shared by all workers (and by nginx,
+    which serves the files itself via X-Accel-Redirect). File names are render digests, so entries
+    never go stale and need no invalidation; a janitor drops the least recently used files
+    once the directory outgrows `max_bytes`. Disabled when `directory` is None.
+    """
+
+    def __init__(self, directory: Path | None, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # bytes written since the last sweep; the janitor runs after every tenth of the budget
+        self._written = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def path_for(self, render: QrRender, encoding: str = "identity") -> Path:
+        assert self.directory is not None
+        digest = render.digest
+        # gzip variants sit next to the plain file, where nginx's gzip_static looks for them
+        suffix = ".gz" if encoding == "gzip" else ""
+        return self.directory / digest[:2] / f"{digest}.{render.fmt}{suffix}"
+
+    def get(self, render: QrRender, encoding: str = "identity") -> Path | None:
+        if self.directory is None:
+            return None
+        path = self.path_for(render, encoding)
+        try:
+            os.utime(path)  # mtime doubles as the last-access time for the janitor
+        except FileNotFoundError:
+            return None
+        return path
+
+    def contains(self, render: QrRender, encoding: str = "identity") -> bool:
+        """Presence check that, unlike get, does not count as a use for the janitor."""
+        return self.directory is not None and self.path_for(render, encoding).exists()
+
+    def put(self, render: QrRender, content: bytes, encoding: str = "identity") -> None:
+        """Atomically store `content`; blocking, run it in a thread."""
+        if self.directory is None:
+            return
+        with self.writer(render, encoding) as file:
+            file.write(content)
+
+    @contextlib.contextmanager
+    def writer(self, render: QrRender, encoding: str = "identity") -> Iterator[BinaryIO]:
+        """File to write an image into piece by piece; it only becomes visible if the block completes."""
+        assert self.directory is not None
+        path = self.path_for(render, encoding)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write-then-rename: readers (other workers, nginx) never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                yield tmp
+                size = tmp.tell()
+            os.chmod(tmp_path, 0o644)  # mkstemp creates 0600, nginx runs as another user
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        self._written += size
+        if self._written > self.max_bytes // 10:
+            self._written = 0
+            self.prune()
+
+    def prune(self) -> int:
+        """Delete least recently used files until the store is back under 90% of its budget."""
+        if self.directory is None:
+            return 0
+        files = []
+        for path in self.directory.glob("*/*"):
+            if path.suffix == ".tmp":  # still being written, by this or another worker
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # removed by another worker's janitor
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        if total <= self.max_bytes:
+            return 0
+        removed = 0
+        for mtime, size, path in sorted(files, key=lambda file: file[0]):
+            try:
+                if path.stat().st_mtime != mtime:
+                    continue  # served since the scan above: no longer among the least recently used
+            except FileNotFoundError:
+                continue
+            path.unlink(missing_ok=True)
+            removed += 1
+            total -= size
+            if total <= self.max_bytes * 0.9:
+                break
+        logger.info("image disk cache: removed %d files, %d bytes left", removed, total)
+        return removed
+
+    def accel_redirect_uri(self, path: Path, prefix: str) -> str:
+        assert self.directory is not None
+        return prefix.rstrip("/") + "/" + path.relative_to(self.directory).as_posix()
@@ -0,0 +1,157 @@
+"""QR encoding with a vectorized mask search.
+
+``qrcode``'s ``make(fit=True)`` places the data eight times, once per mask pattern, and scores each candidate
+with its pure-Python ``lost_point``; from version 10 on that is nearly all of the encoding time. Here the
+library still does what it is good at (segmenting, version fitting, Reed-Solomon) and the function patterns
+are laid out by its own setup methods, but data placement and the four penalty rules run on NumPy arrays for
+all eight masks at once. The scoring reproduces the library's, including its quirks (format and version areas
+are scored light, ties go to the lowest mask), so the chosen mask and the resulting matrix are identical.
+"""
+
+import functools
+
+import numpy as np
+import qrcode
+import qrcode.constants
+from qrcode import util
+
+MASK_COUNT = 8
+# 1:1:3:1:1 finder-like runs with four light modules on either side, as 11-bit words
+FINDER_PATTERNS = (0b10111010000, 0b00001011101)
+
+
+@functools.lru_cache(maxsize=40)
+def _layout(version: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Per version: the function patterns (as scored during the mask search), the data module placement order
+    (flat indices, zigzag from the bottom right) and the eight masks over those modules."""
+    qr = qrcode.main.QRCode(version=version)
+    size = qr.modules_count = version * 4 + 17
+    qr.modules = [[None] * size for _ in range(size)]
+    # same order as QRCode.makeImpl: later patterns skip modules that are already set
+    qr.setup_position_probe_pattern(0, 0)
+    qr.setup_position_probe_pattern(size - 7, 0)
+    qr.setup_position_probe_pattern(0, size - 7)
+    qr.setup_position_adjust_pattern()
+    qr.setup_timing_pattern()
+    qr.setup_type_info(True, 0)
+    if version >= 7:
+        qr.setup_type_number(True)
+
+    function = np.array([[bool(module) for module in row] for row in qr.modules])
+    free = [[module is None for module in row] for row in qr.modules]
+    positions: list[int] = []
+    upward = True
+    for col in range(size - 1, 0, -2):
+        if col <= 6:
+            col -= 1  # skip the vertical timing pattern
+        rows = range(size - 1, -1, -1) if upward else range(size)
+        for row in rows:
+            for c in (col, col - 1):
+                if free[row][c]:
+                    positions.append(row * size + c)
+        upward = not upward
+    order = np.array(positions, dtype=np.intp)
+
+    i, j = np.divmod(order, size)
+    masks = np.stack(
+        [
+            (i + j) % 2 == 0,
+            i % 2 == 0,
+            j % 3 == 0,
+            (i + j) % 3 == 0,
+            (i // 2 + j // 3) % 2 == 0,
+            (i * j) % 2 + (i * j) % 3 == 0,
+            ((i * j) % 2 + (i * j) % 3) % 2 == 0,
+            ((i * j) % 3 + (i + j) % 2) % 2 == 0,
+        ]
+    )
+    for array in (function, order, masks):
+        array.flags.writeable = False
+    return function, order, masks
+
+
+def _candidates(version: int, codewords: list[int]) -> np.ndarray:
+    function, order, masks = _layout(version)
+    size = len(function)
+    bits = np.zeros(len(order), dtype=bool)
+    data = np.unpackbits(np.array(codewords, dtype=np.uint8)).astype(bool)
+    # remainder bits past the last codeword stay light
+    bits[: len(data)] = data[: len(order)]
+    candidates = np.repeat(function.reshape(1, -1), MASK_COUNT, axis=0)
+    candidates[:, order] = bits ^ masks
+    return candidates.reshape(MASK_COUNT, size, size)
+
+
+def _run_penalty(candidates: np.ndarray) -> np.ndarray:
+    # N1: a run of n >= 5 same-colour modules costs n - 2, i.e. one per window of five plus two per run
+    same = candidates[:, :, 1:] == candidates[:, :, :-1]
+    width = same.shape[2] - 3
+    windows = same[:, :, :width].copy()
+    for offset in (1, 2, 3):
+        end = offset + width
+        windows &= same[:, :, offset:end]
+    starts = windows.copy()
+    starts[:, :, 1:] &= ~same[:, :, :-4]
+    return windows.sum(axis=(1, 2)) + 2 * starts.sum(axis=(1, 2))
+
+
+def _block_penalty(candidates: np.ndarray) -> np.ndarray:
+    # N2: 3 per 2x2 block of one colour, overlapping blocks counted separately
+    corner = candidates[:, :-1, :-1]
+    blocks = (corner == candidates[:, :-1, 1:]) & (corner == candidates[:, 1:, :-1]) & (corner == candidates[:, 1:, 1:])
+    return 3 * blocks.sum(axis=(1, 2))
+
+
+def _finder_penalty(candidates: np.ndarray) -> np.ndarray:
+    # N3: 40 per finder-like pattern
+    width = candidates.shape[2] - 10
+    words = np.zeros((MASK_COUNT, candidates.shape[1], width), dtype=np.uint16)
+    for offset in range(11):
+        end = offset + width
+        words = (words << 1) | candidates[:, :, offset:end]
+    return 40 * sum((words == pattern).sum(axis=(1, 2)) for pattern in FINDER_PATTERNS)
+
+
+def _balance_penalty(dark: int, size: int) -> int:
+    # N4: 10 per full 5% the dark share is away from half; the float arithmetic matches util.lost_point
+    percent = float(dark) / (size**2)
+    return int(abs(percent * 100 - 50) / 5) * 10
+
+
+def _best_mask(candidates: np.ndarray) -> int:
+    size = candidates.shape[1]
+    transposed = candidates.transpose(0, 2, 1)
+    scores = (
+        _run_penalty(candidates)
+        + _run_penalty(transposed)
+        + _block_penalty(candidates)
+        + _finder_penalty(candidates)
+        + _finder_penalty(transposed)
+    )
+    scores += [_balance_penalty(int(dark), size) for dark in candidates.sum(axis=(1, 2))]
+    return int(np.argmin(scores))  # first minimum, like QRCode.best_mask_pattern
+
+
+def fit_version(data: str, error_correction: int) -> int:
+    """Smallest version that holds `data` at this level, without encoding it."""
+    qr = qrcode.main.QRCode(version=None, error_correction=error_correction)
+    qr.add_data(data)
+    return qr.best_fit()
+
+
+def encode(data: str, error_correction: int = qrcode.constants.ERROR_CORRECT_M) -> tuple[int, np.ndarray]:
+    """Version and modules (bool, quiet zone excluded) of the code qrcode's ``make(fit=True)`` would build."""
+    qr = qrcode.main.QRCode(version=None, error_correction=error_correction)
+    qr.add_data(data)
+    version = qr.best_fit()
+    codewords = util.create_data(version, error_correction, qr.data_list)
+    candidates = _candidates(version, codewords)
+    mask = _best_mask(candidates)
+
+    # the real format and version information, written by the library itself into the chosen candidate
+    qr.modules = modules = candidates[mask]
+    qr.modules_count = len(modules)
+    qr.setup_type_info(False, mask)
+    if version >= 7:
+        qr.setup_type_number(False)
+    return version, modules
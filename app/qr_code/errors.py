@@ -0,0 +1,9 @@
+from core.errors import ApplicationError
+
+
+class QrCodeError(ApplicationError):
+    pass
+
+
+class RenderPoolBusyError(QrCodeError):
+    pass
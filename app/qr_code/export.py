@@ -0,0 +1,105 @@
+"""Bulk download: every code of a user as one ZIP archive, streamed while it is being built.
+
+Entries are rendered concurrently through the ImageRenderer (so cached images are reused and the render pool
+does the work) and written in completion order. At most ``concurrency`` images and one compressed entry are held
+in memory at a time, whatever the number of codes.
+"""
+
+import asyncio
+import io
+import re
+import time
+import zipfile
+from collections.abc import Buffer
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Sequence
+
+from qr_code.errors import RenderPoolBusyError
+from qr_code.models import QrCode, QrRender
+from qr_code.rendering import ImageRenderer
+
+# an export yields to interactive traffic: a full pool delays the archive instead of failing it mid-stream
+BUSY_RETRY_SECONDS = 0.1
+
+
+@dataclass(frozen=True)
+class ExportEntry:
+    qr_code: QrCode
+    render: QrRender
+
+    @property
+    def filename(self) -> str:
+        # id suffix keeps entries apart when several codes share a name
+        name = re.sub(r"[^\w\- ]+", "_", self.qr_code.name).strip(" _") or "qr"
+        return f"{name[:80]}-{self.qr_code.id.hex[:8]}.{self.render.fmt}"
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """Write-only, non-seekable sink for ZipFile; the archive is handed out chunk by chunk as it grows."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Buffer) -> int:
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        return len(chunk)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def _render(renderer: ImageRenderer, entry: ExportEntry) -> tuple[ExportEntry, bytes]:
+    qr_code_id = entry.qr_code.id
+    while True:
+        try:
+            content = await renderer.get(qr_code_id, entry.render)
+            if isinstance(content, Path):
+                content = await asyncio.to_thread(content.read_bytes)
+            elif not isinstance(content, bytes):
+                # print-size png: a zip entry needs all of it anyway
+                content = b"".join([chunk async for chunk in content])
+            return entry, content
+        except RenderPoolBusyError:
+            await asyncio.sleep(BUSY_RETRY_SECONDS)
+        except FileNotFoundError:
+            pass  # pruned by a janitor since the lookup: the next get renders it again
+
+
+async def stream_zip(renderer: ImageRenderer, entries: Sequence[ExportEntry], concurrency: int) -> AsyncIterator[bytes]:
+    buffer = _ChunkBuffer()
+    date_time = time.localtime()[:6]
+    remaining = iter(entries)
+    running: set[asyncio.Task[tuple[ExportEntry, bytes]]] = set()
+
+    def start_next() -> None:
+        entry = next(remaining, None)
+        if entry is not None:
+            running.add(asyncio.create_task(_render(renderer, entry)))
+
+    try:
+        with zipfile.ZipFile(buffer, mode="w") as archive:
+            for _ in range(max(1, concurrency)):
+                start_next()
+            while running:
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    entry, content = task.result()
+                    info = zipfile.ZipInfo(entry.filename, date_time)
+                    # png is deflated already; svg text compresses well
+                    info.compress_type = zipfile.ZIP_DEFLATED if entry.render.fmt == "svg" else zipfile.ZIP_STORED
+                    archive.writestr(info, content)
+                    start_next()
+                yield buffer.drain()
+        yield buffer.drain()  # central directory
+    finally:
+        # client went away (or a render failed): do not leave renders running for nobody
+        for task in running:
+            task.cancel()
@@ -0,0 +1,67 @@
+from collections import OrderedDict, defaultdict
+from uuid import UUID
+
+from qr_code.models import QrRender
+
+
+class RenderedImageCache:
+    """In-memory LRU of encoded QR images, bounded by their total size in bytes.
+
+    Per-process like the rate limiters: every worker keeps its own copy and state is lost on restart.
+    Entries are keyed by every render parameter and the content encoding (identity or gzip),
+    so a style edit can never serve a stale image; invalidation on update/delete only frees the memory early.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[UUID, QrRender, str], bytes] = OrderedDict()
+        self._variants_by_id: dict[UUID, set[tuple[QrRender, str]]] = defaultdict(set)
+
+    def get(self, qr_code_id: UUID, render: QrRender, encoding: str = "identity") -> bytes | None:
+        key = (qr_code_id, render, encoding)
+        content = self._entries.get(key)
+        if content is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return content
+
+    def contains(self, qr_code_id: UUID, render: QrRender, encoding: str = "identity") -> bool:
+        """Presence check that, unlike get, counts no hit or miss and leaves the LRU order alone."""
+        return (qr_code_id, render, encoding) in self._entries
+
+    def put(self, qr_code_id: UUID, render: QrRender, content: bytes, encoding: str = "identity") -> None:
+        if len(content) > self.max_bytes:
+            return
+        key = (qr_code_id, render, encoding)
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = content
+        self._variants_by_id[qr_code_id].add((render, encoding))
+        self.size += len(content)
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, qr_code_id: UUID) -> None:
+        for render, encoding in self._variants_by_id.pop(qr_code_id, ()):
+            self._remove((qr_code_id, render, encoding), forget=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def metrics(self) -> dict:
+        return {"entries": len(self._entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+    def _remove(self, key: tuple[UUID, QrRender, str], forget: bool = True) -> None:
+        content = self._entries.pop(key)
+        self.size -= len(content)
+        if forget:
+            qr_code_id, render, encoding = key
+            variants = self._variants_by_id[qr_code_id]
+            variants.discard((render, encoding))
+            if not variants:
+                del self._variants_by_id[qr_code_id]
@@ -0,0 +1,66 @@
+import functools
+from dataclasses import dataclass
+
+import numpy as np
+import qrcode
+import qrcode.constants
+import qrcode.exceptions
+
+from core.settings import settings
+from qr_code.encoding import encode, fit_version
+
+QR_BORDER = 4
+# weakest to strongest: roughly 7%, 15%, 25% and 30% of the codewords can be restored
+ERROR_CORRECTION_LEVELS = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+
+
+@dataclass(frozen=True, eq=False)
+class QrMatrix:
+    version: int
+    modules: np.ndarray  # read-only bool array, modules_count x modules_count, quiet zone excluded
+    error_correction: int = qrcode.constants.ERROR_CORRECT_M
+
+    @property
+    def size(self) -> int:
+        return len(self.modules)
+
+
+@functools.lru_cache(maxsize=settings.QR_MATRIX_CACHE_SIZE)
+def get_qr_matrix(data: str, error_correction: int = qrcode.constants.ERROR_CORRECT_M) -> QrMatrix:
+    """Encode `data` once: version fitting, Reed-Solomon and the mask search don't depend on style or scale."""
+    version, modules = encode(data, error_correction)
+    modules.flags.writeable = False
+    return QrMatrix(version=version, modules=modules, error_correction=error_correction)
+
+
+@functools.lru_cache(maxsize=settings.QR_MATRIX_CACHE_SIZE)
+def fit_qr_matrix(data: str, min_level: str) -> QrMatrix:
+    """The smallest version that holds `data` at `min_level`, at the strongest level that still fits in it:
+    the extra error correction comes for free, the module count is the same."""
+    levels = list(ERROR_CORRECTION_LEVELS)
+    stronger = levels.index(min_level) + 1
+    level = min_level
+    version = fit_version(data, ERROR_CORRECTION_LEVELS[min_level])
+    for candidate in levels[stronger:]:
+        try:
+            if fit_version(data, ERROR_CORRECTION_LEVELS[candidate]) > version:
+                break
+        except qrcode.exceptions.DataOverflowError:
+            break
+        level = candidate
+    return get_qr_matrix(data, ERROR_CORRECTION_LEVELS[level])
+
+
+def qr_from_matrix(matrix: QrMatrix, box_size: int = 10, image_factory=None) -> qrcode.main.QRCode:
+    """A compiled QRCode around an already encoded matrix, ready for make_image()."""
+    qr = qrcode.main.QRCode(version=matrix.version, box_size=box_size, border=QR_BORDER, image_factory=image_factory)
+    qr.modules = matrix.modules.tolist()
+    qr.modules_count = matrix.size
+    # make_image() only runs the encoder while data_cache is None
+    qr.data_cache = []
+    return qr
@@ -1,9 +1,15 @@
+import dataclasses
+import gzip
+import hashlib
+import io
+import math
+import secrets
+import string
 import uuid
+import zlib
 from dataclasses import dataclass, field
 from uuid import UUID
 
-import qrcode
-import qrcode.image.svg
 from PIL import Image
 from qrcode.image.styledpil import StyledPilImage
 from qrcode.image.styles.colormasks import RadialGradiantColorMask, SolidFillColorMask
@@ -11,8 +17,27 @@ from qrcode.image.styles.moduledrawers.pil import CircleModuleDrawer, RoundedMod
 
 from core.models import Model
 from core.settings import settings
+from qr_code import raster, vector
+from qr_code.matrix import ERROR_CORRECTION_LEVELS, QrMatrix, fit_qr_matrix, get_qr_matrix, qr_from_matrix
 
 QR_STYLES = ("square", "rounded", "dots")
+QR_FORMATS = ("png", "svg", "webp")
+IMAGE_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml", "webp": "image/webp"}
+# formats that are also cached as a precompressed gzip copy (png is deflated already)
+COMPRESSED_FORMATS = ("svg",)
+# part of every image ETag: bump whenever the encoded bytes for the same parameters change
+RENDER_VERSION = 4
+
+ZLIB_STRATEGIES = {
+    "default": zlib.Z_DEFAULT_STRATEGY,
+    "filtered": zlib.Z_FILTERED,
+    "huffman_only": zlib.Z_HUFFMAN_ONLY,
+    "rle": zlib.Z_RLE,
+    "fixed": zlib.Z_FIXED,
+}
+
+# url-safe and case-sensitive: 62^7 slugs at the default length
+BASE62_ALPHABET = string.digits + string.ascii_letters
 
 _MODULE_DRAWERS = {
     "square": SquareModuleDrawer,
@@ -35,6 +60,29 @@ def _relative_luminance(rgb: tuple[int, int, int]) -> float:
     return 0.2126 * channel(r) + 0.7152 * channel(g) + 0.0722 * channel(b)
 
 
+def ecc_target(style: str, gradient: bool) -> str:
+    """Minimum error correction level for codes of this style."""
+    levels = list(ERROR_CORRECTION_LEVELS)
+    target = settings.QR_ECC_TARGETS.get(style, "M")
+    if gradient:
+        target = max(target, settings.QR_ECC_TARGET_GRADIENT, key=levels.index)
+    return target
+
+
+def qr_matrix(data: str, error_correction: str, style: str, gradient: bool) -> QrMatrix:
+    if error_correction == "auto":
+        return fit_qr_matrix(data, ecc_target(style, gradient))
+    return get_qr_matrix(data, ERROR_CORRECTION_LEVELS[error_correction])
+
+
+def error_correction_name(level: int) -> str:
+    return next(name for name, value in ERROR_CORRECTION_LEVELS.items() if value == level)
+
+
+def new_slug(length: int | None = None) -> str:
+    return "".join(secrets.choice(BASE62_ALPHABET) for _ in range(length or settings.QR_SLUG_LENGTH))
+
+
 def contrast_ratio(color_a: str, color_b: str) -> float:
     """WCAG contrast ratio between two hex colors (1..21)."""
     la = _relative_luminance(hex_to_rgb(color_a))
@@ -55,63 +103,250 @@ class QrCode(Model):
     fill_color2: str | None = None  # radial-gradient edge color; solid fill when None
     back_color: str = "#ffffff"
     style: str = "square"
+    slug: str = field(default_factory=new_slug)
+    # False for codes created before slugs: they keep encoding the uuid url they may already be printed with
+    short_url: bool = True
+    # "auto" for new codes; codes from before the setting stay on "M" so their image does not change
+    error_correction: str = "auto"
+
+    @property
+    def url_slug(self) -> str | None:
+        return self.slug if self.short_url else None
 
     def public_url(self) -> str:
-        return settings.API_SCHEME + "://" + settings.API_URL + settings.QR_CODE_ENDPOINT.format(uuid=self.id)
+        return qr_public_url(self.id, self.url_slug)
 
-    def get_image(self, box_size: int = 10) -> Image.Image:
-        return render_qr_image(
-            self.public_url(), self.fill_color, self.fill_color2, self.back_color, self.style, box_size
+    def render_params(self, fmt: str = "png", box_size: int = 10, pixels: int | None = None) -> "QrRender":
+        return QrRender.for_code(
+            self.id,
+            fmt,
+            box_size,
+            pixels=pixels,
+            fill_color=self.fill_color,
+            fill_color2=self.fill_color2,
+            back_color=self.back_color,
+            style=self.style,
+            slug=self.url_slug,
+            error_correction=self.error_correction,
         )
 
-    def get_svg(self) -> bytes:
-        return render_qr_svg(self.public_url(), self.fill_color, self.back_color)
+
+def qr_public_url(qr_code_id: UUID, slug: str | None = None) -> str:
+    if slug is None:
+        path = settings.QR_CODE_ENDPOINT.format(uuid=qr_code_id)
+    else:
+        path = settings.QR_SHORT_ENDPOINT.format(slug=slug)
+    return settings.API_SCHEME + "://" + settings.API_URL + path
+
+
+@dataclass(frozen=True)
+class QrRender:
+    """Everything a rendered image depends on; hashable, so it doubles as a cache key."""
+
+    data: str
+    fill_color: str
+    fill_color2: str | None
+    back_color: str
+    style: str
+    fmt: str = "png"
+    box_size: int = 10
+    error_correction: str = "M"
+    pixels: int | None = None  # thumbnails: exact image width, box_size is then unused
+
+    @classmethod
+    def for_code(
+        cls,
+        qr_code_id: UUID,
+        fmt: str,
+        box_size: int,
+        *,
+        fill_color: str,
+        fill_color2: str | None,
+        back_color: str,
+        style: str,
+        slug: str | None = None,
+        error_correction: str = "M",
+        pixels: int | None = None,
+    ) -> "QrRender":
+        if fmt == "svg":
+            # vector output ignores scale and size; keeps a single cache entry per svg
+            box_size, pixels = 10, None
+        elif pixels is not None:
+            box_size = 10  # one cache entry per thumbnail size, whatever scale came with it
+        return cls(
+            qr_public_url(qr_code_id, slug),
+            fill_color,
+            fill_color2,
+            back_color,
+            style,
+            fmt,
+            box_size,
+            error_correction,
+            pixels,
+        )
+
+    @property
+    def matrix(self) -> QrMatrix:
+        return qr_matrix(self.data, self.error_correction, self.style, self.fill_color2 is not None)
+
+    @property
+    def digest(self) -> str:
+        """Content address of the encoded image: same parameters and renderer, same bytes.
+
+        "auto" error correction is hashed together with the level QR_ECC_TARGETS / QR_ECC_TARGET_GRADIENT
+        resolve it to, so changing those settings does not serve disk-cached images or ETags of the old level.
+        """
+        params = dataclasses.astuple(self)
+        if self.error_correction == "auto":
+            params += (ecc_target(self.style, self.fill_color2 is not None),)
+        return hashlib.sha256(repr((RENDER_VERSION, params)).encode()).hexdigest()[:32]
+
+    @property
+    def version(self) -> str:
+        """Changes with anything that changes the code's images, whatever their format and size: the `v` of
+        versioned image urls."""
+        return dataclasses.replace(self, fmt="png", box_size=10, pixels=None).digest[:16]
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.digest}"'
+
+    def etag_for(self, encoding: str) -> str:
+        # every content encoding is its own representation with its own strong validator
+        return self.etag if encoding == "identity" else f'"{self.digest}-{encoding}"'
+
+
+def render_qr_bytes(render: QrRender) -> bytes:
+    """Render and encode an image in the requested format."""
+    if render.fmt == "svg":
+        return render_qr_svg(
+            render.data, render.fill_color, render.fill_color2, render.back_color, render.style, render.error_correction
+        )
+    image = render_qr_image(
+        render.data,
+        render.fill_color,
+        render.fill_color2,
+        render.back_color,
+        render.style,
+        render.box_size if render.pixels is None else thumbnail_box_size(render, render.pixels),
+        render.error_correction,
+    )
+    if render.pixels is not None:
+        image = render_thumbnail(image, render.pixels)
+    if render.fmt == "webp":
+        return encode_webp(image)
+    if render.fill_color2 is None and image.mode == "RGB":
+        # solid fills have a handful of colours: a palette png stores 1-8 bits per pixel instead of 24
+        # (the numpy engine already returns palette images; gradients stay RGB, they filter and compress better)
+        image = raster.to_palette(image) or image
+    return encode_png(image)
+
+
+def thumbnail_box_size(render: QrRender, pixels: int) -> int:
+    # the smallest whole module size that reaches the target: modules are drawn crisp, then only slightly shrunk
+    return max(1, math.ceil(pixels / raster.pixel_size(render.matrix, 1)))
+
+
+def render_thumbnail(image: Image.Image, pixels: int) -> Image.Image:
+    if image.width == pixels:
+        return image
+    # box filter: each output pixel is the plain average of the pixels it covers, so edges stay sharp;
+    # palette images would only be resampled nearest-neighbour
+    info = image.info
+    image = image.convert("RGB").resize((pixels, pixels), Image.Resampling.BOX)
+    image.info.update(info)
+    return image
+
+
+def encode_png(image: Image.Image) -> bytes:
+    image_io = io.BytesIO()
+    image.save(
+        image_io,
+        format="PNG",
+        compress_level=settings.QR_PNG_COMPRESS_LEVEL,
+        compress_type=ZLIB_STRATEGIES[settings.QR_PNG_COMPRESS_STRATEGY],
+    )
+    return image_io.getvalue()
+
+
+def encode_webp(image: Image.Image) -> bytes:
+    # lossless: module edges must stay exact for scanners; webp has no palette mode, so indexes are expanded
+    image_io = io.BytesIO()
+    image.convert("RGB").save(image_io, format="WEBP", lossless=True, quality=settings.QR_WEBP_EFFORT, method=4)
+    return image_io.getvalue()
+
+
+def compress_image(content: bytes) -> bytes:
+    # mtime=0: same image, same bytes, so the gzip copy is as cacheable as the image itself
+    return gzip.compress(content, compresslevel=9, mtime=0)
 
 
 def render_qr_image(
-    data: str, fill_color: str, fill_color2: str | None, back_color: str, style: str, box_size: int = 10
+    data: str,
+    fill_color: str,
+    fill_color2: str | None,
+    back_color: str,
+    style: str,
+    box_size: int = 10,
+    error_correction: str = "M",
 ) -> Image.Image:
-    qr = qrcode.main.QRCode(
-        version=None,
-        error_correction=qrcode.constants.ERROR_CORRECT_M,
-        box_size=box_size,
-        border=4,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
+    """The code as an image; its `info` reports the QR version, module count and error correction level used."""
+    matrix = qr_matrix(data, error_correction, style, fill_color2 is not None)
     back = hex_to_rgb(back_color)
     fill = hex_to_rgb(fill_color)
-    if fill_color2 is not None:
-        # center → edge gradient reads as volume ("3D" look)
-        color_mask = RadialGradiantColorMask(back_color=back, center_color=fill, edge_color=hex_to_rgb(fill_color2))
+    if settings.QR_RENDER_ENGINE == "numpy":
+        if fill_color2 is not None:
+            # center → edge gradient reads as volume ("3D" look)
+            image = raster.render_gradient_image(matrix, style, box_size, fill, hex_to_rgb(fill_color2), back)
+        else:
+            image = raster.render_image(matrix, style, box_size, fill, back)
     else:
-        color_mask = SolidFillColorMask(back_color=back, front_color=fill)
-    return qr.make_image(
-        image_factory=StyledPilImage,
-        module_drawer=_MODULE_DRAWERS[style](),
-        color_mask=color_mask,
-    )
+        qr = qr_from_matrix(matrix, box_size)
+        if fill_color2 is not None:
+            # center → edge gradient reads as volume ("3D" look)
+            color_mask = RadialGradiantColorMask(back_color=back, center_color=fill, edge_color=hex_to_rgb(fill_color2))
+        else:
+            color_mask = SolidFillColorMask(back_color=back, front_color=fill)
+        image = qr.make_image(
+            image_factory=StyledPilImage,
+            module_drawer=_MODULE_DRAWERS[style](),
+            color_mask=color_mask,
+        ).get_image()
+    image.info.update(matrix_info(matrix))
+    return image
 
 
-def render_qr_svg(data: str, fill_color: str, back_color: str) -> bytes:
-    # SVG stays flat: solid fill only, gradients and module shapes are PNG-only
-    factory = type(
-        "ColoredSvgImage",
-        (qrcode.image.svg.SvgPathFillImage,),
-        {
-            "QR_PATH_STYLE": {**qrcode.image.svg.SvgPathImage.QR_PATH_STYLE, "fill": fill_color},
-            "background": back_color,
-        },
-    )
-    qr = qrcode.main.QRCode(
-        version=None,
-        error_correction=qrcode.constants.ERROR_CORRECT_M,
-        border=4,
-        image_factory=factory,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
-    return qr.make_image().to_string()
+def render_qr_svg(
+    data: str, fill_color: str, fill_color2: str | None, back_color: str, style: str, error_correction: str = "M"
+) -> bytes:
+    # same module shapes and gradient as the png, as vectors: prints at any size
+    matrix = qr_matrix(data, error_correction, style, fill_color2 is not None)
+    return vector.render_svg(matrix, style, fill_color, fill_color2, back_color)
+
+
+def matrix_info(matrix: QrMatrix) -> dict:
+    return {
+        "version": matrix.version,
+        "modules": matrix.size,
+        "error_correction": error_correction_name(matrix.error_correction),
+    }
+
+
+@dataclass(frozen=True)
+class RedirectTarget:
+    """What a scan needs of its code: where to count it and where to send the visitor."""
+
+    qr_code_id: UUID
+    link: str
+
+
+@dataclass(kw_only=True)
+class QrCodeChange(Model):
+    """An edit or delete of a code, logged for the redirect caches of the other workers."""
+
+    id: UUID = field(default_factory=uuid.uuid4)
+    qr_code_id: UUID
+    ts: int  # milliseconds
 
 
 @dataclass(kw_only=True)
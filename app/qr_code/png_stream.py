@@ -0,0 +1,103 @@
+"""Row-streaming PNG writer for print-size renders.
+
+A full render at scale 40 of a long link is thousands of pixels wide; as a PIL image plus its encoded copy
+that is hundreds of MB per request. Here the image never exists as a whole: the rasterizer hands out one
+band of pixel rows per module row, the band is filtered and fed to an incremental zlib compressor, and
+whatever the compressor emits goes out as an IDAT chunk. Peak memory is one module row of pixels.
+"""
+
+import struct
+import zlib
+from typing import Iterator
+
+import numpy as np
+
+from core.settings import settings
+from qr_code import raster
+from qr_code.matrix import QR_BORDER
+from qr_code.models import ZLIB_STRATEGIES, QrRender, hex_to_rgb
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+COLOR_TYPE_RGB, COLOR_TYPE_PALETTE = 2, 3
+FILTER_NONE, FILTER_SUB = 0, 1
+# modules per side of the largest code (version 40)
+MAX_MATRIX_SIZE = 177
+
+
+def may_stream(render: QrRender) -> bool:
+    """Whether should_stream can be true, without building the matrix: even a version 40 code at this box size
+    has to be over the threshold."""
+    if render.fmt != "png" or render.pixels is not None:
+        return False
+    width = (MAX_MATRIX_SIZE + QR_BORDER * 2) * render.box_size
+    return width * width > settings.QR_PNG_STREAM_MIN_PIXELS
+
+
+def should_stream(render: QrRender) -> bool:
+    if not may_stream(render):
+        return False
+    width = raster.pixel_size(render.matrix, render.box_size)
+    return width * width > settings.QR_PNG_STREAM_MIN_PIXELS
+
+
+def iter_png(render: QrRender) -> Iterator[bytes]:
+    """Encoded PNG in chunks; decodes to the same pixels as render_qr_image."""
+    matrix = render.matrix
+    width = raster.pixel_size(matrix, render.box_size)
+    back = hex_to_rgb(render.back_color)
+    fill = hex_to_rgb(render.fill_color)
+    palette = None
+    if render.fill_color2 is not None:
+        bands = raster.gradient_bands(matrix, render.style, render.box_size, fill, hex_to_rgb(render.fill_color2), back)
+    else:
+        palette, bands = raster.solid_bands(matrix, render.style, render.box_size, fill, back)
+
+    yield png_header(width, palette)
+
+    compressor = zlib.compressobj(
+        settings.QR_PNG_COMPRESS_LEVEL,
+        zlib.DEFLATED,
+        zlib.MAX_WBITS,
+        9,
+        ZLIB_STRATEGIES[settings.QR_PNG_COMPRESS_STRATEGY],
+    )
+    for band in bands:
+        data = compressor.compress(scanlines(band, palette))
+        if data:
+            yield png_chunk(b"IDAT", data)
+    yield png_chunk(b"IDAT", compressor.flush()) + png_chunk(b"IEND", b"")
+
+
+def png_header(width: int, palette: np.ndarray | None) -> bytes:
+    """Signature, IHDR and (for palette images) PLTE of a square image; RGB when there is no palette."""
+    if palette is None:
+        return PNG_SIGNATURE + _ihdr(width, 8, COLOR_TYPE_RGB)
+    header = _ihdr(width, 1 if len(palette) <= 2 else 8, COLOR_TYPE_PALETTE)
+    return PNG_SIGNATURE + header + png_chunk(b"PLTE", palette.tobytes())
+
+
+def scanlines(band: np.ndarray, palette: np.ndarray | None) -> bytes:
+    """Filtered rows of a band of palette indexes (or RGB pixels without a palette), ready to be deflated."""
+    rows = len(band)
+    if palette is None:
+        # sub filter: the difference to the pixel on the left, cheap to compute and much better to deflate
+        pixels = band.reshape(rows, -1)
+        filtered: np.ndarray = pixels.copy()
+        filtered[:, 3:] -= pixels[:, :-3]
+        filter_type = FILTER_SUB
+    else:
+        filtered = np.packbits(band, axis=1) if len(palette) <= 2 else band
+        filter_type = FILTER_NONE
+    out = np.empty((rows, filtered.shape[1] + 1), dtype=np.uint8)
+    out[:, 0] = filter_type
+    out[:, 1:] = filtered
+    return out.tobytes()
+
+
+def _ihdr(width: int, bit_depth: int, color_type: int) -> bytes:
+    # square image, deflate compression, adaptive filtering, no interlace
+    return png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, width, bit_depth, color_type, 0, 0, 0))
+
+
+def png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
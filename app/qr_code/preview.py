@@ -0,0 +1,72 @@
+"""Live style preview for the editor.
+
+The editor asks for a preview on every colour-picker movement, always of the same sample payload. Everything
+but the colours is fixed per style, so it is prepared once: the module matrix, a palette image whose entries
+stand for a paint coverage (and, for gradients, a distance from the centre), and its deflated PNG data. A
+preview is then just its palette, computed from the colours for at most 256 entries, in front of the prepared
+data. With a gradient every coverage level needs an entry per distance, so the distance is quantised into
+``256 // len(levels)`` steps and the preview shows bands where a real render is smooth. Finished previews are
+also kept in a small LRU keyed by the style.
+"""
+
+import functools
+import zlib
+from dataclasses import dataclass
+
+import numpy as np
+
+from core.settings import settings
+from qr_code import raster
+from qr_code.models import hex_to_rgb, qr_matrix
+from qr_code.png_stream import png_chunk, png_header, scanlines
+
+PREVIEW_DATA = "https://example.com/preview"
+PALETTE_SIZE = 256
+
+
+@dataclass(frozen=True, eq=False)
+class _Layers:
+    width: int
+    coverage: np.ndarray  # paint coverage 0..1 of every palette entry
+    distance: np.ndarray  # gradient position 0..1 (centre..corner) of every palette entry
+    idat: bytes  # deflated scanlines of the palette indexes
+
+
+@functools.lru_cache(maxsize=64)
+def _layers(style: str, box_size: int, error_correction: str, gradient: bool) -> _Layers:
+    matrix = qr_matrix(PREVIEW_DATA, error_correction, style, gradient)
+    # painted black on white the tiles are their own coverage map: grey g holds (255 - g) / 255 of the paint
+    image = raster.render_image(matrix, style, box_size, raster.PAINT, (255, 255, 255))
+    palette = image.getpalette()
+    assert palette is not None  # render_image draws palette images
+    levels = (255 - np.array(palette[::3], dtype=np.float64)) / 255
+    indexes = np.asarray(image)
+    distance: np.ndarray = np.zeros((len(levels),), dtype=np.float64)
+    if gradient:
+        # one entry per (coverage level, distance step): the distance is quantized into what the palette has left
+        steps = PALETTE_SIZE // len(levels)
+        field = raster.distance_band(image.width, 0, image.width)
+        indexes = indexes * steps + np.minimum(field * steps, steps - 1).astype(np.uint8)
+        levels = np.repeat(levels, steps)
+        distance = np.tile((np.arange(steps) + 0.5) / steps, len(levels) // steps)
+    idat = zlib.compress(scanlines(indexes, levels), 9)
+    return _Layers(image.width, levels, distance, idat)
+
+
+@functools.lru_cache(maxsize=settings.QR_PREVIEW_CACHE_SIZE)
+def render_preview(
+    fill_color: str, fill_color2: str | None, back_color: str, style: str, error_correction: str, box_size: int
+) -> bytes:
+    """PNG preview of the sample payload in this style; close to, not byte-identical with, a real render."""
+    layers = _layers(style, box_size, error_correction, fill_color2 is not None)
+    back = np.array(hex_to_rgb(back_color), dtype=np.float64)
+    center = np.array(hex_to_rgb(fill_color), dtype=np.float64)
+    edge = center if fill_color2 is None else np.array(hex_to_rgb(fill_color2), dtype=np.float64)
+    coverage = layers.coverage[:, None]
+    distance = layers.distance[:, None]
+    if not back.any():
+        # like the real renders: a colour mask can't tell paint from an all-zero background
+        coverage = np.zeros_like(coverage)
+    fill = np.trunc(edge * distance + center * (1 - distance))
+    palette = np.clip(np.trunc(fill * coverage + back * (1 - coverage)), 0, 255).astype(np.uint8)
+    return png_header(layers.width, palette) + png_chunk(b"IDAT", layers.idat) + png_chunk(b"IEND", b"")
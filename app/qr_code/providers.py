@@ -1,12 +1,87 @@
+import asyncio
+from pathlib import Path
+from typing import AsyncIterable, Iterable
+
 from dishka import Provider, Scope, provide
+from sqlalchemy.ext.asyncio import AsyncEngine
 
-from qr_code.dal import QrCodeCrud, QrCodeRepo, ScanEventCrud, ScanEventRepo
+from core.settings import settings
+from qr_code.dal import QrCodeChangeCrud, QrCodeChangeRepo, QrCodeCrud, QrCodeRepo, ScanEventCrud, ScanEventRepo
+from qr_code.disk_cache import DiskImageCache
+from qr_code.image_cache import RenderedImageCache
+from qr_code.redirect_cache import RedirectCache
+from qr_code.render_pool import RenderPool
+from qr_code.rendering import ImageRenderer, ImageWarmer
+from qr_code.scan_journal import ScanJournal
+from qr_code.scan_retention import ScanRetention
 from qr_code.services import QrCodeService
 
+# how long shutdown goes on applying the scan journal; what is left is replayed on the next start
+SCAN_JOURNAL_CLOSE_TIMEOUT = 10
+
 
 class QrCodeProvider(Provider):
     crud = provide(QrCodeCrud, scope=Scope.REQUEST)
     repo = provide(QrCodeRepo, scope=Scope.REQUEST)
     scan_event_crud = provide(ScanEventCrud, scope=Scope.REQUEST)
     scan_event_repo = provide(ScanEventRepo, scope=Scope.REQUEST)
+    qr_code_change_crud = provide(QrCodeChangeCrud, scope=Scope.REQUEST)
+    qr_code_change_repo = provide(QrCodeChangeRepo, scope=Scope.REQUEST)
     service = provide(QrCodeService, scope=Scope.REQUEST)
+    image_renderer = provide(ImageRenderer, scope=Scope.APP)
+
+    @provide(scope=Scope.APP)
+    def image_cache(self) -> RenderedImageCache:
+        return RenderedImageCache(settings.QR_IMAGE_CACHE_MAX_BYTES)
+
+    @provide(scope=Scope.APP)
+    def redirect_cache(self) -> RedirectCache:
+        return RedirectCache(
+            settings.QR_REDIRECT_CACHE_SIZE, settings.QR_REDIRECT_CACHE_TTL, settings.QR_REDIRECT_CACHE_MAX_STALENESS
+        )
+
+    @provide(scope=Scope.APP)
+    async def scan_journal(self, engine: AsyncEngine) -> AsyncIterable[ScanJournal]:
+        journal = ScanJournal(
+            engine,
+            Path(settings.QR_SCAN_JOURNAL_DIR),
+            settings.QR_SCAN_JOURNAL_SYNC_MS / 1000,
+            settings.QR_SCAN_APPLY_INTERVAL_MS / 1000,
+            settings.QR_SCAN_BATCH_SIZE,
+            settings.QR_SCAN_JOURNAL_SEGMENT_BYTES,
+            settings.QR_SCAN_JOURNAL_MAX_BACKLOG,
+            settings.QR_SCAN_JOURNAL_OVERFLOW,
+            settings.QR_SCAN_JOURNAL_BLOCK_TIMEOUT_MS / 1000,
+        )
+        await journal.start()
+        yield journal
+        await journal.close(SCAN_JOURNAL_CLOSE_TIMEOUT)
+
+    @provide(scope=Scope.APP)
+    async def scan_retention(self, engine: AsyncEngine) -> AsyncIterable[ScanRetention]:
+        retention = ScanRetention(
+            engine,
+            settings.QR_SCAN_RETENTION_INTERVAL_S,
+            settings.QR_SCAN_RETENTION_CHUNK,
+            settings.QR_SCAN_RETENTION_PAUSE_MS / 1000,
+        )
+        retention.start()
+        yield retention
+        await retention.close()
+
+    @provide(scope=Scope.APP)
+    def disk_cache(self) -> DiskImageCache:
+        directory = settings.QR_IMAGE_DISK_CACHE_DIR
+        return DiskImageCache(Path(directory) if directory else None, settings.QR_IMAGE_DISK_CACHE_MAX_BYTES)
+
+    @provide(scope=Scope.APP)
+    def render_pool(self) -> Iterable[RenderPool]:
+        pool = RenderPool(settings.QR_RENDER_WORKERS, settings.QR_RENDER_MAX_PENDING)
+        yield pool
+        pool.shutdown()
+
+    @provide(scope=Scope.APP)
+    async def image_warmer(self, renderer: ImageRenderer) -> AsyncIterable[ImageWarmer]:
+        warmer = ImageWarmer(renderer, asyncio.get_running_loop())
+        yield warmer
+        warmer.cancel_all()
@@ -0,0 +1,290 @@
+"""NumPy rasterizer for the module styles of QR_STYLES.
+
+Reproduces qrcode's StyledPilImage output pixel for pixel, without its per-module drawing and
+per-pixel colour mask loops: every distinct module tile (a square, a dot, or a rounded module for
+each combination of its four neighbours) is rendered once the way the library draws it, recoloured
+as an array, and the image is assembled by indexing the tiles with the module matrix.
+"""
+
+import functools
+import math
+from typing import Iterator
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from qr_code.matrix import QR_BORDER, QrMatrix
+
+RGB = tuple[int, int, int]
+
+# the drawers paint in black and the colour mask recolours afterwards; see qrcode.image.styledpil
+PAINT = (0, 0, 0)
+# same supersampling the library uses for antialiased shapes
+ANTIALIASING_FACTOR = 4
+# finder patterns are always drawn as plain squares (StyledPilImage's default eye drawer)
+EYE_SIZE = 7
+
+# tile indexes shared by all styles
+EMPTY, SQUARE = 0, 1
+# distance fields of larger images are computed band by band: caching print-size ones would pin far too much memory
+GRADIENT_CACHE_MAX_WIDTH = 1024
+
+
+def render_image(matrix: QrMatrix, style: str, box_size: int, fill: RGB, back: RGB) -> Image.Image:
+    """Solid fill as a palette image: one entry per distinct colour of the recoloured module tiles.
+
+    Square modules need two entries, the antialiased shapes a few dozen, so PNG stores them as
+    1..8-bit indexes instead of RGB triplets.
+    """
+    palette, bands = solid_bands(matrix, style, box_size, fill, back)
+    out = _assemble(bands, pixel_size(matrix, box_size))
+    if palette is None:
+        return Image.fromarray(out, "RGB")
+    return _palette_image(out, palette)
+
+
+def render_gradient_image(
+    matrix: QrMatrix, style: str, box_size: int, center: RGB, edge: RGB, back: RGB
+) -> Image.Image:
+    """Vectorized RadialGradiantColorMask: center colour in the middle fading to edge colour in the corners."""
+    bands = gradient_bands(matrix, style, box_size, center, edge, back)
+    return Image.fromarray(_assemble(bands, pixel_size(matrix, box_size)), "RGB")
+
+
+def solid_bands(
+    matrix: QrMatrix, style: str, box_size: int, fill: RGB, back: RGB
+) -> tuple[np.ndarray | None, Iterator[np.ndarray]]:
+    """Palette and the image as bands of pixel rows: the top border, one band per module row, the bottom border.
+
+    Bands hold palette indexes; in the unlikely case of more than 256 tile colours the palette is None
+    and bands are RGB.
+    """
+    tiles = _mask_solid(_tiles(style, box_size, back), back, fill)
+    index = tile_index(matrix.modules, style)
+    palette, tile_pixels = np.unique(tiles.reshape(-1, 3), axis=0, return_inverse=True)
+    if len(palette) > 256:
+        return None, _tile_bands(tiles, index, box_size)
+    return palette.astype(np.uint8), _tile_bands(
+        tile_pixels.reshape(tiles.shape[:-1]).astype(np.uint8), index, box_size
+    )
+
+
+def gradient_bands(
+    matrix: QrMatrix, style: str, box_size: int, center: RGB, edge: RGB, back: RGB
+) -> Iterator[np.ndarray]:
+    """RGB bands of pixel rows, split like solid_bands; each is computed on its own."""
+    size = matrix.size
+    width = pixel_size(matrix, box_size)
+    start = QR_BORDER * box_size
+    end = start + size * box_size
+    back_band = _filled((box_size, width), np.array(back, dtype=np.uint8))
+    border = _filled((start, width), np.array(back, dtype=np.uint8))
+    coverage = _coverage(_tiles(style, box_size, back), back)
+    yield border
+    if coverage is None:
+        for _ in range(size):
+            yield back_band
+        yield border
+        return
+    index = tile_index(matrix.modules, style)
+    center_arr = np.array(center, dtype=np.float64)
+    edge_arr = np.array(edge, dtype=np.float64)
+    back_arr = np.array(back, dtype=np.float64)
+    for row in range(size):
+        top = start + row * box_size
+        # the border keeps the background (zero coverage there)
+        norm = coverage[index[row]].swapaxes(0, 1).reshape(box_size, size * box_size)[..., None]
+        d = distance_band(width, top, top + box_size)[:, start:end, None]
+        fill = np.trunc(edge_arr * d + center_arr * (1 - d))
+        band = back_band.copy()
+        band[:, start:end] = _to_uint8(fill * norm + back_arr * (1 - norm))
+        yield band
+    yield border
+
+
+def to_palette(image: Image.Image) -> Image.Image | None:
+    """Exact palette version of an RGB image with at most 256 colours, None when it has more."""
+    colors = image.getcolors(maxcolors=256)
+    if colors is None:
+        return None
+    packed = np.sort(_pack(np.array([rgb for _, rgb in colors], dtype=np.uint8)))
+    indexes = np.searchsorted(packed, _pack(np.asarray(image))).astype(np.uint8)
+    palette = np.stack([packed >> 16, packed >> 8, packed], axis=-1) & 0xFF
+    return _palette_image(indexes, palette)
+
+
+def pixel_size(matrix: QrMatrix, box_size: int) -> int:
+    """Width (and height) of the image in pixels, border included."""
+    return (matrix.size + QR_BORDER * 2) * box_size
+
+
+def _tile_bands(tiles: np.ndarray, index: np.ndarray, box_size: int) -> Iterator[np.ndarray]:
+    size = len(index)
+    width = (size + QR_BORDER * 2) * box_size
+    start = QR_BORDER * box_size
+    end = start + size * box_size
+    back = tiles[EMPTY, 0, 0]
+    border = _filled((start, width), back)
+    yield border
+    for row in index:
+        band = _filled((box_size, width), back)
+        # (module, y, x[, channel]) → (y, module, x[, channel]) → pixel rows
+        band[:, start:end] = tiles[row].swapaxes(0, 1).reshape(box_size, size * box_size, *tiles.shape[3:])
+        yield band
+    yield border
+
+
+def distance_band(width: int, top: int, bottom: int) -> np.ndarray:
+    if width <= GRADIENT_CACHE_MAX_WIDTH:
+        return _cached_distance_field(width)[top:bottom]
+    return _compute_distance_field(width, top, bottom)
+
+
+@functools.lru_cache(maxsize=16)
+def _cached_distance_field(width: int) -> np.ndarray:
+    field = _compute_distance_field(width, 0, width)
+    field.flags.writeable = False
+    return field
+
+
+def _compute_distance_field(width: int, top: int, bottom: int) -> np.ndarray:
+    """Normalized distance of pixels to the image centre, 0 in the middle and 1 in the corners; rows top:bottom."""
+    offsets = np.arange(width, dtype=np.float64) - width / 2
+    squared = offsets**2
+    return np.sqrt(squared[top:bottom, None] + squared[None, :]) / (math.sqrt(2) * width / 2)
+
+
+def _filled(shape: tuple[int, int], value: np.ndarray) -> np.ndarray:
+    out = np.empty((*shape, *np.shape(value)), dtype=np.uint8)
+    out[...] = value
+    return out
+
+
+def _assemble(bands: Iterator[np.ndarray], pixel_size: int) -> np.ndarray:
+    out = None
+    top = 0
+    for band in bands:
+        if out is None:
+            out = np.empty((pixel_size, *band.shape[1:]), dtype=np.uint8)
+        bottom = top + len(band)
+        out[top:bottom] = band
+        top = bottom
+    assert out is not None
+    return out
+
+
+def _palette_image(indexes: np.ndarray, palette: np.ndarray) -> Image.Image:
+    image = Image.fromarray(indexes, "L")
+    image.putpalette(palette.astype(np.uint8).tobytes())  # turns the L image into P
+    return image
+
+
+def _pack(rgb: np.ndarray) -> np.ndarray:
+    rgb = rgb.astype(np.uint32)
+    return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+
+def _eyes(size: int) -> np.ndarray:
+    eyes = np.zeros((size, size), dtype=bool)
+    eyes[:EYE_SIZE, :EYE_SIZE] = True
+    eyes[:EYE_SIZE, -EYE_SIZE:] = True
+    eyes[-EYE_SIZE:, :EYE_SIZE] = True
+    return eyes
+
+
+def tile_index(modules: np.ndarray, style: str) -> np.ndarray:
+    """Tile of every module: EMPTY, SQUARE (also every finder module), the dot, or one of 16 rounded shapes."""
+    eyes = _eyes(len(modules))
+    if style == "square":
+        return np.where(modules, SQUARE, EMPTY)
+    if style == "dots":
+        index = np.where(modules, 2, EMPTY)
+    else:  # rounded: one tile per combination of the N/E/S/W neighbours
+        padded = np.pad(modules, 1)
+        north, south = padded[:-2, 1:-1], padded[2:, 1:-1]
+        west, east = padded[1:-1, :-2], padded[1:-1, 2:]
+        neighbours = north * 1 + east * 2 + south * 4 + west * 8
+        index = np.where(modules, 2 + neighbours, EMPTY)
+    index[eyes & modules] = SQUARE
+    return index
+
+
+@functools.lru_cache(maxsize=64)
+def _tiles(style: str, box_size: int, back: RGB) -> np.ndarray:
+    """Module tiles as the library drawers paint them onto a `back` canvas, before recolouring."""
+    empty = Image.new("RGB", (box_size, box_size), back)
+    square = Image.new("RGB", (box_size, box_size), PAINT)
+    if style == "square":
+        shapes = []
+    elif style == "dots":
+        shapes = [_circle(box_size, back)]
+    else:
+        shapes = [_rounded(box_size, back, neighbours) for neighbours in range(16)]
+    tiles = np.stack([np.asarray(tile) for tile in (empty, square, *shapes)])
+    tiles.flags.writeable = False
+    return tiles
+
+
+def _circle(box_size: int, back: RGB) -> Image.Image:
+    fake_size = box_size * ANTIALIASING_FACTOR
+    circle = Image.new("RGB", (fake_size, fake_size), back)
+    ImageDraw.Draw(circle).ellipse((0, 0, fake_size, fake_size), fill=PAINT)
+    return circle.resize((box_size, box_size), Image.Resampling.LANCZOS)
+
+
+def _rounded(box_size: int, back: RGB, neighbours: int) -> Image.Image:
+    north, east, south, west = (bool(neighbours & bit) for bit in (1, 2, 4, 8))
+    corner = _rounded_corner(box_size, back)
+    square = Image.new("RGB", corner.size, PAINT)
+    nw = corner if not west and not north else square
+    ne = corner.transpose(Image.Transpose.FLIP_LEFT_RIGHT) if not north and not east else square
+    se = corner.transpose(Image.Transpose.ROTATE_180) if not east and not south else square
+    sw = corner.transpose(Image.Transpose.FLIP_TOP_BOTTOM) if not south and not west else square
+    width = corner.size[0]
+    # with an odd box size the last row and column stay background, as in the library
+    tile = Image.new("RGB", (box_size, box_size), back)
+    tile.paste(nw, (0, 0))
+    tile.paste(ne, (width, 0))
+    tile.paste(se, (width, width))
+    tile.paste(sw, (0, width))
+    return tile
+
+
+def _rounded_corner(box_size: int, back: RGB) -> Image.Image:
+    width = int(box_size / 2)
+    fake_width = width * ANTIALIASING_FACTOR
+    base = Image.new("RGB", (fake_width, fake_width), back)
+    ImageDraw.Draw(base).ellipse((0, 0, fake_width * 2, fake_width * 2), fill=PAINT)
+    return base.resize((width, width), Image.Resampling.LANCZOS)
+
+
+def _mask_solid(pixels: np.ndarray, back: RGB, fill: RGB) -> np.ndarray:
+    """Vectorized SolidFillColorMask.apply_mask, same float arithmetic and truncation."""
+    if back == (255, 255, 255) and fill == PAINT:
+        return pixels
+    norm = _coverage(pixels, back)
+    if norm is None:
+        # every background channel is 0, so paint and background can't be told apart
+        out = np.empty_like(pixels)
+        out[...] = back
+        return out
+    fill_arr = np.array(fill, dtype=np.float64)
+    back_arr = np.array(back, dtype=np.float64)
+    norm = norm[..., None]
+    return _to_uint8(fill_arr * norm + back_arr * (1 - norm))
+
+
+def _to_uint8(values: np.ndarray) -> np.ndarray:
+    # int() truncation, then putpixel's clamping: lanczos overshoot can push values past 0..255
+    return np.clip(np.trunc(values), 0, 255).astype(np.uint8)
+
+
+def _coverage(pixels: np.ndarray, back: RGB) -> np.ndarray | None:
+    """How much paint each pixel holds (QRColorMask.extrap_color), averaged over informative channels."""
+    channels = [c for c in range(3) if back[c] != PAINT[c]]
+    if not channels:
+        return None
+    total = np.zeros(pixels.shape[:-1], dtype=np.float64)
+    for c in channels:
+        total = total + (pixels[..., c].astype(np.float64) - back[c]) / (PAINT[c] - back[c])
+    return total / len(channels)
@@ -0,0 +1,127 @@
+"""Per-worker cache of redirect targets: a scan of a cached code does not read the code from the database.
+
+Entries are dropped ``ttl`` seconds after they were read, least recently used first beyond ``max_entries``. An
+edit or delete evicts its code here right away and logs a QrCodeChange in the same transaction, which is how
+the other workers hear of it: each one reads the new changes every half ``max_staleness`` (from whichever
+redirect finds the sync due) and evicts what they name. While its syncs are not getting through, a worker stops
+trusting entries older than ``max_staleness``, so a changed link is never served for longer than that bound,
+whatever the number of workers.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Sequence
+from uuid import UUID
+
+from qr_code.models import QrCodeChange, RedirectTarget
+
+logger = logging.getLogger(__name__)
+
+type RedirectKey = UUID | str  # code id or short url slug
+
+
+class RedirectCache:
+    def __init__(self, max_entries: int, ttl: float, max_staleness: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_staleness = max_staleness
+        # key -> target and the monotonic time its read from the database began
+        self._entries: OrderedDict[RedirectKey, tuple[RedirectTarget, float]] = OrderedDict()
+        self._keys: dict[UUID, set[RedirectKey]] = {}
+        self._invalidated_at: dict[UUID, float] = {}
+        self._seen_changes: dict[UUID, int] = {}  # change id -> ts, within the current sync lookback
+        self._synced_at: float | None = None  # monotonic start of the last successful sync
+        self._synced_ts: int | None = None  # the same moment in wall-clock milliseconds
+        self._syncing = False
+        self.hits = 0
+        self.misses = 0
+        self.syncs = 0
+        self.sync_failures = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: RedirectKey) -> RedirectTarget | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            target, read_at = entry
+            age = time.monotonic() - read_at
+            if age <= self.ttl and (age <= self.max_staleness or self.in_sync()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return target
+            self._drop(key)
+        self.misses += 1
+        return None
+
+    def put(self, key: RedirectKey, target: RedirectTarget, read_at: float) -> None:
+        """Cache what a database read that began at `read_at` (time.monotonic()) returned."""
+        invalidated_at = self._invalidated_at.get(target.qr_code_id)
+        if invalidated_at is not None and invalidated_at >= read_at:
+            return  # changed while it was being read: the read may have seen either version
+        self._entries[key] = (target, read_at)
+        self._entries.move_to_end(key)
+        self._keys.setdefault(target.qr_code_id, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def invalidate(self, qr_code_id: UUID) -> None:
+        self._invalidated_at[qr_code_id] = time.monotonic()
+        for key in self._keys.pop(qr_code_id, ()):
+            del self._entries[key]
+
+    def in_sync(self) -> bool:
+        return self._synced_at is not None and time.monotonic() - self._synced_at <= self.max_staleness
+
+    def sync_due(self) -> bool:
+        if self._syncing:
+            return False
+        # half the bound: a sync that is late or slow still lands inside it
+        return self._synced_at is None or time.monotonic() - self._synced_at >= self.max_staleness / 2
+
+    async def sync(self, get_changes: Callable[[int], Awaitable[Sequence[QrCodeChange]]]) -> bool:
+        """Evict the codes changed through any worker; `get_changes(since_ts)` lists the changes logged since.
+
+        False when the changes could not be read: the cache may then hold changed codes still.
+        """
+        started, now_ts = time.monotonic(), time.time_ns() // 1_000_000
+        # changes are read again for one bound back: transactions that committed late, workers whose clock is behind
+        lookback = int(self.max_staleness * 1000)
+        since_ts = (now_ts if self._synced_ts is None else self._synced_ts) - lookback
+        self._syncing = True
+        try:
+            changes = await get_changes(since_ts)
+        except Exception:
+            self.sync_failures += 1
+            logger.exception("reading the qr code changes failed")
+            return False
+        finally:
+            self._syncing = False
+        for change in changes:
+            if change.id not in self._seen_changes:
+                self._seen_changes[change.id] = change.ts
+                self.invalidate(change.qr_code_id)
+        self._seen_changes = {id_: ts for id_, ts in self._seen_changes.items() if ts >= since_ts}
+        # entries read before an invalidation this old have expired anyway
+        self._invalidated_at = {id_: at for id_, at in self._invalidated_at.items() if at >= started - self.ttl}
+        self._synced_at, self._synced_ts = started, now_ts
+        self.syncs += 1
+        return True
+
+    def metrics(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "syncs": self.syncs,
+            "sync_failures": self.sync_failures,
+            "in_sync": self.in_sync(),
+        }
+
+    def _drop(self, key: RedirectKey) -> None:
+        target, _ = self._entries.pop(key)
+        keys = self._keys[target.qr_code_id]
+        keys.discard(key)
+        if not keys:
+            del self._keys[target.qr_code_id]
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from qr_code.errors import RenderPoolBusyError
+from qr_code.models import QrRender, render_qr_bytes
+
+logger = logging.getLogger(__name__)
+
+
+class RenderPool:
+    """Renders images in worker processes, so rasterization and encoding never block the event loop.
+
+    At most `max_pending` renders may be queued or running at once; past that render() fails fast
+    with RenderPoolBusyError (503) instead of letting every waiting request time out.
+    With `workers=0` renders run in a thread instead (handy for development).
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rendered = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._executor: ProcessPoolExecutor | None = None
+
+    def acquire(self) -> None:
+        """Takes a slot for a render done outside the pool (a streamed PNG) until release()."""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            logger.warning("render pool saturated: %d renders pending", self.pending)
+            raise RenderPoolBusyError
+        self.pending += 1
+
+    def release(self) -> None:
+        self.pending -= 1
+
+    async def render(self, render: QrRender) -> bytes:
+        self.acquire()
+        started = time.perf_counter()
+        try:
+            if self.workers == 0:
+                return await asyncio.to_thread(render_qr_bytes, render)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), render_qr_bytes, render)
+        finally:
+            self.release()
+            elapsed = time.perf_counter() - started
+            self.rendered += 1
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+
+    def metrics(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "queued": max(0, self.pending - self.workers),
+            "rendered": self.rendered,
+            "rejected": self.rejected,
+            "avg_ms": round(self.total_seconds / self.rendered * 1000, 2) if self.rendered else 0.0,
+            "max_ms": round(self.max_seconds * 1000, 2),
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # started on first use, so processes that never render don't pay for the workers;
+        # spawn, not fork: a forked child would inherit the event loop and aiosqlite threads
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+from pathlib import Path
+from typing import AsyncIterator, Generator
+from uuid import UUID
+
+from starlette.concurrency import iterate_in_threadpool
+
+from core.settings import settings
+from qr_code.disk_cache import DiskImageCache
+from qr_code.errors import RenderPoolBusyError
+from qr_code.image_cache import RenderedImageCache
+from qr_code.models import COMPRESSED_FORMATS, QrCode, QrRender, compress_image
+from qr_code.png_stream import iter_png, may_stream, should_stream
+from qr_code.render_pool import RenderPool
+
+logger = logging.getLogger(__name__)
+
+
+class ImageRenderer:
+    """Cache-aware front of the render pool: memory cache, then disk cache, then a fresh render.
+
+    Renders are single-flight: concurrent requests for an image that is already being rendered
+    (a code shared in a group chat, link-preview bots) wait for that render instead of starting their own.
+    Formats in COMPRESSED_FORMATS are gzipped once per render and cached in both encodings.
+    Print-size PNGs are not rendered in one piece but streamed (see png_stream), each holding a render pool
+    slot until it is done.
+    """
+
+    def __init__(self, image_cache: RenderedImageCache, disk_cache: DiskImageCache, render_pool: RenderPool):
+        self.image_cache = image_cache
+        self.disk_cache = disk_cache
+        self.render_pool = render_pool
+        self.renders = 0
+        self.coalesced = 0
+        self.streamed = 0
+        self._in_flight: dict[tuple[UUID, QrRender], asyncio.Task[dict[str, bytes]]] = {}
+
+    async def get(
+        self, qr_code_id: UUID, render: QrRender, encoding: str = "identity"
+    ) -> bytes | Path | AsyncIterator[bytes]:
+        """Encoded image, the path of its copy in the disk cache (served without reading it here),
+        or for print-size PNGs an iterator of its chunks."""
+        content = self.image_cache.get(qr_code_id, render, encoding)
+        if content is not None:
+            return content
+        path = self.disk_cache.get(render, encoding)
+        if path is not None:
+            return path
+        # the matrix of a long link takes a while to build: not on the event loop, and only for box sizes
+        # where the largest codes would be streamed
+        if encoding == "identity" and may_stream(render) and await asyncio.to_thread(should_stream, render):
+            stream = self._stream(render)
+            await anext(stream)  # takes the slot, or fails with RenderPoolBusyError, before a response starts
+            return stream
+        return await self.render(qr_code_id, render, encoding)
+
+    async def render(self, qr_code_id: UUID, render: QrRender, encoding: str = "identity") -> bytes:
+        key = (qr_code_id, render)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._render(qr_code_id, render))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.renders += 1
+        else:
+            self.coalesced += 1
+        # shielded: one waiter disconnecting must not cancel the render for the others
+        variants = await asyncio.shield(task)
+        return variants[encoding]
+
+    def metrics(self) -> dict:
+        return {
+            "renders": self.renders,
+            "coalesced": self.coalesced,
+            "streamed": self.streamed,
+            "in_flight": len(self._in_flight),
+        }
+
+    async def _render(self, qr_code_id: UUID, render: QrRender) -> dict[str, bytes]:
+        content = await self.render_pool.render(render)
+        variants = {"identity": content}
+        if render.fmt in COMPRESSED_FORMATS:
+            variants["gzip"] = await asyncio.to_thread(compress_image, content)
+        for encoding, variant in variants.items():
+            self.image_cache.put(qr_code_id, render, variant, encoding)
+            if self.disk_cache.enabled:
+                await asyncio.to_thread(self.disk_cache.put, render, variant, encoding)
+        return variants
+
+    async def _stream(self, render: QrRender) -> AsyncIterator[bytes]:
+        self.render_pool.acquire()
+        self.streamed += 1
+        chunks = self._png_chunks(render)
+        try:
+            yield b""  # started: however the stream ends from here on, the slot is released
+            async for chunk in iterate_in_threadpool(chunks):
+                yield chunk
+        finally:
+            chunks.close()
+            self.render_pool.release()
+
+    def _png_chunks(self, render: QrRender) -> Generator[bytes, None, None]:
+        # too big for the memory cache anyway; the disk copy is written along the way and dropped if cut short
+        if not self.disk_cache.enabled:
+            yield from iter_png(render)
+            return
+        with self.disk_cache.writer(render) as file:
+            for chunk in iter_png(render):
+                file.write(chunk)
+                yield chunk
+
+    def invalidate(self, qr_code_id: UUID) -> None:
+        # the disk cache is content-addressed: old files are simply never asked for again
+        self.image_cache.invalidate(qr_code_id)
+
+    def _finish(self, key: tuple[UUID, QrRender], task: asyncio.Task) -> None:
+        del self._in_flight[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here too, in case every waiter has gone away
+
+
+class ImageWarmer:
+    """Pre-renders the images a freshly saved code is asked for first (list thumbnails, preview, bot, download).
+
+    One pending job per code: scheduling the same images again is a no-op, and a newer edit
+    cancels the job for the previous parameters.
+    """
+
+    # the dashboard's modal image (webp in browsers that take it), the bot's png and the svg download;
+    # the list's webp thumbnails of every size come first, the list is what a save goes back to
+    WARM_FORMATS = (("webp", 10), ("png", 10), ("svg", 10))
+
+    def __init__(self, renderer: ImageRenderer, loop: asyncio.AbstractEventLoop):
+        self.renderer = renderer
+        self._loop = loop  # the warm-ups run on it, whichever thread schedules them
+        self._jobs: dict[UUID, tuple[tuple[QrRender, ...], asyncio.Task]] = {}
+
+    @property
+    def pending(self) -> int:
+        return len(self._jobs)
+
+    def schedule(self, qr_code: QrCode) -> None:
+        """Callable from any thread: BackgroundTasks runs it in its threadpool once the response is sent."""
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._start(qr_code)
+        else:
+            self._loop.call_soon_threadsafe(self._start, qr_code)
+
+    def _start(self, qr_code: QrCode) -> None:
+        renders = tuple(qr_code.render_params("webp", pixels=pixels) for pixels in settings.QR_THUMBNAIL_SIZES.values())
+        renders += tuple(qr_code.render_params(fmt, box_size) for fmt, box_size in self.WARM_FORMATS)
+        job = self._jobs.get(qr_code.id)
+        if job is not None:
+            if job[0] == renders:
+                return
+            job[1].cancel()  # superseded by the newer edit
+        task = asyncio.create_task(self._warm(qr_code.id, renders))
+        self._jobs[qr_code.id] = (renders, task)
+        task.add_done_callback(lambda done: self._forget(qr_code.id, done))
+
+    def cancel(self, qr_code_id: UUID) -> None:
+        job = self._jobs.pop(qr_code_id, None)
+        if job is not None:
+            job[1].cancel()
+
+    def cancel_all(self) -> None:
+        for qr_code_id in list(self._jobs):
+            self.cancel(qr_code_id)
+
+    async def _warm(self, qr_code_id: UUID, renders: tuple[QrRender, ...]) -> None:
+        for render in renders:
+            # presence checks only: a warm-up is not a request, so it must not count as a hit or refresh an entry
+            if self.renderer.image_cache.contains(qr_code_id, render) or self.renderer.disk_cache.contains(render):
+                continue
+            try:
+                await self.renderer.render(qr_code_id, render)
+            except RenderPoolBusyError:
+                # real requests come first; the image is rendered on demand instead
+                logger.info("skipping image warm-up for %s: render pool busy", qr_code_id)
+                return
+            except Exception:
+                logger.exception("image warm-up for %s failed", qr_code_id)
+                return
+
+    def _forget(self, qr_code_id: UUID, task: asyncio.Task) -> None:
+        job = self._jobs.get(qr_code_id)
+        if job is not None and job[1] is task:
+            del self._jobs[qr_code_id]
@@ -1,23 +1,39 @@
-import io
+import dataclasses
+from pathlib import Path
 from typing import Annotated, Literal
 from uuid import UUID
 
 from dishka.integrations.fastapi import DishkaRoute, FromDishka
-from fastapi import APIRouter, Depends, Query, Request
-from fastapi.responses import RedirectResponse, Response
+from fastapi import APIRouter, BackgroundTasks, Depends, Query, Request
+from fastapi.responses import FileResponse, RedirectResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field, model_validator
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
 from auth.dependencies import logged_in_user_id
 from core.dependencies import auto_commit
-from qr_code.models import QrCode, contrast_ratio, render_qr_image
+from core.settings import settings
+from qr_code.export import stream_zip
+from qr_code.image_cache import RenderedImageCache
+from qr_code.models import COMPRESSED_FORMATS, IMAGE_MEDIA_TYPES, QrCode, contrast_ratio
+from qr_code.preview import render_preview
+from qr_code.redirect_cache import RedirectCache
+from qr_code.render_pool import RenderPool
+from qr_code.rendering import ImageRenderer, ImageWarmer
+from qr_code.scan_journal import ScanJournal
+from qr_code.scan_retention import ScanRetention
 from qr_code.services import QrCodeService
 
 router = APIRouter(route_class=DishkaRoute)
+# not proxied by the frontend nginx, so only reachable from inside the docker network
+metrics_router = APIRouter(route_class=DishkaRoute)
+# /r/{slug}: the short public url encoded in new codes
+short_router = APIRouter(route_class=DishkaRoute)
 
-# QR content never changes for a given id, so browsers may cache the rendered image
-IMAGE_CACHE_HEADERS = {"Cache-Control": "public, max-age=86400"}
+# image urls carrying the code's current image version (`v`, see QrRender.version) never change content;
+# other urls (bot, shared links, outdated versions) are revalidated every time, which the ETag turns into a cheap 304
+VERSIONED_IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+IMAGE_CACHE_CONTROL = "public, no-cache"
 
 
 # link-preview fetchers of messengers/social networks; their hits are not real visits
@@ -44,6 +60,8 @@ class QrStylePayload(BaseModel):
     fill_color2: str | None = Field(None, pattern=HEX_COLOR)  # radial-gradient edge; solid when omitted
     back_color: str = Field("#ffffff", pattern=HEX_COLOR)
     style: Literal["square", "rounded", "dots"] = "square"
+    # omitted: "auto" for a new code, unchanged on edit
+    error_correction: Literal["auto", "L", "M", "Q", "H"] | None = None
 
     @model_validator(mode="after")
     def check_contrast(self) -> "QrStylePayload":
@@ -53,66 +71,191 @@ class QrStylePayload(BaseModel):
         return self
 
 
+class QrPreviewQuery(QrStylePayload):
+    scale: int = Field(settings.QR_PREVIEW_SCALE, ge=2, le=10)
+
+
 # body, not query: user links must not end up in access logs
 class QrCodePayload(QrStylePayload):
     name: str = Field(min_length=1, max_length=100)
     link: str = Field(min_length=1, max_length=2048, pattern=r"^https?://")
 
 
+def counts_as_scan(request: Request) -> bool:
+    # HEAD requests and link-preview bots would inflate the stats without being real visits
+    user_agent = request.headers.get("user-agent", "").lower()
+    return request.method != "HEAD" and not any(marker in user_agent for marker in PREVIEW_BOT_UA_MARKERS)
+
+
+def image_urls(qr_code: QrCode) -> dict[str, str]:
+    """Versioned thumbnail urls of a code, one per size plus a ready-made `srcset` of all of them."""
+    path = settings.QR_CODE_ENDPOINT.format(uuid=qr_code.id) + "/image"
+    version = qr_code.render_params().version
+    urls: dict[str, str] = {size: f"{path}?size={size}&v={version}" for size in settings.QR_THUMBNAIL_SIZES}
+    urls["srcset"] = ", ".join(f"{urls[size]} {width}w" for size, width in settings.QR_THUMBNAIL_SIZES.items())
+    return urls
+
+
+def qr_code_body(qr_code: QrCode) -> dict:
+    # image_version: the `v` under which the code's image urls are served as immutable
+    return {**dataclasses.asdict(qr_code), "image_version": qr_code.render_params().version}
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def header_qualities(header: str | None) -> dict[str, float]:
+    """Tokens of an Accept/Accept-Encoding header with their q-values (1 when omitted)."""
+    qualities = {}
+    for item in (header or "").split(","):
+        token, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name.lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if token.strip():
+            qualities[token.strip().lower()] = quality
+    return qualities
+
+
+def accepts_gzip(accept_encoding: str | None) -> bool:
+    qualities = header_qualities(accept_encoding)
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+
+def negotiate_image_format(accept: str | None) -> str:
+    # only an explicit image/webp counts: */* also comes from clients that can only show png
+    return "webp" if header_qualities(accept).get("image/webp", 0.0) > 0 else "png"
+
+
 @router.get("/{qr_code_id}/image")
 async def read_item(
     qr_code_id: UUID,
+    request: Request,
     qr_code_service: FromDishka[QrCodeService],
-    fmt: Literal["png", "svg"] = "png",
+    fmt: Literal["png", "svg", "webp"] | None = None,  # negotiated from Accept when omitted
     scale: int = Query(10, ge=4, le=40),
+    size: Literal["thumb", "sm", "md"] | None = None,  # fixed-width thumbnail instead of `scale`; not for svg
+    v: str | None = None,  # image version; when current, the response is cached as immutable
 ):
-    if fmt == "svg":
-        svg = await qr_code_service.get_svg_by_qr_code_id(qr_code_id)
-        return Response(content=svg, media_type="image/svg+xml", headers=IMAGE_CACHE_HEADERS)
-    image = await qr_code_service.get_image_by_qr_code_id(qr_code_id, box_size=scale)
-    image_io = io.BytesIO()
-    image.save(image_io, format='PNG')
-    image_bytes = image_io.getvalue()
-    return Response(content=image_bytes, media_type="image/png", headers=IMAGE_CACHE_HEADERS)
+    negotiated = fmt is None
+    image_fmt: str = negotiate_image_format(request.headers.get("accept")) if fmt is None else fmt
+    pixels = None if size is None else settings.QR_THUMBNAIL_SIZES[size]
+    render = await qr_code_service.get_render_params(qr_code_id, image_fmt, box_size=scale, pixels=pixels)
+    encoding = "identity"
+    if image_fmt in COMPRESSED_FORMATS and accepts_gzip(request.headers.get("accept-encoding")):
+        encoding = "gzip"
+    etag = render.etag_for(encoding)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": VERSIONED_IMAGE_CACHE_CONTROL if v == render.version else IMAGE_CACHE_CONTROL,
+    }
+    vary = []
+    if negotiated:
+        vary.append("Accept")
+    if image_fmt in COMPRESSED_FORMATS:
+        vary.append("Accept-Encoding")
+    if vary:
+        headers["Vary"] = ", ".join(vary)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    content = await qr_code_service.get_image(qr_code_id, render, encoding)
+    if isinstance(content, Path) and not content.exists():
+        # pruned by a janitor since the lookup: FileResponse (or nginx) would not find it, render it again
+        content = await qr_code_service.get_image(qr_code_id, render, encoding)
+    media_type = IMAGE_MEDIA_TYPES[image_fmt]
+    if isinstance(content, Path):
+        # set by the frontend nginx, which then streams the file itself; direct callers (the bot) get the file
+        accel_prefix = request.headers.get("x-accel-prefix")
+        if accel_prefix is not None:
+            # always the plain file: nginx's gzip_static swaps in the .gz copy next to it
+            plain = content.with_suffix("") if encoding == "gzip" else content
+            uri = qr_code_service.image_renderer.disk_cache.accel_redirect_uri(plain, accel_prefix)
+            return Response(media_type=media_type, headers={**headers, "X-Accel-Redirect": uri})
+        if encoding == "gzip":
+            headers["Content-Encoding"] = "gzip"
+        return FileResponse(content, media_type=media_type, headers=headers)
+    if not isinstance(content, bytes):
+        # print-size png encoded (in the threadpool) while it is sent
+        return StreamingResponse(content, media_type=media_type, headers=headers)
+    if encoding == "gzip":
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=content, media_type=media_type, headers=headers)
 
 
 @router.get("/style/preview")
 async def style_preview(
-    style: Annotated[QrStylePayload, Query()],
+    style: Annotated[QrPreviewQuery, Query()],
     _user_id: UUID = Depends(logged_in_user_id),
 ):
-    # live preview for the editor: renders a sample payload with the requested style
-    image = render_qr_image(
-        "https://example.com/preview", style.fill_color, style.fill_color2, style.back_color, style.style
+    # live preview for the editor: the sample payload recoloured from prepared layers, cheap enough for the loop
+    content = render_preview(
+        style.fill_color,
+        style.fill_color2,
+        style.back_color,
+        style.style,
+        style.error_correction or "auto",
+        style.scale,
+    )
+    return Response(content=content, media_type="image/png")
+
+
+@router.get("/export.zip")
+async def export_zip(
+    qr_code_service: FromDishka[QrCodeService],
+    fmt: Literal["png", "svg"] = "png",
+    scale: int = Query(10, ge=4, le=40),
+    user_id: UUID = Depends(logged_in_user_id),
+):
+    # codes are listed now, while the request session is open; the archive is rendered while it streams
+    entries = await qr_code_service.get_export_entries(user_id, fmt, box_size=scale)
+    return StreamingResponse(
+        stream_zip(qr_code_service.image_renderer, entries, settings.QR_EXPORT_CONCURRENCY),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="qr_codes.zip"'},
     )
-    image_io = io.BytesIO()
-    image.save(image_io, format='PNG')
-    return Response(content=image_io.getvalue(), media_type="image/png")
 
 
 @router.get("/")
 async def get_all_user_qr_codes(qr_code_service: FromDishka[QrCodeService], user_id: UUID = Depends(logged_in_user_id)):
-    return await qr_code_service.get_all_user_qr_codes(user_id)
+    qr_codes = await qr_code_service.get_all_user_qr_codes(user_id)
+    return [{**qr_code_body(qr_code), "images": image_urls(qr_code)} for qr_code in qr_codes]
 
 
 @router.post("/")
 async def create_qr_code(
     qr_code_service: FromDishka[QrCodeService],
+    image_warmer: FromDishka[ImageWarmer],
     payload: QrCodePayload,
+    background_tasks: BackgroundTasks,
     user_id: UUID = Depends(logged_in_user_id),
     _session: AsyncSession = Depends(auto_commit),
 ):
-    return await qr_code_service.create_qr_code(user_id, **payload.model_dump())
+    qr_code = await qr_code_service.create_qr_code(user_id, **payload.model_dump())
+    # background tasks run once the response is out, i.e. after auto_commit
+    background_tasks.add_task(image_warmer.schedule, qr_code)
+    return qr_code_body(qr_code)
 
 
 @router.delete("/{qr_code_id}")
 async def delete_qr_code(
     qr_code_service: FromDishka[QrCodeService],
+    image_warmer: FromDishka[ImageWarmer],
     qr_code_id: UUID,
     user_id: UUID = Depends(logged_in_user_id),
     _session: AsyncSession = Depends(auto_commit),
 ):
     await qr_code_service.delete_qr_code(user_id, qr_code_id)
+    image_warmer.cancel(qr_code_id)
     return {"ok": True}
 
 
@@ -131,23 +274,57 @@ async def redirect(
     qr_code_id: UUID,
     request: Request,
     qr_code_service: FromDishka[QrCodeService],
-    _session: AsyncSession = Depends(auto_commit),
 ) -> RedirectResponse:
-    # HEAD requests and link-preview bots would inflate the stats without being real visits
-    user_agent = request.headers.get("user-agent", "").lower()
-    if request.method == "HEAD" or any(marker in user_agent for marker in PREVIEW_BOT_UA_MARKERS):
-        qr_code = await qr_code_service.get_by_id(qr_code_id)
+    # no auto_commit: a scan is only queued here, the database writes happen in batches in the background
+    if counts_as_scan(request):
+        target = await qr_code_service.register_scan(qr_code_id)
+    else:
+        target = await qr_code_service.get_redirect(qr_code_id)
+    return RedirectResponse(url=target.link, status_code=status.HTTP_302_FOUND)
+
+
+@short_router.api_route("/{slug}", methods=["GET", "HEAD"])
+async def short_redirect(
+    slug: str,
+    request: Request,
+    qr_code_service: FromDishka[QrCodeService],
+) -> RedirectResponse:
+    if counts_as_scan(request):
+        target = await qr_code_service.register_slug_scan(slug)
     else:
-        qr_code = await qr_code_service.register_scan(qr_code_id)
-    return RedirectResponse(url=qr_code.link, status_code=status.HTTP_302_FOUND)
+        target = await qr_code_service.get_slug_redirect(slug)
+    return RedirectResponse(url=target.link, status_code=status.HTTP_302_FOUND)
 
 
 @router.put("/{qr_code_id}")
 async def edit(
     qr_code_service: FromDishka[QrCodeService],
+    image_warmer: FromDishka[ImageWarmer],
     qr_code_id: UUID,
     payload: QrCodePayload,
+    background_tasks: BackgroundTasks,
     user_id: UUID = Depends(logged_in_user_id),
     _session: AsyncSession = Depends(auto_commit),
-) -> QrCode:
-    return await qr_code_service.update_qr_code(user_id, qr_code_id, **payload.model_dump())
+) -> dict:
+    qr_code = await qr_code_service.update_qr_code(user_id, qr_code_id, **payload.model_dump())
+    background_tasks.add_task(image_warmer.schedule, qr_code)
+    return qr_code_body(qr_code)
+
+
+@metrics_router.get("/qr_code")
+async def qr_code_metrics(
+    render_pool: FromDishka[RenderPool],
+    image_cache: FromDishka[RenderedImageCache],
+    image_renderer: FromDishka[ImageRenderer],
+    redirect_cache: FromDishka[RedirectCache],
+    scan_journal: FromDishka[ScanJournal],
+    scan_retention: FromDishka[ScanRetention],
+):
+    return {
+        "render_pool": render_pool.metrics(),
+        "image_cache": image_cache.metrics(),
+        "renderer": image_renderer.metrics(),
+        "redirect_cache": redirect_cache.metrics(),
+        "scan_journal": scan_journal.metrics(),
+        "scan_retention": scan_retention.metrics(),
+    }
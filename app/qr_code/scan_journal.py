@@ -0,0 +1,421 @@
+"""Durable scan journal.
+
+Scans used to be added up in memory and written to the database in the background, and a worker that crashed
+took its unwritten scans with it. A redirect now appends a packed record (code id, ts, crc32) to this worker's
+journal file and answers once the record is on disk: whatever arrives within ``sync_interval`` is written and
+fsynced together, one group commit. A background applier reads the journal from its checkpoint and writes up to
+``batch_size`` records per transaction. That transaction holds the scan_event rows, the qr_code counters and the
+segment's new checkpoint offset, so a batch is applied exactly once wherever a crash hits.
+
+The journal is split into segment files of about ``segment_bytes``. An applied segment that is no longer written to
+is deleted. Each segment is held under an exclusive flock by the worker writing or replaying it. On start, a worker
+claims the segments no running worker holds (those of a stopped or crashed one) and replays them from their
+checkpoint. A record torn by the crash fails its crc and ends that replay.
+
+The journal is bounded: once ``max_backlog`` scans are journaled and not applied (the database is down or too
+slow), the ``overflow`` policy applies. ``block`` makes the redirect wait until the applier has made room, ``drop``
+answers it right away and only counts the scan as dropped.
+
+Readers that report counts take ``consistent_read()`` around their database read and add ``pending()`` on top,
+the scans this worker journaled that are not applied yet: a batch commits either before or after such a read.
+"""
+
+import asyncio
+import fcntl
+import logging
+import os
+import struct
+import time
+import uuid
+import zlib
+from contextlib import asynccontextmanager, suppress
+from pathlib import Path
+from typing import AsyncIterator, Literal
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from qr_code.dal import QrCodeCrud, ScanEventCrud, ScanJournalCheckpointCrud
+from qr_code.models import QrCode
+
+logger = logging.getLogger(__name__)
+
+# code id, scan ts, crc32 of the two
+RECORD = struct.Struct("<16sqI")
+RECORD_BODY = struct.Struct("<16sq")
+SEGMENT_SUFFIX = ".journal"
+
+type OverflowPolicy = Literal["block", "drop"]
+
+
+def pack_record(qr_code_id: UUID, ts: int) -> bytes:
+    body = RECORD_BODY.pack(qr_code_id.bytes, ts)
+    return body + zlib.crc32(body).to_bytes(4, "little")
+
+
+def unpack_records(data: bytes) -> list[tuple[UUID, int]]:
+    """The records at the start of `data`, up to the first torn or corrupt one."""
+    records = []
+    for offset in range(0, len(data) - RECORD.size + 1, RECORD.size):
+        id_bytes, ts, crc = RECORD.unpack_from(data, offset)
+        if zlib.crc32(RECORD_BODY.pack(id_bytes, ts)) != crc:
+            break
+        records.append((UUID(bytes=id_bytes), ts))
+    return records
+
+
+class _Segment:
+    def __init__(self, path: Path, fd: int, own: bool, applied: int = 0, end: int = 0, checkpointed: bool = False):
+        self.path = path
+        self.fd = fd
+        self.own = own  # written by this worker: its unapplied scans are in pending()
+        self.applied = applied
+        self.end = end  # bytes on disk
+        self.checkpointed = checkpointed  # has a checkpoint row
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+
+class ScanJournal:
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        directory: Path,
+        sync_interval: float,
+        apply_interval: float,
+        batch_size: int,
+        segment_bytes: int = 16 * 1024 * 1024,
+        max_backlog: int = 100_000,
+        overflow: OverflowPolicy = "block",
+        block_timeout: float = 1.0,
+    ):
+        self.engine = engine
+        self.directory = directory
+        self.sync_interval = sync_interval
+        self.apply_interval = apply_interval
+        self.batch_size = batch_size
+        self.segment_bytes = segment_bytes
+        self.max_backlog = max_backlog
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self._current: _Segment | None = None
+        # written to the end, deleted once applied
+        self._sealed: list[_Segment] = []
+        self._buffer = bytearray()
+        self._buffered: list[tuple[UUID, int]] = []
+        self._group: asyncio.Future | None = None
+        self._pending: dict[UUID, tuple[int, int]] = {}  # code id -> scans, latest scan ts
+        self._lock = asyncio.Lock()
+        self._sync_lock = asyncio.Lock()
+        self._apply_lock = asyncio.Lock()
+        self._sync_wake = asyncio.Event()
+        self._apply_wake = asyncio.Event()
+        self._room = asyncio.Condition()  # notified whenever a batch is applied
+        self._tasks: list[asyncio.Task] = []
+        self.syncs = 0
+        self.synced_records = 0
+        self.last_sync_ms = 0.0
+        self.batches = 0
+        self.last_batch_size = 0
+        self.applied_records = 0
+        self.replayed_records = 0
+        self.failures = 0
+        self.lost = 0
+        self.peak_backlog = 0
+        self.blocked = 0
+        self.dropped = 0
+
+    @property
+    def backlog(self) -> int:
+        """Records on disk and not applied yet."""
+        segments = [*self._sealed, self._current] if self._current is not None else self._sealed
+        return sum(segment.end - segment.applied for segment in segments) // RECORD.size
+
+    async def start(self) -> None:
+        """Claim the segments no running worker holds, open this worker's own and start syncing and applying."""
+        await asyncio.to_thread(self.directory.mkdir, parents=True, exist_ok=True)
+        for path in sorted(self.directory.glob(f"*{SEGMENT_SUFFIX}")):
+            fd = await asyncio.to_thread(_claim, path)
+            if fd is None:
+                continue
+            async with AsyncSession(self.engine) as session:
+                offset = await ScanJournalCheckpointCrud(session).get_offset(path.name)
+            segment = _Segment(path, fd, own=False, end=os.fstat(fd).st_size)
+            if offset is not None:
+                segment.applied, segment.checkpointed = offset, True
+            self._sealed.append(segment)
+            logger.info("replaying scan journal %s from byte %d of %d", path.name, segment.applied, segment.end)
+        self._current = await asyncio.to_thread(self._new_segment)
+        self._tasks = [asyncio.create_task(self._run_syncer()), asyncio.create_task(self._run_applier())]
+        if self._sealed:
+            self._apply_wake.set()
+
+    async def append(self, qr_code_id: UUID, ts: int) -> None:
+        """Returns once the scan is on disk, with the others of its group, or dropped by the overflow policy.
+
+        "block" waits at most `block_timeout` seconds for room: when the applier is stuck (the database is down)
+        the scan is dropped after all, rather than holding the redirect.
+        """
+        if self._unapplied() >= self.max_backlog:
+            if self.overflow == "drop":
+                self.dropped += 1
+                return
+            self.blocked += 1
+            self._apply_wake.set()
+            async with self._room:
+                try:
+                    await asyncio.wait_for(
+                        self._room.wait_for(lambda: self._unapplied() < self.max_backlog), self.block_timeout
+                    )
+                except TimeoutError:
+                    self.dropped += 1
+                    return
+        self._buffer += pack_record(qr_code_id, ts)
+        self._buffered.append((qr_code_id, ts))
+        if self._group is None:
+            self._group = asyncio.get_running_loop().create_future()
+            self._sync_wake.set()
+        self.peak_backlog = max(self.peak_backlog, self._unapplied())
+        await asyncio.shield(self._group)
+
+    def pending(self, qr_code_id: UUID) -> tuple[int, int | None]:
+        """Scans of the code journaled by this worker and not applied yet, and the latest of them."""
+        return self._pending.get(qr_code_id, (0, None))
+
+    def with_pending(self, qr_code: QrCode) -> QrCode:
+        count, last_ts = self.pending(qr_code.id)
+        if last_ts is not None:
+            qr_code.scan_count += count
+            qr_code.last_scan_at = max(qr_code.last_scan_at or 0, last_ts)
+        return qr_code
+
+    @asynccontextmanager
+    async def consistent_read(self) -> AsyncIterator[None]:
+        async with self._lock:
+            yield
+
+    async def apply(self) -> None:
+        """Write everything on disk so far to the database."""
+        async with self._apply_lock:
+            if self._current is None:
+                return  # closed: what is left on disk is the next start's
+            for segment in [*self._sealed, self._current]:
+                while segment.applied < segment.end:
+                    await self._apply_batch(segment)
+                if segment is not self._current:
+                    await self._retire(segment)
+
+    async def settled(self, timeout: float) -> None:
+        """Wait (at most `timeout` seconds) until the scans journaled so far are in the database."""
+        try:
+            await asyncio.wait_for(asyncio.shield(self.apply()), timeout)
+        except Exception:
+            logger.warning("scan journal not applied within %.1fs, reading without it", timeout, exc_info=True)
+
+    async def close(self, timeout: float) -> None:
+        """Write out what is buffered and apply what can be within `timeout` seconds; the rest stays on disk for the
+        next worker to start."""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            with suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+        if self._current is None:
+            return
+        await self._sync()
+        try:
+            await asyncio.wait_for(self.apply(), timeout)
+            await self._retire(self._current)
+        except Exception:
+            logger.warning("scan journal not fully applied on shutdown, left for the next start", exc_info=True)
+            for segment in [*self._sealed, self._current]:
+                with suppress(OSError):  # retired already
+                    os.close(segment.fd)
+        self._sealed = []
+        self._current = None
+
+    def metrics(self) -> dict:
+        return {
+            "segments": len(self._sealed) + (self._current is not None),
+            "backlog": self.backlog,
+            "peak_backlog": self.peak_backlog,
+            "max_backlog": self.max_backlog,
+            "overflow": self.overflow,
+            "blocked": self.blocked,
+            "dropped": self.dropped,
+            "syncs": self.syncs,
+            "avg_group_size": round(self.synced_records / self.syncs, 1) if self.syncs else 0.0,
+            "last_sync_ms": round(self.last_sync_ms, 3),
+            "batches": self.batches,
+            "last_batch_size": self.last_batch_size,
+            "avg_batch_size": round(self.applied_records / self.batches, 1) if self.batches else 0.0,
+            "applied_records": self.applied_records,
+            "replayed_records": self.replayed_records,
+            "failures": self.failures,
+            "lost": self.lost,
+        }
+
+    async def _run_syncer(self) -> None:
+        while True:
+            await self._sync_wake.wait()
+            self._sync_wake.clear()
+            await asyncio.sleep(self.sync_interval)  # lets the group fill
+            # not cut short by a cancel: the segment's end must match what is on disk
+            await asyncio.shield(self._sync())
+
+    async def _sync(self) -> None:
+        async with self._sync_lock:
+            if not self._buffer:
+                return
+            data, records, group = bytes(self._buffer), self._buffered, self._group
+            self._buffer, self._buffered, self._group = bytearray(), [], None
+            segment = self._current
+            # append() opens a group with the first record, and close() syncs before it lets go of the segment
+            assert group is not None and segment is not None
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(_write_durably, segment.fd, data, segment.end)
+            except OSError:
+                self.failures += 1
+                self.lost += len(records)
+                logger.exception("journaling %d scans failed, they are lost", len(records))
+                with suppress(OSError):
+                    os.ftruncate(segment.fd, segment.end)
+                group.set_result(None)  # the redirects go on regardless
+                return
+            segment.end += len(data)
+            for qr_code_id, ts in records:
+                count, last_ts = self._pending.get(qr_code_id, (0, ts))
+                self._pending[qr_code_id] = (count + 1, max(last_ts, ts))
+            self.syncs += 1
+            self.synced_records += len(records)
+            self.last_sync_ms = (time.perf_counter() - started) * 1000
+            group.set_result(None)
+            if self.backlog >= self.batch_size:
+                self._apply_wake.set()
+            if segment.end >= self.segment_bytes:
+                self._sealed.append(segment)
+                self._current = await asyncio.to_thread(self._new_segment)
+
+    async def _run_applier(self) -> None:
+        while True:
+            with suppress(TimeoutError):
+                await asyncio.wait_for(self._apply_wake.wait(), self.apply_interval)
+            self._apply_wake.clear()
+            try:
+                await self.apply()
+            except Exception:
+                self.failures += 1
+                logger.exception("applying the scan journal failed, %d scans wait", self.backlog)
+
+    async def _apply_batch(self, segment: _Segment) -> None:
+        size = min(segment.end - segment.applied, self.batch_size * RECORD.size)
+        data = await asyncio.to_thread(os.pread, segment.fd, size, segment.applied)
+        records = unpack_records(data)
+        offset = segment.applied + len(records) * RECORD.size
+        if len(records) * RECORD.size < len(data):
+            # only a segment left by a crash ends in a torn record, nothing after it made it to disk whole
+            logger.warning("scan journal %s cut short at byte %d, ignoring the rest", segment.name, offset)
+            segment.end = offset
+            if not records:
+                return
+        batch: dict[UUID, tuple[int, int]] = {}
+        for qr_code_id, ts in records:
+            count, last_ts = batch.get(qr_code_id, (0, ts))
+            batch[qr_code_id] = (count + 1, max(last_ts, ts))
+        async with self._lock:
+            await self._write(segment, records, batch, offset)
+            segment.applied = offset
+            segment.checkpointed = True
+            if segment.own:
+                for qr_code_id, (count, _last_ts) in batch.items():
+                    pending_count, last_ts = self._pending[qr_code_id]
+                    if pending_count > count:
+                        self._pending[qr_code_id] = (pending_count - count, last_ts)
+                    else:
+                        del self._pending[qr_code_id]
+        self.batches += 1
+        self.last_batch_size = len(records)
+        self.applied_records += len(records)
+        if not segment.own:
+            self.replayed_records += len(records)
+        async with self._room:
+            self._room.notify_all()
+
+    def _unapplied(self) -> int:
+        return self.backlog + len(self._buffered)
+
+    async def _write(
+        self, segment: _Segment, records: list[tuple[UUID, int]], batch: dict[UUID, tuple[int, int]], offset: int
+    ) -> None:
+        async with AsyncSession(self.engine) as session:
+            qr_code_crud = QrCodeCrud(session)
+            await qr_code_crud.add_scan_counts(
+                [{"_id": id_, "_count": count, "_ts": last_ts} for id_, (count, last_ts) in batch.items()]
+            )
+            await ScanEventCrud(session).create_many(
+                [{"id": uuid.uuid4(), "qr_code_id": qr_code_id, "ts": ts} for qr_code_id, ts in records]
+            )
+            checkpoints = ScanJournalCheckpointCrud(session)
+            if segment.checkpointed:
+                await checkpoints.set_offset(segment.name, offset)
+            else:
+                await checkpoints.create({"id": segment.name, "offset": offset})
+            await session.commit()
+
+    async def _retire(self, segment: _Segment) -> None:
+        await asyncio.to_thread(segment.path.unlink, missing_ok=True)
+        os.close(segment.fd)
+        if segment in self._sealed:
+            self._sealed.remove(segment)
+        if segment.checkpointed:
+            async with AsyncSession(self.engine) as session:
+                await ScanJournalCheckpointCrud(session).delete(segment.name)
+                await session.commit()
+
+    def _new_segment(self) -> _Segment:
+        name = f"{time.time_ns()}-{os.getpid()}"
+        temp_path = self.directory / f"{name}.tmp"
+        fd = os.open(temp_path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        # renamed only once locked, so that a worker starting meanwhile does not take it for a stopped one's
+        path = temp_path.rename(self.directory / f"{name}{SEGMENT_SUFFIX}")
+        _fsync_directory(self.directory)
+        return _Segment(path, fd, own=True)
+
+
+def _claim(path: Path) -> int | None:
+    """The segment's file, locked; None if a running worker holds it or it is gone."""
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # the worker that replayed it may have deleted it between the open and the lock
+        if os.fstat(fd).st_ino != os.stat(path).st_ino:
+            raise FileNotFoundError(path)
+    except (BlockingIOError, FileNotFoundError):
+        os.close(fd)
+        return None
+    return fd
+
+
+def _write_durably(fd: int, data: bytes, offset: int) -> None:
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+    os.fsync(fd)
+
+
+def _fsync_directory(directory: Path) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
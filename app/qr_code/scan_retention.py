@@ -0,0 +1,87 @@
+"""Scheduled scan-event retention.
+
+Expired scan events used to be deleted for one code at a time, every so many of its scans, in the path that
+recorded them; a code that stopped being scanned kept its events forever. A background job now deletes the events
+of all codes older than the retention, once at start and then every ``interval`` seconds. It deletes in chunks of
+``chunk_size`` rows, one short transaction each, and pauses ``pause`` seconds in between so that the scan
+journal's writes get the database in the meantime.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import suppress
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from qr_code.dal import ScanEventCrud
+
+logger = logging.getLogger(__name__)
+
+# the stats endpoint serves at most 90 days, older per-scan events are dropped
+SCAN_EVENT_RETENTION_SECONDS = 90 * 24 * 3600
+
+
+class ScanRetention:
+    def __init__(self, engine: AsyncEngine, interval: float, chunk_size: int, pause: float):
+        self.engine = engine
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self._task: asyncio.Task | None = None
+        self.runs = 0
+        self.removed = 0
+        self.last_run_at: int | None = None
+        self.last_run_removed = 0
+        self.last_run_ms = 0.0
+        self.failures = 0
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def run_once(self) -> int:
+        """Deletes every expired event, a chunk at a time; returns how many."""
+        started = time.perf_counter()
+        cutoff = int(time.time()) - SCAN_EVENT_RETENTION_SECONDS
+        removed = 0
+        while True:
+            async with AsyncSession(self.engine) as session:
+                deleted = await ScanEventCrud(session).delete_expired(cutoff, self.chunk_size)
+                await session.commit()
+            removed += deleted
+            if deleted < self.chunk_size:
+                break
+            await asyncio.sleep(self.pause)
+        self.runs += 1
+        self.removed += removed
+        self.last_run_at = int(time.time())
+        self.last_run_removed = removed
+        self.last_run_ms = (time.perf_counter() - started) * 1000
+        logger.info("removed %d expired scan events in %.1f ms", removed, self.last_run_ms)
+        return removed
+
+    def metrics(self) -> dict:
+        return {
+            "runs": self.runs,
+            "removed": self.removed,
+            "last_run_at": self.last_run_at,
+            "last_run_removed": self.last_run_removed,
+            "last_run_ms": round(self.last_run_ms, 3),
+            "failures": self.failures,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                self.failures += 1
+                logger.exception("removing expired scan events failed")
+            await asyncio.sleep(self.interval)
@@ -1,76 +1,154 @@
+import asyncio
 import time
 from collections import Counter
 from datetime import datetime, timedelta, timezone
-from typing import Sequence
+from pathlib import Path
+from typing import AsyncIterator, Sequence
 from uuid import UUID
 
-from PIL import Image
+from core.settings import settings
+from qr_code.dal import QrCodeChangeRepo, QrCodeRepo, ScanEventRepo
+from qr_code.export import ExportEntry
+from qr_code.models import QrCode, QrCodeChange, QrRender, RedirectTarget, matrix_info, new_slug
+from qr_code.redirect_cache import RedirectCache, RedirectKey
+from qr_code.rendering import ImageRenderer
+from qr_code.scan_journal import ScanJournal
 
-from qr_code.dal import QrCodeRepo, ScanEventRepo
-from qr_code.models import QrCode, ScanEvent
-
-# the stats endpoint serves at most 90 days, older per-scan events are dropped
-SCAN_EVENT_RETENTION_SECONDS = 90 * 24 * 3600
-# pruning on every scan would add a delete to every redirect; once per N scans keeps the table bounded anyway
-SCAN_EVENT_PRUNE_EVERY = 100
+# longest the stats wait for journaled scans to reach the database
+SCAN_SETTLE_TIMEOUT = 2
+# a fresh slug collides with probability ~codes/62^7; past this many retries the unique index has the last word
+SLUG_ATTEMPTS = 5
 
 
 class QrCodeService:
-    def __init__(self, qr_code_repo: QrCodeRepo, scan_event_repo: ScanEventRepo):
+    def __init__(
+        self,
+        qr_code_repo: QrCodeRepo,
+        scan_event_repo: ScanEventRepo,
+        qr_code_change_repo: QrCodeChangeRepo,
+        image_renderer: ImageRenderer,
+        redirect_cache: RedirectCache,
+        scan_journal: ScanJournal,
+    ):
         self.qr_code_repo = qr_code_repo
         self.scan_event_repo = scan_event_repo
-
-    async def get_image_by_qr_code_id(self, id: UUID, box_size: int = 10) -> Image.Image:
-        qr_code = await self.qr_code_repo.get_by_id(id)
-        return qr_code.get_image(box_size=box_size)
-
-    async def get_svg_by_qr_code_id(self, id: UUID) -> bytes:
-        qr_code = await self.qr_code_repo.get_by_id(id)
-        return qr_code.get_svg()
+        self.qr_code_change_repo = qr_code_change_repo
+        self.image_renderer = image_renderer
+        self.redirect_cache = redirect_cache
+        self.scan_journal = scan_journal
+
+    async def get_render_params(
+        self, id: UUID, fmt: str = "png", box_size: int = 10, pixels: int | None = None
+    ) -> QrRender:
+        style = await self.qr_code_repo.get_style(id)
+        return QrRender.for_code(id, fmt, box_size, pixels=pixels, **style)
+
+    async def get_image(
+        self, id: UUID, render: QrRender, encoding: str = "identity"
+    ) -> bytes | Path | AsyncIterator[bytes]:
+        return await self.image_renderer.get(id, render, encoding)
 
     async def get_all(self) -> Sequence[QrCode]:
         return await self.qr_code_repo.get_all()
 
     async def get_all_user_qr_codes(self, user_id: UUID) -> Sequence[QrCode]:
-        return await self.qr_code_repo.get_all_user_qr_codes(user_id)
+        async with self.scan_journal.consistent_read():
+            qr_codes = await self.qr_code_repo.get_all_user_qr_codes(user_id)
+            return [self.scan_journal.with_pending(qr_code) for qr_code in qr_codes]
+
+    async def get_export_entries(self, user_id: UUID, fmt: str = "png", box_size: int = 10) -> list[ExportEntry]:
+        qr_codes = await self.qr_code_repo.get_all_user_qr_codes(user_id)
+        return [ExportEntry(qr_code, qr_code.render_params(fmt, box_size)) for qr_code in qr_codes]
 
     async def create_qr_code(self, user_id: UUID, name: str, link: str, **style_fields) -> QrCode:
-        qr_code = QrCode(user_id=user_id, name=name, link=link, **style_fields)
+        if style_fields.get("error_correction") is None:
+            style_fields.pop("error_correction", None)
+        qr_code = QrCode(user_id=user_id, name=name, link=link, slug=await self._free_slug(), **style_fields)
         return await self.qr_code_repo.create_and_get(qr_code)
 
+    async def _free_slug(self) -> str:
+        for _ in range(SLUG_ATTEMPTS):
+            slug = new_slug()
+            if not await self.qr_code_repo.slug_exists(slug):
+                return slug
+        # the short slugs are crowded: one twice as long is free in practice, unlike the last one tried
+        return new_slug(2 * settings.QR_SLUG_LENGTH)
+
     async def delete_qr_code(self, user_id: UUID, qr_code_id: UUID) -> None:
         qr_code = await self.qr_code_repo.get_by_id(qr_code_id)
         if qr_code.user_id != user_id:
             raise QrCode.NotFoundError
         await self.qr_code_repo.delete(qr_code.id)
+        await self._log_change(qr_code.id)
+        self.image_renderer.invalidate(qr_code.id)
 
     async def get_by_id(self, id: UUID) -> QrCode:
         return await self.qr_code_repo.get_by_id(id)
 
-    async def register_scan(self, id: UUID) -> QrCode:
-        qr_code = await self.qr_code_repo.get_by_id(id)
-        now = int(time.time())
-        await self.qr_code_repo.increment_scan_count(id, now)
-        await self.scan_event_repo.create(ScanEvent(qr_code_id=id, ts=now))
-        if qr_code.scan_count % SCAN_EVENT_PRUNE_EVERY == 0:
-            await self.scan_event_repo.delete_older_than(id, now - SCAN_EVENT_RETENTION_SECONDS)
-        return qr_code
+    async def get_by_slug(self, slug: str) -> QrCode:
+        return await self.qr_code_repo.get_by_slug(slug)
+
+    async def get_redirect(self, id: UUID) -> RedirectTarget:
+        return await self._cached_redirect(id, self.qr_code_repo.get_redirect)
+
+    async def get_slug_redirect(self, slug: str) -> RedirectTarget:
+        return await self._cached_redirect(slug, self.qr_code_repo.get_slug_redirect)
+
+    async def register_scan(self, id: UUID) -> RedirectTarget:
+        target = await self.get_redirect(id)
+        await self._record_scan(target.qr_code_id)
+        return target
+
+    async def register_slug_scan(self, slug: str) -> RedirectTarget:
+        target = await self.get_slug_redirect(slug)
+        await self._record_scan(target.qr_code_id)
+        return target
+
+    async def _cached_redirect(self, key: RedirectKey, load) -> RedirectTarget:
+        cache = self.redirect_cache
+        if cache.sync_due() and not await cache.sync(self.qr_code_change_repo.get_since):
+            return await load(key)  # the cache may be stale: the database has the current target
+        target = cache.get(key)
+        if target is None:
+            read_at = time.monotonic()
+            target = await load(key)
+            cache.put(key, target, read_at)
+        return target
+
+    async def _record_scan(self, id: UUID) -> None:
+        # a sequential append to the journal; it reaches the database in the background
+        await self.scan_journal.append(id, int(time.time()))
+
+    async def _log_change(self, id: UUID) -> None:
+        # tells the other workers' redirect caches; committed (or rolled back) with the change itself
+        now_ts = time.time_ns() // 1_000_000
+        await self.qr_code_change_repo.create(QrCodeChange(qr_code_id=id, ts=now_ts))
+        # a worker that has not synced for this long has no entries left that an older row could concern
+        retention = settings.QR_REDIRECT_CACHE_TTL + settings.QR_REDIRECT_CACHE_MAX_STALENESS
+        await self.qr_code_change_repo.delete_older_than(now_ts - int(retention * 1000))
+        self.redirect_cache.invalidate(id)
 
     async def get_scan_stats(self, user_id: UUID, qr_code_id: UUID, days: int = 30) -> dict:
-        qr_code = await self.qr_code_repo.get_by_id(qr_code_id)
+        async with self.scan_journal.consistent_read():
+            qr_code = self.scan_journal.with_pending(await self.qr_code_repo.get_by_id(qr_code_id))
         if qr_code.user_id != user_id:
             raise QrCode.NotFoundError
 
         today = datetime.now(timezone.utc).date()
         first_day = today - timedelta(days=days - 1)
         since = int(datetime(first_day.year, first_day.month, first_day.day, tzinfo=timezone.utc).timestamp())
+        # the owner may be looking at scans made a moment ago
+        await self.scan_journal.settled(SCAN_SETTLE_TIMEOUT)
         timestamps = await self.scan_event_repo.get_ts_since(qr_code_id, since)
         by_day = Counter(datetime.fromtimestamp(ts, tz=timezone.utc).date() for ts in timestamps)
         day_range = (first_day + timedelta(days=i) for i in range(days))
+        # usually cached by the renders; otherwise an encode, kept off the event loop
+        matrix = await asyncio.to_thread(lambda: qr_code.render_params().matrix)
         return {
             "days": [{"date": day.isoformat(), "count": by_day.get(day, 0)} for day in day_range],
             "total": qr_code.scan_count,
             "last_scan_at": qr_code.last_scan_at,
+            "code": matrix_info(matrix),
         }
 
     async def update_qr_code(self, user_id: UUID, qr_code_id: UUID, name: str, link: str, **style_fields) -> QrCode:
@@ -80,5 +158,10 @@ class QrCodeService:
         qr_code.link = link
         qr_code.name = name
         for field_name, value in style_fields.items():
+            if field_name == "error_correction" and value is None:
+                continue
             setattr(qr_code, field_name, value)
-        return await self.qr_code_repo.update_and_get(qr_code)
+        qr_code = await self.qr_code_repo.update_and_get(qr_code)
+        await self._log_change(qr_code_id)
+        self.image_renderer.invalidate(qr_code_id)
+        return self.scan_journal.with_pending(qr_code)
@@ -1,4 +1,4 @@
-from sqlalchemy import UUID, BigInteger, Column, ForeignKey, Index, String, Table
+from sqlalchemy import UUID, BigInteger, Boolean, Column, ForeignKey, Index, String, Table, false
 
 from core.database import metadata
 
@@ -16,6 +16,12 @@ qr_code_table = Table(
     Column("fill_color2", String, nullable=True),
     Column("back_color", String, nullable=False, server_default="#ffffff"),
     Column("style", String, nullable=False, server_default="square"),
+    # base62 id of the short /r/{slug} url
+    Column("slug", String, nullable=False),
+    Column("short_url", Boolean, nullable=False, server_default=false()),
+    # auto|L|M|Q|H, see QrCode.error_correction
+    Column("error_correction", String, nullable=False, server_default="M"),
+    Index('ix_qr_code_slug', 'slug', unique=True),
 )
 
 scan_event_table = Table(
@@ -24,6 +30,25 @@ scan_event_table = Table(
     Column('id', UUID(as_uuid=True), primary_key=True),
     Column('qr_code_id', UUID(as_uuid=True), nullable=False),
     Column('ts', BigInteger, nullable=False),
-    # covers both the stats range query and retention pruning
+    # the stats range query
     Index('ix_scan_event_qr_code_id_ts', 'qr_code_id', 'ts'),
+    # the retention job, which deletes the oldest events of all codes
+    Index('ix_scan_event_ts', 'ts'),
+)
+
+# edits and deletes, polled by every worker's redirect cache; rows are kept for a little more than its TTL
+qr_code_change_table = Table(
+    'qr_code_change',
+    metadata,
+    Column('id', UUID(as_uuid=True), primary_key=True),
+    Column('qr_code_id', UUID(as_uuid=True), nullable=False),
+    Column('ts', BigInteger, nullable=False, index=True),
+)
+
+# how far each scan journal segment (by file name) has been applied; advanced in the transaction that applies it
+scan_journal_checkpoint_table = Table(
+    'scan_journal_checkpoint',
+    metadata,
+    Column('id', String, primary_key=True),
+    Column('offset', BigInteger, nullable=False),
 )
@@ -0,0 +1,137 @@
+"""Native SVG writer for the module styles of QR_STYLES.
+
+Same geometry as the raster output, in module units: every module becomes a short path fragment picked by
+the same tile index the rasterizer uses (squares, dots, or rounded modules with a quarter circle on every
+corner that has no neighbour on either side), and a radial gradient fill becomes a ``<radialGradient>``.
+The document is built as a string; there is nothing to gain from a DOM for one path.
+
+Output is minified: runs of squares are merged, moves are relative and numbers have no redundant digits.
+"""
+
+import math
+
+import numpy as np
+
+from qr_code.matrix import QR_BORDER, QrMatrix
+from qr_code.raster import EMPTY, SQUARE, tile_index
+
+GRADIENT_ID = "qr-fill"
+
+
+def render_svg(matrix: QrMatrix, style: str, fill_color: str, fill_color2: str | None, back_color: str) -> bytes:
+    width = matrix.size + QR_BORDER * 2
+    if fill_color2 is None:
+        defs, fill = "", fill_color
+    else:
+        # matches RadialGradiantColorMask: centre colour in the middle, edge colour reached in the corners
+        defs = (
+            f'<defs><radialGradient id="{GRADIENT_ID}" gradientUnits="userSpaceOnUse"'
+            f' cx="{_num(width / 2)}" cy="{_num(width / 2)}" r="{_num(width / math.sqrt(2))}">'
+            f'<stop offset="0" stop-color="{fill_color}"/><stop offset="1" stop-color="{fill_color2}"/>'
+            "</radialGradient></defs>"
+        )
+        fill = f"url(#{GRADIENT_ID})"
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" version="1.1" width="{width}mm" height="{width}mm"'
+        f' viewBox="0 0 {width} {width}">{defs}'
+        f'<rect width="100%" height="100%" fill="{back_color}"/>'
+        f'<path fill="{fill}" d="{_path_data(matrix.modules, style)}"/></svg>'
+    ).encode()
+
+
+def _path_data(modules: np.ndarray, style: str) -> str:
+    """Subpaths joined with relative moves, so coordinates stay one or two digits long.
+
+    Horizontal runs of square modules (every module of the square style, finder patterns of the others)
+    merge into one rectangle; shaped modules each keep their own subpath.
+    """
+    fragments = _fragments(style)
+    index = tile_index(modules, style)
+    parts = []
+    # a closed subpath leaves the current point at its start, which is what the next move is relative to
+    x = y = 0.0
+    for row, tiles in enumerate(index):
+        columns = np.flatnonzero(tiles != EMPTY)
+        skip_to = 0
+        for col in columns:
+            if col < skip_to:
+                continue
+            tile = tiles[col]
+            if tile == SQUARE:
+                end = col + 1
+                while end < len(tiles) and tiles[end] == SQUARE:
+                    end += 1
+                skip_to = end
+                dx, dy, body = 0.0, 0.0, f"h{end - col}v1h-{end - col}z"
+            else:
+                dx, dy, body = fragments[tile]
+            start_x, start_y = col + QR_BORDER + dx, row + QR_BORDER + dy
+            parts.append(f"m{_pair(start_x - x, start_y - y)}{body}")
+            x, y = start_x, start_y
+    return "".join(parts)
+
+
+def _fragments(style: str) -> list[tuple[float, float, str]]:
+    """Per tile index: start point inside the module and the relative path drawn from it."""
+    fragments = [(0.0, 0.0, ""), (0.0, 0.0, "h1v1h-1z")]  # EMPTY, SQUARE
+    if style == "dots":
+        fragments.append((0.0, 0.5, _commands([("a", 1, 0), ("a", -1, 0)])))
+    elif style == "rounded":
+        fragments.extend((0.5, 0.0, _rounded(neighbours)) for neighbours in range(16))
+    return fragments
+
+
+def _rounded(neighbours: int) -> str:
+    north, east, south, west = (bool(neighbours & bit) for bit in (1, 2, 4, 8))
+    if not (north or east or south or west):
+        return _commands([("a", 0, 1), ("a", 0, -1)])  # four rounded corners make a circle
+    # clockwise from the middle of the top edge, one quadrant at a time
+    corners = (
+        (not north and not east, [("h", 0.5), ("v", 0.5)], (0.5, 0.5)),
+        (not east and not south, [("v", 0.5), ("h", -0.5)], (-0.5, 0.5)),
+        (not south and not west, [("h", -0.5), ("v", -0.5)], (-0.5, -0.5)),
+        (not west and not north, [("v", -0.5), ("h", 0.5)], (0.5, -0.5)),
+    )
+    commands: list[tuple] = []
+    for rounded, straight, (dx, dy) in corners:
+        for command in [("a", dx, dy)] if rounded else straight:
+            if commands and command[0] != "a" and commands[-1][0] == command[0]:
+                commands[-1] = (command[0], commands[-1][1] + command[1])
+            else:
+                commands.append(command)
+    if commands[-1][0] != "a":
+        commands.pop()  # closing the path draws the last straight edge
+    return _commands(commands)
+
+
+def _commands(commands: list[tuple]) -> str:
+    """Serialize relative h/v lines and half-module-radius arcs; a repeated command letter is left out."""
+    out = []
+    previous = None
+    for name, *args in commands:
+        if name == "a":
+            dx, dy = args
+            # a quarter circle needs the small arc, a half circle is the same either way
+            text = f".5.5 0 0 1{_pair(dx, dy, leading=True)}"
+        else:
+            text = _num(args[0])
+        if name == previous and not text.startswith("-"):
+            text = " " + text
+        out.append(text if name == previous else name + text)
+        previous = name
+    return "".join(out) + "z"
+
+
+def _pair(dx: float, dy: float, leading: bool = False) -> str:
+    # a minus sign separates numbers by itself
+    first = _num(dx)
+    if leading and not first.startswith("-"):
+        first = " " + first
+    return first + ("" if dy < 0 else " ") + _num(dy)
+
+
+def _num(value: float) -> str:
+    text = f"{value:.4f}".rstrip("0").rstrip(".")
+    if text.startswith(("0.", "-0.")):
+        text = text.replace("0.", ".", 1)
+    return text or "0"
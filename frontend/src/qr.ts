@@ -18,6 +18,18 @@ export interface QrCode extends QrStyle {
   link: string;
   scan_count: number;
   last_scan_at: number | null;
+  slug: string;
+  short_url: boolean;
+  image_version: string; // `v` of image urls: served as immutable while it is current
+  images?: QrThumbnails; // only in the list response
+}
+
+/** Versioned fixed-width thumbnail urls, one per size, and a `srcset` of all of them. */
+export interface QrThumbnails {
+  thumb: string;
+  sm: string;
+  md: string;
+  srcset: string;
 }
 
 export const DEFAULT_STYLE: QrStyle = { fill_color: '#000000', fill_color2: null, back_color: '#ffffff', style: 'square' };
@@ -79,15 +91,21 @@ export async function deleteQr(id: string): Promise<null> {
 }
 
 export function qrImageUrl(q: QrCode, extra: Record<string, string> = {}): string {
-  // `v` busts browser/SW caches when the style changes; the backend ignores it
-  const sig = [q.fill_color, q.fill_color2 ?? '', q.back_color, q.style].join('').replace(/#/g, '');
-  const qs = new URLSearchParams({ ...extra, v: sig });
+  // the server's version changes with anything that changes the image, busting browser/SW caches
+  const qs = new URLSearchParams({ ...extra, v: q.image_version });
   return `${API_BASE}/qr_code/${q.id}/image?${qs}`;
 }
 
-/** The public redirect URL encoded in the QR image. */
-export function qrPublicUrl(id: string): string {
-  return `${location.origin}/qr_code/${id}`;
+/** `src`/`srcset`/`sizes` attributes of a list image: the browser picks the thumbnail for its slot and density. */
+function thumbAttrs(q: QrCode, sizes: string): string {
+  if (!q.images) return `src="${qrImageUrl(q)}"`;
+  const srcset = q.images.srcset.split(', ').map(entry => API_BASE + entry).join(', ');
+  return `src="${escapeAttr(API_BASE + q.images.sm)}" srcset="${escapeAttr(srcset)}" sizes="${sizes}"`;
+}
+
+/** The public redirect URL encoded in the QR image; codes from before short slugs keep their uuid URL. */
+export function qrPublicUrl(q: QrCode): string {
+  return q.short_url ? `${location.origin}/r/${q.slug}` : `${location.origin}/qr_code/${q.id}`;
 }
 
 async function copyText(text: string): Promise<void> {
@@ -169,7 +187,7 @@ function rowHtml(q: QrCode, i: number): string {
     <div class="row" data-id="${escapeAttr(String(q.id))}" style="--i:${i}">
       <div class="n">${String(i + 1).padStart(2, '0')}</div>
       <button class="qr-thumb" type="button" data-open title="${escapeAttr(t('openQr'))}">
-        <img src="${qrImageUrl(q)}" alt="" loading="lazy">
+        <img ${thumbAttrs(q, '40px')} alt="" loading="lazy">
       </button>
       <div class="name">${escapeHTML(q.name)}</div>
       <div class="link"><a href="${escapeAttr(q.link)}" target="_blank" rel="noopener">${escapeHTML(displayLink(q.link))}</a></div>
@@ -188,7 +206,7 @@ function cardHtml(q: QrCode, i: number): string {
   return `
     <div class="card" data-id="${escapeAttr(String(q.id))}" style="--i:${i}">
       <button class="card-thumb" type="button" data-open title="${escapeAttr(t('openQr'))}">
-        <img src="${qrImageUrl(q)}" alt="" loading="lazy">
+        <img ${thumbAttrs(q, '148px')} alt="" loading="lazy">
       </button>
       <div class="card-body">
         <div class="name">${escapeHTML(q.name)}</div>
@@ -330,7 +348,7 @@ function openModal(q: QrCode): void {
   const fileBase = q.name.replace(/[^\wа-яё \-]+/gi, '').trim() || 'qr';
   const dl = document.getElementById('modal-download') as HTMLAnchorElement;
   // hi-res png (~1200px) so the code survives print
-  dl.href = qrImageUrl(q, { scale: '20' });
+  dl.href = qrImageUrl(q, { fmt: 'png', scale: '20' });
   dl.download = `${fileBase}.png`;
 
   const svg = document.getElementById('modal-svg') as HTMLAnchorElement | null;
@@ -585,7 +603,7 @@ export function initQrModule(): void {
     const q = items.find(x => String(x.id) === row.dataset.id);
     if (!q) return;
 
-    if (target.closest('[data-copy]')) { void copyText(qrPublicUrl(q.id)); return; }
+    if (target.closest('[data-copy]')) { void copyText(qrPublicUrl(q)); return; }
     if (target.closest('[data-open]')) { openModal(q); return; }
     if (target.closest('[data-edit]')) { openEditView(q.id); return; }
 
@@ -625,7 +643,7 @@ export function initQrModule(): void {
   });
 
   document.getElementById('modal-copy')?.addEventListener('click', () => {
-    if (modalQr) void copyText(qrPublicUrl(modalQr.id));
+    if (modalQr) void copyText(qrPublicUrl(modalQr));
   });
 
   document.getElementById('modal-print')?.addEventListener('click', () => window.print());
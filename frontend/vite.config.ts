@@ -9,6 +9,7 @@ export default defineConfig({
       '/auth'    : apiTarget,
       '/user'    : apiTarget,
       '/qr_code' : apiTarget,
+      '/r/'      : apiTarget,
     },
   },
   plugins: [
@@ -34,7 +35,8 @@ export default defineConfig({
         navigateFallback: '/index.html',
         // API must never be served from cache: auth tokens and QR CRUD go network-only,
         // except QR images, which are immutable per id and safe to serve stale.
-        navigateFallbackDenylist: [/^\/(qr_code|auth|user)/],
+        // /r/ is the short scan redirect: a scanned link must reach the backend, not the app shell.
+        navigateFallbackDenylist: [/^\/(qr_code|auth|user|r\/)/],
         runtimeCaching: [
           {
             urlPattern: /\/qr_code\/[^/]+\/image$/,
@@ -45,7 +47,7 @@ export default defineConfig({
             },
           },
           {
-            urlPattern: /\/(qr_code|auth|user)(\/|$)/,
+            urlPattern: /\/(qr_code|auth|user|r)(\/|$)/,
             handler: 'NetworkOnly',
           },
           {
@@ -8,6 +8,7 @@ from starlette.testclient import TestClient
 from auth.providers import AuthProvider
 from core.database import ConnectionProvider, create_tables
 from core.providers import DataclassSerializerProvider
+from core.settings import settings
 from google_auth.providers import GoogleAuthProvider
 from qr_code.providers import QrCodeProvider
 from telegram_auth.providers import TelegramAuthProvider
@@ -22,9 +23,11 @@ class DatabaseWithTablesProvider(Provider):
 
 
 @pytest.fixture
-async def container():
+async def container(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'QR_SCAN_JOURNAL_DIR', str(tmp_path / 'scan_journal'))
     container = make_async_container(
-        ConnectionProvider("sqlite+aiosqlite:///:memory:"),
+        # a file, not :memory:, so that sessions get connections of their own like in production
+        ConnectionProvider(f"sqlite+aiosqlite:///{tmp_path}/test.sqlite"),
         DatabaseWithTablesProvider(),
         DataclassSerializerProvider(),
         UserProvider(),
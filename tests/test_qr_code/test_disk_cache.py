@@ -0,0 +1,118 @@
+import os
+import uuid
+
+import pytest
+
+from core.settings import settings
+from qr_code.disk_cache import DiskImageCache
+from qr_code.image_cache import RenderedImageCache
+from qr_code.models import QrRender
+
+
+def render(box_size=10):
+    return QrRender(
+        data='https://example.com',
+        fill_color='#000000',
+        fill_color2=None,
+        back_color='#ffffff',
+        style='square',
+        box_size=box_size,
+    )
+
+
+def test_disabled_cache_stores_nothing():
+    cache = DiskImageCache(None, max_bytes=100)
+    cache.put(render(), b'png')
+    assert cache.get(render()) is None
+
+
+def test_put_then_get_returns_content_addressed_path(tmp_path):
+    cache = DiskImageCache(tmp_path, max_bytes=1000)
+    assert cache.get(render()) is None
+    cache.put(render(), b'png')
+    path = cache.get(render())
+    assert path is not None
+    assert path.read_bytes() == b'png'
+    assert path.name == f'{render().digest}.png'
+    assert not list(tmp_path.glob('*/*.tmp'))
+    assert cache.accel_redirect_uri(path, '/_qr_images/') == f'/_qr_images/{path.parent.name}/{path.name}'
+
+
+def test_prune_drops_least_recently_used(tmp_path):
+    filler = DiskImageCache(tmp_path, max_bytes=1000)
+    for box_size, mtime in ((4, 100), (5, 300), (6, 200)):
+        filler.put(render(box_size), b'x' * 10)
+        os.utime(filler.path_for(render(box_size)), (mtime, mtime))
+
+    cache = DiskImageCache(tmp_path, max_bytes=15)
+    assert cache.prune() == 2
+    assert cache.get(render(5)) is not None
+    assert cache.get(render(4)) is None
+    assert cache.get(render(6)) is None
+
+
+def test_prune_leaves_files_being_written_alone(tmp_path):
+    cache = DiskImageCache(tmp_path, max_bytes=15)
+    cache.put(render(), b'x' * 10)
+    in_flight = cache.path_for(render()).parent / 'other-worker.tmp'
+    in_flight.write_bytes(b'x' * 100)
+    os.utime(in_flight, (100, 100))
+
+    assert cache.prune() == 0
+    assert in_flight.exists()
+
+
+def test_failed_write_leaves_no_temp_file(tmp_path):
+    cache = DiskImageCache(tmp_path, max_bytes=1000)
+    with pytest.raises(RuntimeError):
+        with cache.writer(render()) as file:
+            file.write(b'partial')
+            raise RuntimeError('render failed')
+    assert not list(tmp_path.glob('*/*'))
+
+
+@pytest.fixture
+def qr_code_id(test_client, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'QR_IMAGE_DISK_CACHE_DIR', str(tmp_path))
+    response = test_client.post('/user/register', json={'username': 'disker', 'password': 'pw12345678'})
+    headers = {'Authorization': f"Bearer {response.json()['access_token']}"}
+    response = test_client.post('/qr_code/', json={'name': 'test', 'link': 'https://example.com'}, headers=headers)
+    return response.json()['id']
+
+
+def test_image_served_from_disk_and_via_accel_redirect(test_client, container, tmp_path, qr_code_id):
+    first = test_client.get(f'/qr_code/{qr_code_id}/image?scale=7')
+    # the warm-up of the new code may have put its default images next to it
+    (path,) = [path for path in tmp_path.glob('*/*.png') if path.read_bytes() == first.content]
+
+    # as if another worker answered: nothing in its memory cache, the disk copy is shared
+    memory_cache = test_client.portal.call(container.get, RenderedImageCache)
+    memory_cache.invalidate(uuid.UUID(qr_code_id))
+    from_disk = test_client.get(f'/qr_code/{qr_code_id}/image?scale=7')
+    assert from_disk.content == first.content
+    assert from_disk.headers['etag'] == first.headers['etag']
+
+    redirected = test_client.get(f'/qr_code/{qr_code_id}/image?scale=7', headers={'X-Accel-Prefix': '/_qr_images/'})
+    assert redirected.status_code == 200
+    assert redirected.content == b''
+    assert redirected.headers['x-accel-redirect'] == f'/_qr_images/{path.parent.name}/{path.name}'
+    assert redirected.headers['etag'] == first.headers['etag']
+
+
+def test_image_pruned_after_lookup_is_rendered_again(test_client, container, tmp_path, qr_code_id, monkeypatch):
+    first = test_client.get(f'/qr_code/{qr_code_id}/image?scale=7')
+    memory_cache = test_client.portal.call(container.get, RenderedImageCache)
+    memory_cache.invalidate(uuid.UUID(qr_code_id))
+    disk_cache = test_client.portal.call(container.get, DiskImageCache)
+    lookup = disk_cache.get
+
+    def pruned_get(render, encoding='identity'):
+        path = lookup(render, encoding)
+        if path is not None:
+            path.unlink()  # another worker's janitor, between the lookup and the response
+        return path
+
+    monkeypatch.setattr(disk_cache, 'get', pruned_get)
+    response = test_client.get(f'/qr_code/{qr_code_id}/image?scale=7')
+    assert response.status_code == 200
+    assert response.content == first.content
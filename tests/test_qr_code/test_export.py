@@ -0,0 +1,69 @@
+import asyncio
+import io
+import uuid
+import zipfile
+
+import pytest
+
+from qr_code.disk_cache import DiskImageCache
+from qr_code.export import ExportEntry, stream_zip
+from qr_code.image_cache import RenderedImageCache
+from qr_code.models import QrCode
+from qr_code.render_pool import RenderPool
+from qr_code.rendering import ImageRenderer
+
+
+@pytest.fixture
+def renderer():
+    return ImageRenderer(RenderedImageCache(10**7), DiskImageCache(None, 0), RenderPool(workers=0, max_pending=8))
+
+
+async def collect(chunks):
+    return b''.join([chunk async for chunk in chunks])
+
+
+@pytest.mark.parametrize('fmt', ['png', 'svg'])
+async def test_stream_zip_contains_every_code(renderer, fmt):
+    user_id = uuid.uuid4()
+    qr_codes = [QrCode(user_id=user_id, name='Table 1', link=f'https://example.com/{i}') for i in range(5)]
+    entries = [ExportEntry(qr_code, qr_code.render_params(fmt)) for qr_code in qr_codes]
+
+    archive = zipfile.ZipFile(io.BytesIO(await collect(stream_zip(renderer, entries, concurrency=2))))
+
+    assert archive.testzip() is None
+    assert sorted(archive.namelist()) == sorted(entry.filename for entry in entries)
+    for entry in entries:
+        assert archive.read(entry.filename) == renderer.image_cache.get(entry.qr_code.id, entry.render)
+
+
+async def test_stream_zip_waits_for_busy_pool(renderer):
+    renderer.render_pool.max_pending = 0
+    qr_code = QrCode(user_id=uuid.uuid4(), name='test', link='https://example.com')
+    entries = [ExportEntry(qr_code, qr_code.render_params())]
+    export = asyncio.create_task(collect(stream_zip(renderer, entries, concurrency=1)))
+    await asyncio.sleep(0.3)
+    assert not export.done()
+
+    renderer.render_pool.max_pending = 1
+    archive = zipfile.ZipFile(io.BytesIO(await export))
+    assert archive.namelist() == [entries[0].filename]
+
+
+def test_filename_is_safe_and_unique():
+    qr_code = QrCode(user_id=uuid.uuid4(), name='../menu: "bar"', link='https://example.com')
+    filename = ExportEntry(qr_code, qr_code.render_params('svg')).filename
+    assert '/' not in filename and ':' not in filename
+    assert filename.endswith(f'-{qr_code.id.hex[:8]}.svg')
+
+
+def test_export_endpoint_streams_zip(test_client):
+    response = test_client.post('/user/register', json={'username': 'exporter', 'password': 'pw12345678'})
+    headers = {'Authorization': f"Bearer {response.json()['access_token']}"}
+    for name in ('a', 'b', 'c'):
+        test_client.post('/qr_code/', json={'name': name, 'link': 'https://example.com'}, headers=headers)
+
+    response = test_client.get('/qr_code/export.zip?fmt=svg', headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.headers['content-type'] == 'application/zip'
+    names = zipfile.ZipFile(io.BytesIO(response.content)).namelist()
+    assert sorted(name.split('-')[0] for name in names) == ['a', 'b', 'c']
@@ -0,0 +1,62 @@
+import io
+
+import pytest
+from PIL import Image
+
+from qr_code.models import QR_STYLES, QrRender, render_qr_bytes, render_qr_image
+from qr_code.router import header_qualities, negotiate_image_format
+
+DATA = 'https://example.com/webp'
+BROWSER_ACCEPT = 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8'
+
+
+@pytest.mark.parametrize('style', QR_STYLES)
+@pytest.mark.parametrize('fill_color2', [None, '#1D4ED8'])
+def test_webp_is_lossless(style, fill_color2):
+    webp = render_qr_bytes(QrRender(DATA, '#2A5E8C', fill_color2, '#F5EFE6', style, fmt='webp'))
+    image = Image.open(io.BytesIO(webp))
+    assert image.format == 'WEBP'
+    expected = render_qr_image(DATA, '#2A5E8C', fill_color2, '#F5EFE6', style).convert('RGB')
+    assert image.convert('RGB').tobytes() == expected.tobytes()
+
+
+def test_header_qualities():
+    assert header_qualities('image/webp, image/png;q=0.5, */*;q=0') == {
+        'image/webp': 1.0,
+        'image/png': 0.5,
+        '*/*': 0.0,
+    }
+    assert header_qualities(None) == {}
+
+
+@pytest.mark.parametrize(
+    'accept, fmt',
+    [(BROWSER_ACCEPT, 'webp'), ('image/webp;q=0', 'png'), ('*/*', 'png'), (None, 'png')],
+)
+def test_negotiate_image_format(accept, fmt):
+    assert negotiate_image_format(accept) == fmt
+
+
+@pytest.fixture
+def qr_code_id(test_client):
+    response = test_client.post('/user/register', json={'username': 'negotiator', 'password': 'pw12345678'})
+    headers = {'Authorization': f"Bearer {response.json()['access_token']}"}
+    response = test_client.post('/qr_code/', json={'name': 'test', 'link': 'https://example.com'}, headers=headers)
+    return response.json()['id']
+
+
+def test_omitted_fmt_is_negotiated_and_varies_on_accept(test_client, qr_code_id):
+    url = f'/qr_code/{qr_code_id}/image'
+    webp = test_client.get(url, headers={'Accept': BROWSER_ACCEPT})
+    png = test_client.get(url, headers={'Accept': '*/*'})
+
+    assert webp.headers['content-type'] == 'image/webp'
+    assert png.headers['content-type'] == 'image/png'
+    assert webp.headers['vary'] == png.headers['vary'] == 'Accept'
+    assert webp.headers['etag'] != png.headers['etag']
+
+
+def test_explicit_fmt_does_not_vary_on_accept(test_client, qr_code_id):
+    response = test_client.get(f'/qr_code/{qr_code_id}/image?fmt=webp', headers={'Accept': 'image/png'})
+    assert response.headers['content-type'] == 'image/webp'
+    assert 'vary' not in response.headers
@@ -0,0 +1,104 @@
+import gzip
+import uuid
+
+import pytest
+
+from qr_code.disk_cache import DiskImageCache
+from qr_code.image_cache import RenderedImageCache
+from qr_code.models import QrRender
+from qr_code.render_pool import RenderPool
+from qr_code.rendering import ImageRenderer
+
+
+def render(box_size=10, fmt='png'):
+    return QrRender(
+        data='https://example.com',
+        fill_color='#000000',
+        fill_color2=None,
+        back_color='#ffffff',
+        style='square',
+        fmt=fmt,
+        box_size=box_size,
+    )
+
+
+def test_get_returns_stored_bytes():
+    cache = RenderedImageCache(max_bytes=100)
+    qr_code_id = uuid.uuid4()
+    cache.put(qr_code_id, render(), b'png')
+    assert cache.get(qr_code_id, render()) == b'png'
+    assert cache.get(qr_code_id, render(box_size=20)) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evicts_least_recently_used_over_budget():
+    cache = RenderedImageCache(max_bytes=10)
+    qr_code_id = uuid.uuid4()
+    cache.put(qr_code_id, render(4), b'x' * 4)
+    cache.put(qr_code_id, render(5), b'x' * 4)
+    cache.get(qr_code_id, render(4))  # touch: render(5) becomes the oldest
+    cache.put(qr_code_id, render(6), b'x' * 4)
+    assert cache.get(qr_code_id, render(5)) is None
+    assert cache.get(qr_code_id, render(4)) is not None
+    assert cache.size == 8
+
+
+def test_oversized_entry_is_not_stored():
+    cache = RenderedImageCache(max_bytes=3)
+    cache.put(uuid.uuid4(), render(), b'toolarge')
+    assert len(cache) == 0
+    assert cache.size == 0
+
+
+def test_invalidate_drops_every_variant_of_a_code():
+    cache = RenderedImageCache(max_bytes=100)
+    qr_code_id, other_id = uuid.uuid4(), uuid.uuid4()
+    cache.put(qr_code_id, render(), b'png')
+    cache.put(qr_code_id, render(fmt='svg'), b'<svg/>')
+    cache.put(other_id, render(), b'png')
+    cache.invalidate(qr_code_id)
+    assert len(cache) == 1
+    assert cache.size == 3
+    assert cache.get(other_id, render()) == b'png'
+
+
+@pytest.fixture
+def auth_headers(test_client):
+    response = test_client.post('/user/register', json={'username': 'cacher', 'password': 'pw12345678'})
+    assert response.status_code == 200, response.json()
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+
+def test_edit_invalidates_cached_image(test_client, auth_headers):
+    payload = {'name': 'cached', 'link': 'https://example.com'}
+    qr_code = test_client.post('/qr_code/', json=payload, headers=auth_headers).json()
+    before = test_client.get(f"/qr_code/{qr_code['id']}/image").content
+    assert test_client.get(f"/qr_code/{qr_code['id']}/image").content == before
+
+    response = test_client.put(f"/qr_code/{qr_code['id']}", json={**payload, 'style': 'dots'}, headers=auth_headers)
+    assert response.status_code == 200, response.json()
+    assert test_client.get(f"/qr_code/{qr_code['id']}/image").content != before
+
+
+def test_encodings_are_separate_entries_invalidated_together():
+    cache = RenderedImageCache(max_bytes=100)
+    qr_code_id = uuid.uuid4()
+    cache.put(qr_code_id, render(fmt='svg'), b'<svg/>')
+    cache.put(qr_code_id, render(fmt='svg'), b'gz', encoding='gzip')
+    assert cache.get(qr_code_id, render(fmt='svg')) == b'<svg/>'
+    assert cache.get(qr_code_id, render(fmt='svg'), encoding='gzip') == b'gz'
+    cache.invalidate(qr_code_id)
+    assert len(cache) == 0
+    assert cache.size == 0
+
+
+async def test_svg_render_caches_precompressed_copy():
+    renderer = ImageRenderer(RenderedImageCache(10**7), DiskImageCache(None, 0), RenderPool(workers=0, max_pending=1))
+    qr_code_id = uuid.uuid4()
+    svg = render(fmt='svg')
+    compressed = await renderer.get(qr_code_id, svg, 'gzip')
+    assert isinstance(compressed, bytes)
+
+    assert gzip.decompress(compressed) == renderer.image_cache.get(qr_code_id, svg)
+    assert await renderer.get(qr_code_id, svg) == gzip.decompress(compressed)
+    assert renderer.render_pool.rendered == 1
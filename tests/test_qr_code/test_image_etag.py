@@ -0,0 +1,93 @@
+import pytest
+
+from core.settings import settings
+
+
+@pytest.fixture
+def auth_headers(test_client):
+    response = test_client.post('/user/register', json={'username': 'etagger', 'password': 'pw12345678'})
+    assert response.status_code == 200, response.json()
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def qr_code(test_client, auth_headers):
+    response = test_client.post('/qr_code/', json={'name': 'test', 'link': 'https://example.com'}, headers=auth_headers)
+    assert response.status_code == 200, response.json()
+    return response.json()
+
+
+def test_image_has_strong_etag(test_client, qr_code):
+    response = test_client.get(f"/qr_code/{qr_code['id']}/image")
+    etag = response.headers['etag']
+    assert etag.startswith('"') and not etag.startswith('W/')
+    assert response.headers['cache-control'] == 'public, no-cache'
+    assert test_client.get(f"/qr_code/{qr_code['id']}/image").headers['etag'] == etag
+
+
+def test_matching_if_none_match_answers_304(test_client, qr_code):
+    etag = test_client.get(f"/qr_code/{qr_code['id']}/image?fmt=svg").headers['etag']
+    response = test_client.get(
+        f"/qr_code/{qr_code['id']}/image?fmt=svg", headers={'If-None-Match': f'"other", W/{etag}'}
+    )
+    assert response.status_code == 304
+    assert response.content == b''
+    assert response.headers['etag'] == etag
+
+
+def test_etag_depends_on_format_scale_and_style(test_client, auth_headers, qr_code):
+    url = f"/qr_code/{qr_code['id']}/image"
+    etags = {test_client.get(url + query).headers['etag'] for query in ('', '?scale=20', '?fmt=svg')}
+    assert len(etags) == 3
+
+    before = test_client.get(url).headers['etag']
+    test_client.put(
+        f"/qr_code/{qr_code['id']}",
+        json={'name': 'test', 'link': 'https://example.com', 'style': 'rounded'},
+        headers=auth_headers,
+    )
+    response = test_client.get(url, headers={'If-None-Match': before})
+    assert response.status_code == 200
+    assert response.headers['etag'] != before
+
+
+def test_only_the_current_version_is_immutable(test_client, auth_headers, qr_code):
+    url = f"/qr_code/{qr_code['id']}/image?v={qr_code['image_version']}"
+    assert 'immutable' in test_client.get(url).headers['cache-control']
+    assert 'immutable' in test_client.get(url + '&fmt=svg').headers['cache-control']
+    response = test_client.get(f"/qr_code/{qr_code['id']}/image?v=000000ffffffsquare")
+    assert response.headers['cache-control'] == 'public, no-cache'
+
+    edited = test_client.put(
+        f"/qr_code/{qr_code['id']}",
+        json={'name': 'test', 'link': 'https://example.com', 'style': 'dots'},
+        headers=auth_headers,
+    ).json()
+    assert edited['image_version'] != qr_code['image_version']
+    assert test_client.get(url).headers['cache-control'] == 'public, no-cache'
+
+
+def test_ecc_target_settings_change_the_etag(test_client, qr_code, monkeypatch):
+    url = f"/qr_code/{qr_code['id']}/image"
+    etag = test_client.get(url).headers['etag']
+    monkeypatch.setitem(settings.QR_ECC_TARGETS, 'square', 'H')
+    response = test_client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['etag'] != etag
+
+
+def test_unknown_code_image_404(test_client):
+    response = test_client.get('/qr_code/00000000-0000-0000-0000-000000000000/image')
+    assert response.status_code == 404
+
+
+def test_svg_is_served_precompressed(test_client, qr_code):
+    url = f"/qr_code/{qr_code['id']}/image?fmt=svg"
+    compressed = test_client.get(url, headers={'Accept-Encoding': 'gzip'})
+    plain = test_client.get(url, headers={'Accept-Encoding': 'identity'})
+
+    assert compressed.headers['content-encoding'] == 'gzip'
+    assert 'content-encoding' not in plain.headers
+    assert compressed.headers['vary'] == 'Accept-Encoding'
+    assert compressed.content == plain.content  # decoded by the client
+    assert compressed.headers['etag'] != plain.headers['etag']
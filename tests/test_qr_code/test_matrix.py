@@ -0,0 +1,94 @@
+import random
+import string
+
+import numpy as np
+import pytest
+import qrcode.constants
+import qrcode.main
+
+from qr_code import matrix as matrix_module
+from qr_code.encoding import encode, fit_version
+from qr_code.matrix import ERROR_CORRECTION_LEVELS, fit_qr_matrix, get_qr_matrix
+from qr_code.models import ecc_target, render_qr_image, render_qr_svg
+
+DATA = 'https://example.com/matrix'
+
+
+def test_matrix_is_cached_and_read_only():
+    matrix = get_qr_matrix(DATA)
+    assert get_qr_matrix(DATA) is matrix
+    assert matrix.size == matrix.version * 4 + 17
+    with pytest.raises(ValueError):
+        matrix.modules[0, 0] = False
+
+
+def test_renders_reuse_the_cached_matrix(monkeypatch):
+    get_qr_matrix(DATA, qrcode.constants.ERROR_CORRECT_M)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('encoder must not run again')
+
+    monkeypatch.setattr(matrix_module, 'encode', fail)
+    small = render_qr_image(DATA, '#000000', None, '#ffffff', 'square', box_size=4)
+    big = render_qr_image(DATA, '#2A5E8C', None, '#ffffff', 'dots', box_size=8)
+    assert big.size[0] == 2 * small.size[0]
+    assert b'<svg' in render_qr_svg(DATA, '#000000', None, '#ffffff', 'rounded')
+
+
+def random_link(rng: random.Random) -> str:
+    alphabet = string.ascii_letters + string.digits + "-._~/?#[]@!$&'()*+,;=%"
+    length = rng.choice([1, 10, 40, 120, 300, 700])
+    return f"https://{rng.choice(['example.com', 'a.io', 'EXAMPLE.COM'])}/" + ''.join(
+        rng.choice(alphabet) for _ in range(rng.randint(0, length))
+    )
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_encoder_matches_qrcode_make(seed):
+    rng = random.Random(seed)
+    for _ in range(5):
+        data = random_link(rng)
+        error_correction = rng.choice(
+            [
+                qrcode.constants.ERROR_CORRECT_L,
+                qrcode.constants.ERROR_CORRECT_M,
+                qrcode.constants.ERROR_CORRECT_Q,
+                qrcode.constants.ERROR_CORRECT_H,
+            ]
+        )
+        qr = qrcode.main.QRCode(version=None, error_correction=error_correction)
+        qr.add_data(data)
+        qr.make(fit=True)
+
+        version, modules = encode(data, error_correction)
+        assert version == qr.version
+        assert np.array_equal(modules, np.array(qr.modules, dtype=bool))
+
+
+@pytest.mark.parametrize('min_level', list(ERROR_CORRECTION_LEVELS))
+@pytest.mark.parametrize('data', [DATA, 'https://qr.example.com/qr_code/0b5a4d1c-8a5f-4a7e-9d0e-3c2f1a2b3c4d'])
+def test_fitted_matrix_has_the_smallest_version_and_strongest_level(min_level, data):
+    levels = list(ERROR_CORRECTION_LEVELS)
+    matrix = fit_qr_matrix(data, min_level)
+    level = next(name for name, value in ERROR_CORRECTION_LEVELS.items() if value == matrix.error_correction)
+
+    assert matrix.version == fit_version(data, ERROR_CORRECTION_LEVELS[min_level])
+    assert levels.index(level) >= levels.index(min_level)
+    if level != 'H':
+        stronger = levels[levels.index(level) + 1]
+        assert fit_version(data, ERROR_CORRECTION_LEVELS[stronger]) > matrix.version
+    assert fit_qr_matrix(data, min_level) is matrix
+
+
+def test_ecc_target_depends_on_style_and_gradient():
+    assert ecc_target('square', gradient=False) == 'L'
+    assert ecc_target('dots', gradient=False) == 'Q'
+    assert ecc_target('square', gradient=True) == 'Q'
+
+
+def test_rendered_image_reports_the_code():
+    image = render_qr_image(DATA, '#000000', None, '#ffffff', 'square', 4, error_correction='auto')
+    matrix = fit_qr_matrix(DATA, 'L')
+    assert image.info['version'] == matrix.version
+    assert image.info['modules'] == matrix.size
+    assert image.info['error_correction'] in ('L', 'M', 'Q', 'H')
@@ -0,0 +1,63 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from core.settings import settings
+from qr_code import raster
+from qr_code.models import QR_STYLES, QrRender, render_qr_bytes, render_qr_image
+
+DATA = 'https://example.com/palette'
+
+
+def bit_depth(png: bytes) -> int:
+    return png[24]  # IHDR bit depth
+
+
+def decode(png: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(png))
+
+
+@pytest.mark.parametrize('engine', ['numpy', 'qrcode'])
+def test_square_is_a_two_colour_one_bit_png(monkeypatch, engine):
+    monkeypatch.setattr(settings, 'QR_RENDER_ENGINE', engine)
+    png = render_qr_bytes(QrRender(DATA, '#2A5E8C', None, '#F5EFE6', 'square'))
+    assert decode(png).mode == 'P'
+    assert bit_depth(png) == 1
+    colors = decode(png).convert('RGB').getcolors()
+    expected = render_qr_image(DATA, '#2A5E8C', None, '#F5EFE6', 'square').convert('RGB').getcolors()
+    assert colors is not None and expected is not None
+    assert sorted(colors) == sorted(expected)
+
+
+@pytest.mark.parametrize('style', QR_STYLES)
+def test_solid_fill_png_decodes_to_the_rendered_pixels(style):
+    png = render_qr_bytes(QrRender(DATA, '#2A5E8C', None, '#F5EFE6', style))
+    expected = render_qr_image(DATA, '#2A5E8C', None, '#F5EFE6', style).convert('RGB')
+    assert decode(png).mode == 'P'
+    assert decode(png).convert('RGB').tobytes() == expected.tobytes()
+
+
+def test_gradient_stays_rgb():
+    png = render_qr_bytes(QrRender(DATA, '#000000', '#1D4ED8', '#ffffff', 'dots'))
+    assert decode(png).mode == 'RGB'
+
+
+def test_to_palette_is_exact_and_gives_up_past_256_colours():
+    image = render_qr_image(DATA, '#2A5E8C', None, '#F5EFE6', 'dots').convert('RGB')
+    palette_image = raster.to_palette(image)
+    assert palette_image is not None
+    assert palette_image.convert('RGB').tobytes() == image.tobytes()
+    noise = Image.fromarray(np.random.default_rng(0).integers(0, 256, (32, 32, 3), dtype=np.uint8), 'RGB')
+    assert raster.to_palette(noise) is None
+
+
+@pytest.mark.parametrize('strategy', ['filtered', 'huffman_only', 'rle', 'fixed'])
+def test_zlib_settings_are_applied(monkeypatch, strategy):
+    expected = render_qr_bytes(QrRender(DATA, '#2A5E8C', None, '#F5EFE6', 'rounded'))
+    monkeypatch.setattr(settings, 'QR_PNG_COMPRESS_LEVEL', 1)
+    monkeypatch.setattr(settings, 'QR_PNG_COMPRESS_STRATEGY', strategy)
+    png = render_qr_bytes(QrRender(DATA, '#2A5E8C', None, '#F5EFE6', 'rounded'))
+    assert png != expected
+    assert decode(png).tobytes() == decode(expected).tobytes()
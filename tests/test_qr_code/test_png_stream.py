@@ -0,0 +1,113 @@
+import io
+import uuid
+
+import pytest
+from PIL import Image
+
+from core.settings import settings
+from qr_code.disk_cache import DiskImageCache
+from qr_code.errors import RenderPoolBusyError
+from qr_code.image_cache import RenderedImageCache
+from qr_code.models import QR_STYLES, QrRender, render_qr_image
+from qr_code.png_stream import iter_png, may_stream, should_stream
+from qr_code.render_pool import RenderPool
+from qr_code.rendering import ImageRenderer
+
+DATA = 'https://example.com/stream'
+
+
+def decode(chunks) -> Image.Image:
+    image = Image.open(io.BytesIO(b''.join(chunks)))
+    image.load()
+    return image
+
+
+@pytest.mark.parametrize('style', QR_STYLES)
+@pytest.mark.parametrize('fill_color2', [None, '#1D4ED8'])
+@pytest.mark.parametrize('box_size', [4, 7])
+def test_streamed_png_has_the_rendered_pixels(style, fill_color2, box_size):
+    render = QrRender(DATA, '#2A5E8C', fill_color2, '#F5EFE6', style, box_size=box_size)
+    expected = render_qr_image(DATA, '#2A5E8C', fill_color2, '#F5EFE6', style, box_size).convert('RGB')
+    image = decode(iter_png(render))
+    assert image.mode == ('RGB' if fill_color2 else 'P')
+    assert image.convert('RGB').tobytes() == expected.tobytes()
+
+
+def test_two_colour_stream_is_one_bit():
+    png = b''.join(iter_png(QrRender(DATA, '#000000', None, '#ffffff', 'square')))
+    assert png[24] == 1
+
+
+def test_only_large_pngs_are_streamed(monkeypatch):
+    monkeypatch.setattr(settings, 'QR_PNG_STREAM_MIN_PIXELS', 1000 * 1000)
+    assert should_stream(QrRender(DATA, '#000000', None, '#ffffff', 'square', box_size=40))
+    assert not should_stream(QrRender(DATA, '#000000', None, '#ffffff', 'square', box_size=10))
+    assert not should_stream(QrRender(DATA, '#000000', None, '#ffffff', 'square', fmt='webp', box_size=40))
+
+
+def test_default_box_size_is_never_streamed():
+    assert not may_stream(QrRender(DATA, '#000000', None, '#ffffff', 'square', box_size=10))
+    assert may_stream(QrRender(DATA, '#000000', None, '#ffffff', 'square', box_size=40))
+
+
+@pytest.fixture
+def renderer(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, 'QR_PNG_STREAM_MIN_PIXELS', 0)
+    return ImageRenderer(
+        RenderedImageCache(10**7), DiskImageCache(tmp_path, 10**7), RenderPool(workers=0, max_pending=1)
+    )
+
+
+async def test_renderer_streams_into_the_disk_cache(renderer):
+    render = QrRender(DATA, '#2A5E8C', None, '#F5EFE6', 'dots')
+    chunks = await renderer.get(uuid.uuid4(), render)
+    assert renderer.render_pool.pending == 1  # a slot is held while streaming
+    content = b''.join([chunk async for chunk in chunks])
+
+    assert renderer.disk_cache.get(render).read_bytes() == content
+    assert renderer.render_pool.rendered == 0
+    assert renderer.render_pool.pending == 0
+    assert renderer.metrics()['streamed'] == 1
+
+
+async def test_interrupted_stream_leaves_no_disk_copy(renderer, tmp_path):
+    render = QrRender(DATA, '#2A5E8C', None, '#F5EFE6', 'rounded')
+    chunks = await renderer.get(uuid.uuid4(), render)
+    await anext(chunks)
+    await chunks.aclose()  # client went away
+
+    assert renderer.disk_cache.get(render) is None
+    assert not list(tmp_path.glob('*/*.tmp'))
+    assert renderer.render_pool.pending == 0
+
+
+async def test_stream_is_refused_while_the_pool_is_full(renderer):
+    render = QrRender(DATA, '#2A5E8C', None, '#F5EFE6', 'square')
+    chunks = await renderer.get(uuid.uuid4(), render)
+    with pytest.raises(RenderPoolBusyError):
+        await renderer.get(uuid.uuid4(), render)
+    assert renderer.render_pool.rejected == 1
+
+    await chunks.aclose()
+    assert decode([chunk async for chunk in await renderer.get(uuid.uuid4(), render)]).size[0] > 0
+
+
+def test_default_threshold_streams_only_long_payloads(test_client, container, monkeypatch):
+    response = test_client.post('/user/register', json={'username': 'streamer', 'password': 'pw12345678'})
+    headers = {'Authorization': f"Bearer {response.json()['access_token']}"}
+    renderer = test_client.portal.call(container.get, ImageRenderer)
+
+    def download(qr_code):
+        response = test_client.get(f"/qr_code/{qr_code['id']}/image?fmt=png&scale=40")
+        assert response.status_code == 200
+        return decode([response.content])
+
+    # a short /r/ url at the largest scale is still rendered in one piece
+    short = test_client.post('/qr_code/', json={'name': 'short', 'link': 'https://example.com'}, headers=headers)
+    assert download(short.json()).size[0] ** 2 <= settings.QR_PNG_STREAM_MIN_PIXELS
+    assert renderer.metrics()['streamed'] == 0
+
+    monkeypatch.setattr(settings, 'API_URL', 'qr.' + 'x' * 200 + '.example.com')
+    long = test_client.post('/qr_code/', json={'name': 'long', 'link': 'https://example.com'}, headers=headers)
+    assert download(long.json()).size[0] ** 2 > settings.QR_PNG_STREAM_MIN_PIXELS
+    assert renderer.metrics()['streamed'] == 1
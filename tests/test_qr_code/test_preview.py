@@ -0,0 +1,39 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from qr_code.models import QR_STYLES, QrRender, render_qr_bytes
+from qr_code.preview import PREVIEW_DATA, render_preview
+
+
+def pixels(png: bytes) -> np.ndarray:
+    return np.asarray(Image.open(io.BytesIO(png)).convert('RGB')).astype(int)
+
+
+@pytest.mark.parametrize('style', QR_STYLES)
+@pytest.mark.parametrize('fill_color2', [None, '#7C2D12'])
+@pytest.mark.parametrize('back_color', ['#ffffff', '#F5EFE6'])
+def test_preview_looks_like_the_real_render(style, fill_color2, back_color):
+    preview = pixels(render_preview('#2A5E8C', fill_color2, back_color, style, 'auto', 6))
+    real = pixels(
+        render_qr_bytes(
+            QrRender(PREVIEW_DATA, '#2A5E8C', fill_color2, back_color, style, box_size=6, error_correction='auto')
+        )
+    )
+    assert preview.shape == real.shape
+    # quantized gradient steps and coverage taken from a white canvas: off by a few levels at most
+    assert np.abs(preview - real).max() <= 8
+
+
+def test_solid_square_preview_is_exact():
+    preview = render_preview('#2A5E8C', None, '#F5EFE6', 'square', 'M', 6)
+    real = render_qr_bytes(QrRender(PREVIEW_DATA, '#2A5E8C', None, '#F5EFE6', 'square', box_size=6))
+    assert np.array_equal(pixels(preview), pixels(real))
+
+
+def test_previews_are_cached_per_style():
+    first = render_preview('#2A5E8C', '#7C2D12', '#ffffff', 'dots', 'auto', 6)
+    assert render_preview('#2A5E8C', '#7C2D12', '#ffffff', 'dots', 'auto', 6) is first
+    assert render_preview('#2A5E8C', '#7C2D13', '#ffffff', 'dots', 'auto', 6) != first
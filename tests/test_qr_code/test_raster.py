@@ -0,0 +1,47 @@
+import pytest
+
+from core.settings import settings
+from qr_code import raster
+from qr_code.models import QR_STYLES, render_qr_image
+
+DATA = 'https://example.com/raster'
+COLORS = [
+    ('#000000', '#ffffff'),
+    ('#2A5E8C', '#F5EFE6'),
+    ('#00ff00', '#0000aa'),  # zero channels in the background take the mask's edge case
+]
+
+
+def render(engine, monkeypatch, *args):
+    monkeypatch.setattr(settings, 'QR_RENDER_ENGINE', engine)
+    return render_qr_image(DATA, *args)
+
+
+@pytest.mark.parametrize('style', QR_STYLES)
+@pytest.mark.parametrize('fill_color, back_color', COLORS)
+@pytest.mark.parametrize('box_size', [4, 5, 10])
+def test_numpy_engine_matches_qrcode_pixel_for_pixel(monkeypatch, style, fill_color, back_color, box_size):
+    expected = render('qrcode', monkeypatch, fill_color, None, back_color, style, box_size)
+    actual = render('numpy', monkeypatch, fill_color, None, back_color, style, box_size)
+    assert actual.size == expected.size
+    assert actual.mode == 'P'
+    assert actual.convert('RGB').tobytes() == expected.tobytes()
+
+
+@pytest.mark.parametrize('style', QR_STYLES)
+@pytest.mark.parametrize(
+    'fill_color, fill_color2, back_color', [('#000000', '#1D4ED8', '#ffffff'), ('#2A5E8C', '#7C2D12', '#F5EFE6')]
+)
+@pytest.mark.parametrize('box_size', [4, 5])
+def test_numpy_gradient_matches_qrcode_pixel_for_pixel(
+    monkeypatch, style, fill_color, fill_color2, back_color, box_size
+):
+    expected = render('qrcode', monkeypatch, fill_color, fill_color2, back_color, style, box_size)
+    actual = render('numpy', monkeypatch, fill_color, fill_color2, back_color, style, box_size)
+    assert actual.tobytes() == expected.tobytes()
+
+
+def test_uncached_gradient_bands_match_cached_field(monkeypatch):
+    cached = render_qr_image(DATA, '#000000', '#1D4ED8', '#ffffff', 'dots', 6)
+    monkeypatch.setattr(raster, 'GRADIENT_CACHE_MAX_WIDTH', 0)
+    assert render_qr_image(DATA, '#000000', '#1D4ED8', '#ffffff', 'dots', 6).tobytes() == cached.tobytes()
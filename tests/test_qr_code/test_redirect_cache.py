@@ -0,0 +1,146 @@
+import time
+import uuid
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.exc import OperationalError
+
+from qr_code.models import QrCodeChange, RedirectTarget
+from qr_code.redirect_cache import RedirectCache
+from qr_code.services import QrCodeService
+
+
+@pytest.fixture
+def auth_headers(test_client):
+    response = test_client.post('/user/register', json={'username': 'redirector', 'password': 'pw12345678'})
+    assert response.status_code == 200, response.json()
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+
+@pytest_asyncio.fixture
+async def qr_code_service(request_container) -> QrCodeService:
+    return await request_container.get(QrCodeService)
+
+
+def target(link='https://example.com'):
+    return RedirectTarget(uuid.uuid4(), link)
+
+
+async def no_changes(_since_ts):
+    return []
+
+
+def test_cache_is_lru_bounded():
+    cache = RedirectCache(max_entries=2, ttl=60, max_staleness=60)
+    a, b, c = target(), target(), target()
+    for t in (a, b):
+        cache.put(t.qr_code_id, t, time.monotonic())
+    assert cache.get(a.qr_code_id) == a  # b is now the least recently used
+    cache.put(c.qr_code_id, c, time.monotonic())
+    assert cache.get(b.qr_code_id) is None
+    assert cache.get(a.qr_code_id) == a and cache.get(c.qr_code_id) == c
+
+
+def test_entries_expire_after_ttl():
+    cache = RedirectCache(max_entries=10, ttl=1, max_staleness=60)
+    t = target()
+    cache.put(t.qr_code_id, t, time.monotonic() - 2)
+    assert cache.get(t.qr_code_id) is None
+    assert len(cache) == 0
+
+
+async def test_old_entries_need_a_recent_sync():
+    cache = RedirectCache(max_entries=10, ttl=60, max_staleness=1)
+    t = target()
+    cache.put(t.qr_code_id, t, time.monotonic() - 2)
+    assert cache.get(t.qr_code_id) is None  # never synced: older than the bound is not trusted
+
+    await cache.sync(no_changes)
+    cache.put(t.qr_code_id, t, time.monotonic() - 2)
+    assert cache.get(t.qr_code_id) == t
+
+
+def test_invalidate_evicts_every_key_of_the_code():
+    cache = RedirectCache(max_entries=10, ttl=60, max_staleness=60)
+    t = target()
+    cache.put(t.qr_code_id, t, time.monotonic())
+    cache.put('slug123', t, time.monotonic())
+    cache.invalidate(t.qr_code_id)
+    assert cache.get(t.qr_code_id) is None and cache.get('slug123') is None
+    assert len(cache) == 0
+
+
+def test_read_that_raced_an_invalidation_is_not_cached():
+    cache = RedirectCache(max_entries=10, ttl=60, max_staleness=60)
+    t = target()
+    read_at = time.monotonic()
+    cache.invalidate(t.qr_code_id)
+    cache.put(t.qr_code_id, t, read_at)
+    assert cache.get(t.qr_code_id) is None
+
+
+async def test_sync_evicts_changed_codes_once():
+    cache = RedirectCache(max_entries=10, ttl=60, max_staleness=60)
+    t = target()
+    cache.put(t.qr_code_id, t, time.monotonic())
+    change = QrCodeChange(qr_code_id=t.qr_code_id, ts=time.time_ns() // 1_000_000)
+    seen_since = []
+
+    async def get_changes(since_ts):
+        seen_since.append(since_ts)
+        return [change]
+
+    await cache.sync(get_changes)
+    assert cache.get(t.qr_code_id) is None
+    assert not cache.sync_due()
+
+    cache.put(t.qr_code_id, t, time.monotonic())
+    await cache.sync(get_changes)  # the same change comes back within the lookback
+    assert cache.get(t.qr_code_id) == t
+    assert seen_since[1] <= change.ts
+
+
+async def test_change_through_another_worker_is_seen_on_sync(qr_code_service, session):
+    qr_code = await qr_code_service.create_qr_code(uuid.uuid4(), 'test', 'https://example.com')
+    assert (await qr_code_service.get_redirect(qr_code.id)).link == 'https://example.com'
+
+    other_worker = RedirectCache(max_entries=10, ttl=60, max_staleness=60)
+    await other_worker.sync(qr_code_service.qr_code_change_repo.get_since)
+    other_worker.put(qr_code.id, RedirectTarget(qr_code.id, 'https://example.com'), time.monotonic())
+
+    await qr_code_service.update_qr_code(qr_code.user_id, qr_code.id, 'test', 'https://example.org')
+    await session.commit()
+    assert (await qr_code_service.get_redirect(qr_code.id)).link == 'https://example.org'
+
+    assert other_worker.get(qr_code.id) is not None
+    await other_worker.sync(qr_code_service.qr_code_change_repo.get_since)
+    assert other_worker.get(qr_code.id) is None
+
+
+def test_edit_changes_the_redirect_right_away(test_client, auth_headers):
+    response = test_client.post('/qr_code/', json={'name': 'test', 'link': 'https://example.com'}, headers=auth_headers)
+    qr_code = response.json()
+    for url in (f"/qr_code/{qr_code['id']}", f"/r/{qr_code['slug']}"):
+        assert test_client.get(url, follow_redirects=False).headers['location'] == 'https://example.com'
+
+    test_client.put(
+        f"/qr_code/{qr_code['id']}", json={'name': 'test', 'link': 'https://example.org'}, headers=auth_headers
+    )
+    for url in (f"/qr_code/{qr_code['id']}", f"/r/{qr_code['slug']}"):
+        assert test_client.get(url, follow_redirects=False).headers['location'] == 'https://example.org'
+
+    test_client.delete(f"/qr_code/{qr_code['id']}", headers=auth_headers)
+    assert test_client.get(f"/r/{qr_code['slug']}", follow_redirects=False).status_code == 404
+
+
+async def test_failed_sync_redirects_from_the_database(qr_code_service, monkeypatch):
+    qr_code = await qr_code_service.create_qr_code(uuid.uuid4(), 'test', 'https://example.com')
+    cache = qr_code_service.redirect_cache = RedirectCache(max_entries=10, ttl=60, max_staleness=60)
+    cache.put(qr_code.id, RedirectTarget(qr_code.id, 'https://stale.example.com'), time.monotonic())
+
+    async def broken(_since_ts):
+        raise OperationalError('SELECT', {}, Exception('database is locked'))
+
+    monkeypatch.setattr(qr_code_service.qr_code_change_repo, 'get_since', broken)
+    assert (await qr_code_service.get_redirect(qr_code.id)).link == 'https://example.com'
+    assert cache.metrics()['sync_failures'] == 1
@@ -0,0 +1,50 @@
+import pytest
+
+from qr_code.errors import RenderPoolBusyError
+from qr_code.models import QrRender
+from qr_code.render_pool import RenderPool
+
+RENDER = QrRender(
+    data='https://example.com', fill_color='#000000', fill_color2=None, back_color='#ffffff', style='square'
+)
+
+
+async def test_render_returns_png_bytes():
+    pool = RenderPool(workers=0, max_pending=1)
+    content = await pool.render(RENDER)
+    assert content.startswith(b'\x89PNG')
+    assert pool.metrics()['rendered'] == 1
+    assert pool.metrics()['pending'] == 0
+
+
+async def test_saturated_pool_rejects():
+    pool = RenderPool(workers=0, max_pending=0)
+    with pytest.raises(RenderPoolBusyError):
+        await pool.render(RENDER)
+    assert pool.metrics()['rejected'] == 1
+
+
+def test_saturated_pool_answers_503(test_client, container):
+    register = test_client.post('/user/register', json={'username': 'renderer', 'password': 'pw12345678'})
+    headers = {'Authorization': f"Bearer {register.json()['access_token']}"}
+    qr_code = test_client.post('/qr_code/', json={'name': 'test', 'link': 'https://example.com'}, headers=headers)
+    pool = test_client.portal.call(container.get, RenderPool)
+    pool.max_pending = 0
+
+    # a scale nothing has warmed
+    response = test_client.get(f"/qr_code/{qr_code.json()['id']}/image?fmt=png&scale=13")
+    assert response.status_code == 503, response.text
+    assert response.json()['error_code'] == 'qr_code.0003'
+
+
+def test_metrics_endpoint(test_client):
+    response = test_client.get('/metrics/qr_code')
+    assert response.status_code == 200, response.text
+    assert set(response.json()) == {
+        'render_pool',
+        'image_cache',
+        'renderer',
+        'redirect_cache',
+        'scan_journal',
+        'scan_retention',
+    }
@@ -0,0 +1,263 @@
+import asyncio
+import os
+import time
+import uuid
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+import qr_code.scan_journal
+from core.settings import settings
+from qr_code.scan_journal import RECORD, SEGMENT_SUFFIX, ScanJournal, pack_record, unpack_records
+from qr_code.services import QrCodeService
+from qr_code.tables import scan_event_table, scan_journal_checkpoint_table
+
+# recent scans, so that the retention job would keep them too
+NOW = int(time.time())
+
+
+@pytest.fixture
+def auth_headers(test_client):
+    response = test_client.post('/user/register', json={'username': 'journal', 'password': 'pw12345678'})
+    assert response.status_code == 200, response.json()
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+
+@pytest_asyncio.fixture
+async def qr_code_service(request_container) -> QrCodeService:
+    return await request_container.get(QrCodeService)
+
+
+@pytest_asyncio.fixture
+async def engine(container) -> AsyncEngine:
+    return await container.get(AsyncEngine)
+
+
+@pytest.fixture
+def journal_dir(tmp_path):
+    return tmp_path / 'journal'
+
+
+def make_journal(engine, directory, **kwargs):
+    return ScanJournal(
+        engine, directory, sync_interval=0.001, apply_interval=60, batch_size=kwargs.pop('batch_size', 100), **kwargs
+    )
+
+
+async def make_qr_code(qr_code_service, session):
+    qr_code = await qr_code_service.create_qr_code(uuid.uuid4(), 'test', 'https://example.com')
+    await session.commit()
+    return qr_code
+
+
+async def stored(qr_code_service, session, qr_code_id):
+    await session.commit()  # fresh read
+    return await qr_code_service.qr_code_repo.get_by_id(qr_code_id)
+
+
+async def count_rows(engine, table):
+    async with engine.connect() as conn:
+        return (await conn.execute(select(func.count()).select_from(table))).scalar_one()
+
+
+def crash(journal):
+    # what a killed worker leaves: the files, unapplied, their locks released
+    for task in journal._tasks:
+        task.cancel()
+    for segment in [*journal._sealed, journal._current]:
+        os.close(segment.fd)
+
+
+def test_records_round_trip_up_to_a_torn_one():
+    a, b = uuid.uuid4(), uuid.uuid4()
+    data = pack_record(a, 100) + pack_record(b, 200)
+    assert unpack_records(data) == [(a, 100), (b, 200)]
+    assert unpack_records(data[:-1]) == [(a, 100)]
+    corrupt = bytearray(data)
+    corrupt[RECORD.size + 3] ^= 0xFF
+    assert unpack_records(bytes(corrupt)) == [(a, 100)]
+
+
+async def test_appended_scans_are_on_disk_and_pending(engine, journal_dir, qr_code_service, session):
+    qr_code = await make_qr_code(qr_code_service, session)
+    journal = make_journal(engine, journal_dir)
+    await journal.start()
+    await asyncio.gather(*(journal.append(qr_code.id, NOW + ts) for ts in (1, 3, 2)))
+
+    [segment] = journal_dir.glob(f"*{SEGMENT_SUFFIX}")
+    assert segment.stat().st_size == 3 * RECORD.size
+    assert journal.pending(qr_code.id) == (3, NOW + 3)
+    assert journal.metrics()['syncs'] == 1  # one group, one fsync
+
+    await journal.apply()
+    assert journal.pending(qr_code.id) == (0, None)
+    stored_qr_code = await stored(qr_code_service, session, qr_code.id)
+    assert (stored_qr_code.scan_count, stored_qr_code.last_scan_at) == (3, NOW + 3)
+    assert await count_rows(engine, scan_event_table) == 3
+
+    await journal.close(timeout=5)
+    assert not any(journal_dir.iterdir())
+    assert await count_rows(engine, scan_journal_checkpoint_table) == 0
+
+
+async def test_applier_runs_once_a_batch_waits(engine, journal_dir, qr_code_service, session):
+    qr_code = await make_qr_code(qr_code_service, session)
+    journal = make_journal(engine, journal_dir, batch_size=3)
+    await journal.start()
+    for _ in range(3):
+        await journal.append(qr_code.id, 100)
+    for _ in range(100):
+        if journal.batches:
+            break
+        await asyncio.sleep(0.01)
+    assert (await stored(qr_code_service, session, qr_code.id)).scan_count == 3
+    await journal.close(timeout=5)
+
+
+async def test_crashed_worker_journal_is_replayed_once(engine, journal_dir, qr_code_service, session):
+    qr_code = await make_qr_code(qr_code_service, session)
+    crashed = make_journal(engine, journal_dir)
+    await crashed.start()
+    for ts in range(3):
+        await crashed.append(qr_code.id, NOW + ts)
+    await crashed.apply()  # checkpointed
+    for ts in range(3, 5):
+        await crashed.append(qr_code.id, NOW + ts)
+    crash(crashed)
+    [segment] = journal_dir.glob(f"*{SEGMENT_SUFFIX}")
+    with segment.open('ab') as file:
+        file.write(pack_record(qr_code.id, NOW + 5)[:-3])  # torn by the crash
+
+    journal = make_journal(engine, journal_dir)
+    await journal.start()
+    await journal.apply()
+    stored_qr_code = await stored(qr_code_service, session, qr_code.id)
+    assert (stored_qr_code.scan_count, stored_qr_code.last_scan_at) == (5, NOW + 4)
+    assert await count_rows(engine, scan_event_table) == 5
+    assert journal.metrics()['replayed_records'] == 2
+    assert not segment.exists()
+    await journal.close(timeout=5)
+
+
+async def test_running_worker_journal_is_not_claimed(engine, journal_dir):
+    running = make_journal(engine, journal_dir)
+    await running.start()
+    await running.append(uuid.uuid4(), 100)
+
+    other = make_journal(engine, journal_dir)
+    await other.start()
+    assert len(other._sealed) == 0
+    await other.close(timeout=5)
+    assert running.backlog == 1
+    await running.close(timeout=5)
+
+
+async def test_full_segment_is_rolled_over_and_deleted_once_applied(engine, journal_dir):
+    journal = make_journal(engine, journal_dir, segment_bytes=2 * RECORD.size)
+    await journal.start()
+    for ts in range(5):
+        await journal.append(uuid.uuid4(), NOW + ts)
+    assert len(list(journal_dir.glob(f"*{SEGMENT_SUFFIX}"))) > 1
+
+    await journal.apply()
+    assert len(list(journal_dir.glob(f"*{SEGMENT_SUFFIX}"))) == 1
+    assert await count_rows(engine, scan_event_table) == 5
+    await journal.close(timeout=5)
+
+
+async def test_failed_write_loses_its_group_only(engine, journal_dir, monkeypatch):
+    journal = make_journal(engine, journal_dir)
+    await journal.start()
+    await journal.append(uuid.uuid4(), 100)
+
+    def broken(fd, data, offset):
+        os.pwrite(fd, data[:5], offset)  # partly written before the error
+        raise OSError('disk full')
+
+    monkeypatch.setattr(qr_code.scan_journal, '_write_durably', broken)
+    await journal.append(uuid.uuid4(), 200)
+    assert journal.metrics()['lost'] == 1
+    monkeypatch.undo()
+
+    await journal.append(uuid.uuid4(), 300)
+    [segment] = journal_dir.glob(f"*{SEGMENT_SUFFIX}")
+    assert [ts for _, ts in unpack_records(segment.read_bytes())] == [100, 300]
+    await journal.close(timeout=5)
+
+
+async def test_full_journal_drops_scans_under_the_drop_policy(engine, journal_dir):
+    journal = make_journal(engine, journal_dir, max_backlog=2, overflow='drop')
+    await journal.start()
+    for ts in range(3):
+        await journal.append(uuid.uuid4(), NOW + ts)
+    assert journal.backlog == 2
+    assert journal.metrics()['dropped'] == 1
+    assert journal.metrics()['peak_backlog'] == 2
+    await journal.close(timeout=5)
+
+
+async def test_full_journal_blocks_until_the_applier_makes_room(engine, journal_dir):
+    journal = make_journal(engine, journal_dir, max_backlog=2)
+    await journal.start()
+    for ts in range(2):
+        await journal.append(uuid.uuid4(), NOW + ts)
+    await asyncio.wait_for(journal.append(uuid.uuid4(), NOW + 2), 5)  # wakes the applier instead of waiting a minute
+    assert journal.metrics()['blocked'] == 1
+    assert journal.metrics()['dropped'] == 0
+    await journal.apply()
+    assert await count_rows(engine, scan_event_table) == 3
+    await journal.close(timeout=5)
+
+
+async def test_blocked_scan_is_dropped_while_the_applier_is_stalled(engine, journal_dir, monkeypatch):
+    journal = make_journal(engine, journal_dir, max_backlog=1, block_timeout=0.05)
+    await journal.start()
+
+    async def stalled(segment):
+        await asyncio.Event().wait()  # as while the database is unreachable
+
+    monkeypatch.setattr(journal, '_apply_batch', stalled)
+    await journal.append(uuid.uuid4(), NOW)
+    await asyncio.wait_for(journal.append(uuid.uuid4(), NOW + 1), 5)
+    assert journal.backlog == 1
+    assert journal.metrics()['blocked'] == 1
+    assert journal.metrics()['dropped'] == 1
+    await journal.close(timeout=0.1)
+
+
+async def test_apply_after_close_does_nothing(engine, journal_dir):
+    journal = make_journal(engine, journal_dir)
+    await journal.start()
+    await journal.close(timeout=5)
+    await journal.apply()
+
+
+async def test_edit_does_not_undo_an_applied_scan(qr_code_service, session):
+    qr_code = await make_qr_code(qr_code_service, session)
+    stale = await qr_code_service.qr_code_repo.get_by_id(qr_code.id)
+    await qr_code_service.register_scan(qr_code.id)
+    await qr_code_service.scan_journal.apply()
+
+    stale.name = 'renamed'
+    await qr_code_service.qr_code_repo.update_and_get(stale)
+    assert (await stored(qr_code_service, session, qr_code.id)).scan_count == 1
+
+
+def test_stats_include_unapplied_scans(test_client, auth_headers, container, monkeypatch):
+    monkeypatch.setattr(settings, 'QR_SCAN_APPLY_INTERVAL_MS', 60_000)
+    qr_code = test_client.post(
+        '/qr_code/', json={'name': 'test', 'link': 'https://example.com'}, headers=auth_headers
+    ).json()
+    journal = test_client.portal.call(container.get, ScanJournal)
+    for _ in range(3):
+        test_client.get(f"/qr_code/{qr_code['id']}", follow_redirects=False)
+    assert journal.pending(uuid.UUID(qr_code['id']))[0] == 3
+    (item,) = test_client.get('/qr_code/', headers=auth_headers).json()
+    assert item['scan_count'] == 3
+
+    stats = test_client.get(f"/qr_code/{qr_code['id']}/stats?days=1", headers=auth_headers).json()
+    assert stats['total'] == 3
+    assert stats['days'][-1]['count'] == 3
+    assert journal.backlog == 0
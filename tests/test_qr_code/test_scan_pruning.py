@@ -2,9 +2,11 @@ import time
 import uuid
 
 import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncEngine
 
 from qr_code.models import QrCode, ScanEvent
-from qr_code.services import SCAN_EVENT_PRUNE_EVERY, SCAN_EVENT_RETENTION_SECONDS, QrCodeService
+from qr_code.scan_retention import SCAN_EVENT_RETENTION_SECONDS, ScanRetention
+from qr_code.services import QrCodeService
 
 
 @pytest_asyncio.fixture
@@ -12,35 +14,47 @@ async def qr_code_service(request_container) -> QrCodeService:
     return await request_container.get(QrCodeService)
 
 
-async def _make_qr_code_with_events(qr_code_service, scan_count):
+@pytest_asyncio.fixture
+async def engine(container) -> AsyncEngine:
+    return await container.get(AsyncEngine)
+
+
+async def _make_qr_code_with_events(qr_code_service, session, old, fresh):
     qr_code = await qr_code_service.qr_code_repo.create_and_get(
-        QrCode(user_id=uuid.uuid4(), name='test', link='https://example.com', scan_count=scan_count)
+        QrCode(user_id=uuid.uuid4(), name='test', link='https://example.com')
     )
     now = int(time.time())
     old_ts = now - SCAN_EVENT_RETENTION_SECONDS - 60
     fresh_ts = now - 60
-    await qr_code_service.scan_event_repo.create(ScanEvent(qr_code_id=qr_code.id, ts=old_ts))
-    await qr_code_service.scan_event_repo.create(ScanEvent(qr_code_id=qr_code.id, ts=fresh_ts))
+    for ts in [old_ts] * old + [fresh_ts] * fresh:
+        await qr_code_service.scan_event_repo.create(ScanEvent(qr_code_id=qr_code.id, ts=ts))
+    await session.commit()
     return qr_code, old_ts, fresh_ts
 
 
-async def test_register_scan_prunes_events_older_than_retention(qr_code_service):
-    # scan_count is a multiple of the prune period (0), so this scan triggers pruning
-    qr_code, old_ts, fresh_ts = await _make_qr_code_with_events(qr_code_service, scan_count=0)
+async def test_retention_removes_expired_events_of_every_code_in_chunks(qr_code_service, session, engine):
+    a, old_ts, fresh_ts = await _make_qr_code_with_events(qr_code_service, session, old=3, fresh=1)
+    b, _, _ = await _make_qr_code_with_events(qr_code_service, session, old=2, fresh=0)  # no longer scanned
 
-    await qr_code_service.register_scan(qr_code.id)
+    retention = ScanRetention(engine, interval=3600, chunk_size=2, pause=0)
+    assert await retention.run_once() == 5
+    await session.commit()
+    assert await qr_code_service.scan_event_repo.get_ts_since(a.id, 0) == [fresh_ts]
+    assert await qr_code_service.scan_event_repo.get_ts_since(b.id, 0) == []
 
-    timestamps = await qr_code_service.scan_event_repo.get_ts_since(qr_code.id, 0)
-    assert old_ts not in timestamps
-    assert fresh_ts in timestamps
-    assert len(timestamps) == 2  # the fresh pre-existing event + the scan itself
+    metrics = retention.metrics()
+    assert (metrics['runs'], metrics['removed'], metrics['last_run_removed']) == (1, 5, 5)
+    assert metrics['last_run_ms'] > 0
+    assert await retention.run_once() == 0
 
 
-async def test_register_scan_skips_pruning_between_periods(qr_code_service):
-    qr_code, old_ts, fresh_ts = await _make_qr_code_with_events(qr_code_service, scan_count=SCAN_EVENT_PRUNE_EVERY + 1)
+async def test_applying_scans_deletes_nothing(qr_code_service, session):
+    qr_code, old_ts, fresh_ts = await _make_qr_code_with_events(qr_code_service, session, old=1, fresh=1)
 
     await qr_code_service.register_scan(qr_code.id)
+    await qr_code_service.scan_journal.apply()
 
+    await session.commit()
     timestamps = await qr_code_service.scan_event_repo.get_ts_since(qr_code.id, 0)
-    assert old_ts in timestamps  # not pruned on off-period scans
+    assert old_ts in timestamps  # left to the retention job
     assert len(timestamps) == 3
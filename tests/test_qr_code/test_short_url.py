@@ -0,0 +1,86 @@
+import uuid
+
+import pytest
+
+from core.settings import settings
+from qr_code import services
+from qr_code.matrix import get_qr_matrix
+from qr_code.models import BASE62_ALPHABET, QrCode
+
+
+@pytest.fixture
+def auth_headers(test_client):
+    response = test_client.post('/user/register', json={'username': 'qr_owner', 'password': 'pw12345678'})
+    assert response.status_code == 200, response.json()
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+
+def create(test_client, auth_headers, link='https://example.com'):
+    response = test_client.post('/qr_code/', json={'name': 'test', 'link': link}, headers=auth_headers)
+    assert response.status_code == 200, response.json()
+    return response.json()
+
+
+def test_new_code_gets_a_short_slug(test_client, auth_headers):
+    qr_code = create(test_client, auth_headers)
+    assert qr_code['short_url'] is True
+    assert len(qr_code['slug']) == settings.QR_SLUG_LENGTH
+    assert set(qr_code['slug']) <= set(BASE62_ALPHABET)
+
+
+def test_short_url_redirects_and_counts(test_client, auth_headers):
+    qr_code = create(test_client, auth_headers)
+    response = test_client.get(f"/r/{qr_code['slug']}", follow_redirects=False)
+    assert response.status_code == 302, response.text
+    assert response.headers['location'] == 'https://example.com'
+
+    response = test_client.head(f"/r/{qr_code['slug']}", follow_redirects=False)
+    assert response.status_code == 302, response.text
+
+    (item,) = test_client.get('/qr_code/', headers=auth_headers).json()
+    assert item['scan_count'] == 1
+
+
+def test_uuid_url_keeps_working(test_client, auth_headers):
+    qr_code = create(test_client, auth_headers)
+    response = test_client.get(f"/qr_code/{qr_code['id']}", follow_redirects=False)
+    assert response.status_code == 302, response.text
+    assert response.headers['location'] == 'https://example.com'
+
+
+def test_unknown_slug_404(test_client):
+    response = test_client.get('/r/nope123', follow_redirects=False)
+    assert response.status_code == 404, response.text
+
+
+def test_slug_collision_is_retried(test_client, auth_headers, monkeypatch):
+    taken = create(test_client, auth_headers)['slug']
+    slugs = iter([taken, taken, 'Fresh01'])
+    monkeypatch.setattr(services, 'new_slug', lambda: next(slugs))
+    assert create(test_client, auth_headers)['slug'] == 'Fresh01'
+
+
+def test_slug_is_widened_when_every_attempt_collides(test_client, auth_headers, monkeypatch):
+    taken = create(test_client, auth_headers)['slug']
+    monkeypatch.setattr(services, 'new_slug', lambda length=None: taken.ljust(length or 0, 'x'))
+    qr_code = create(test_client, auth_headers)
+    assert len(qr_code['slug']) == 2 * settings.QR_SLUG_LENGTH
+    response = test_client.get(f"/r/{qr_code['slug']}", follow_redirects=False)
+    assert response.status_code == 302, response.text
+
+
+def test_public_url_is_short_for_new_codes_only():
+    qr_code = QrCode(user_id=uuid.uuid4(), name='test', link='https://example.com')
+    assert qr_code.public_url().endswith(f'/r/{qr_code.slug}')
+    assert qr_code.render_params().data == qr_code.public_url()
+
+    qr_code.short_url = False
+    assert qr_code.public_url().endswith(f'/qr_code/{qr_code.id}')
+    assert qr_code.render_params().data == qr_code.public_url()
+
+
+def test_short_url_needs_a_smaller_code():
+    qr_code = QrCode(user_id=uuid.uuid4(), name='test', link='https://example.com')
+    short = get_qr_matrix(qr_code.public_url())
+    qr_code.short_url = False
+    assert short.version < get_qr_matrix(qr_code.public_url()).version
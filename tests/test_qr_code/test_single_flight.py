@@ -0,0 +1,45 @@
+import asyncio
+import uuid
+
+import pytest
+
+from qr_code.disk_cache import DiskImageCache
+from qr_code.image_cache import RenderedImageCache
+from qr_code.models import QrRender
+from qr_code.render_pool import RenderPool
+from qr_code.rendering import ImageRenderer
+
+
+@pytest.fixture
+def renderer():
+    return ImageRenderer(RenderedImageCache(10**7), DiskImageCache(None, 0), RenderPool(workers=0, max_pending=8))
+
+
+def make_render(qr_code_id, fmt='png', style='square'):
+    return QrRender.for_code(
+        qr_code_id, fmt, 10, fill_color='#000000', fill_color2=None, back_color='#ffffff', style=style
+    )
+
+
+@pytest.mark.parametrize('fmt', ['png', 'svg'])
+async def test_concurrent_requests_share_one_render(renderer, fmt):
+    qr_code_id = uuid.uuid4()
+    render = make_render(qr_code_id, fmt)
+    results = await asyncio.gather(*(renderer.get(qr_code_id, render) for _ in range(5)))
+
+    assert len(set(results)) == 1
+    assert renderer.render_pool.rendered == 1
+    assert renderer.metrics() == {'renders': 1, 'coalesced': 4, 'streamed': 0, 'in_flight': 0}
+
+
+async def test_cancelled_waiter_does_not_cancel_shared_render(renderer):
+    qr_code_id = uuid.uuid4()
+    render = make_render(qr_code_id, style='dots')
+    first = asyncio.create_task(renderer.get(qr_code_id, render))
+    second = asyncio.create_task(renderer.get(qr_code_id, render))
+    while renderer.renders + renderer.coalesced < 2:  # both waiting on the render
+        await asyncio.sleep(0.001)
+    first.cancel()
+
+    assert (await second).startswith(b'\x89PNG')
+    assert renderer.metrics()['coalesced'] == 1
@@ -1,4 +1,7 @@
+import io
+
 import pytest
+from PIL import Image
 
 
 @pytest.fixture
@@ -104,6 +107,15 @@ def test_style_preview_renders_png(test_client, auth_headers):
     assert response.headers['content-type'] == 'image/png'
 
 
+def test_style_preview_scale(test_client, auth_headers):
+    def width(**params):
+        response = test_client.get('/qr_code/style/preview', params=params, headers=auth_headers)
+        assert response.status_code == 200, response.text
+        return Image.open(io.BytesIO(response.content)).width
+
+    assert width(scale=8) == width() // 6 * 8
+
+
 def test_style_preview_validates_contrast(test_client, auth_headers):
     response = test_client.get(
         '/qr_code/style/preview',
@@ -111,3 +123,30 @@ def test_style_preview_validates_contrast(test_client, auth_headers):
         headers=auth_headers,
     )
     assert response.status_code == 422
+
+
+def test_error_correction_defaults_to_auto_and_survives_edit(test_client, auth_headers):
+    qr_code = create(test_client, auth_headers).json()
+    assert qr_code['error_correction'] == 'auto'
+
+    payload = {'name': 'styled', 'link': 'https://example.com', 'error_correction': 'H'}
+    response = test_client.put(f"/qr_code/{qr_code['id']}", json=payload, headers=auth_headers)
+    assert response.json()['error_correction'] == 'H'
+    response = test_client.put(f"/qr_code/{qr_code['id']}", json={**payload, 'style': 'dots'}, headers=auth_headers)
+    assert response.json()['error_correction'] == 'H'
+
+
+def test_stats_report_the_encoded_code(test_client, auth_headers):
+    square = create(test_client, auth_headers).json()
+    dots = create(test_client, auth_headers, style='dots').json()
+
+    def code(qr_code):
+        response = test_client.get(f"/qr_code/{qr_code['id']}/stats", headers=auth_headers)
+        assert response.status_code == 200, response.json()
+        return response.json()['code']
+
+    square_code, dots_code = code(square), code(dots)
+    assert square_code['modules'] == square_code['version'] * 4 + 17
+    # plain squares get by with less error correction, and so with a smaller code
+    assert square_code['version'] < dots_code['version']
+    assert dots_code['error_correction'] in ('Q', 'H')
@@ -0,0 +1,73 @@
+import io
+import uuid
+
+import pytest
+from PIL import Image
+
+from core.settings import settings
+from qr_code.models import QrCode, render_qr_bytes
+from qr_code.png_stream import should_stream
+
+
+@pytest.fixture
+def auth_headers(test_client):
+    response = test_client.post('/user/register', json={'username': 'thumbnailer', 'password': 'pw12345678'})
+    assert response.status_code == 200, response.json()
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def qr_code(test_client, auth_headers):
+    response = test_client.post('/qr_code/', json={'name': 'test', 'link': 'https://example.com'}, headers=auth_headers)
+    assert response.status_code == 200, response.json()
+    return response.json()
+
+
+@pytest.mark.parametrize('style', ['square', 'dots'])
+@pytest.mark.parametrize('fmt', ['png', 'webp'])
+def test_thumbnail_has_the_exact_target_width(style, fmt):
+    qr_code = QrCode(user_id=uuid.uuid4(), name='test', link='https://example.com', style=style)
+    for pixels in settings.QR_THUMBNAIL_SIZES.values():
+        image = Image.open(io.BytesIO(render_qr_bytes(qr_code.render_params(fmt, pixels=pixels))))
+        assert image.size == (pixels, pixels)
+
+
+def test_thumbnail_ignores_scale_and_svg_ignores_size():
+    qr_code = QrCode(user_id=uuid.uuid4(), name='test', link='https://example.com')
+    assert qr_code.render_params('png', 40, pixels=64) == qr_code.render_params('png', 10, pixels=64)
+    assert qr_code.render_params('svg', pixels=64) == qr_code.render_params('svg')
+
+
+def test_thumbnails_are_never_streamed(monkeypatch):
+    monkeypatch.setattr(settings, 'QR_PNG_STREAM_MIN_PIXELS', 0)
+    qr_code = QrCode(user_id=uuid.uuid4(), name='test', link='https://example.com')
+    assert should_stream(qr_code.render_params('png'))
+    assert not should_stream(qr_code.render_params('png', pixels=64))
+
+
+def test_size_parameter_serves_the_thumbnail(test_client, qr_code):
+    url = f"/qr_code/{qr_code['id']}/image"
+    response = test_client.get(url + '?fmt=png&size=sm')
+    assert response.status_code == 200
+    assert Image.open(io.BytesIO(response.content)).size == (128, 128)
+    assert response.headers['etag'] != test_client.get(url + '?fmt=png').headers['etag']
+    assert test_client.get(url + '?size=huge').status_code == 422
+
+
+def test_list_carries_versioned_thumbnail_urls(test_client, auth_headers, qr_code):
+    [item] = test_client.get('/qr_code/', headers=auth_headers).json()
+    images = item['images']
+    assert set(images) == {'thumb', 'sm', 'md', 'srcset'}
+    assert images['srcset'] == f"{images['thumb']} 64w, {images['sm']} 128w, {images['md']} 256w"
+
+    response = test_client.get(images['thumb'])
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['cache-control']
+
+    test_client.put(
+        f"/qr_code/{qr_code['id']}",
+        json={'name': 'test', 'link': 'https://example.com', 'style': 'dots'},
+        headers=auth_headers,
+    )
+    [edited] = test_client.get('/qr_code/', headers=auth_headers).json()
+    assert edited['images']['thumb'] != images['thumb']
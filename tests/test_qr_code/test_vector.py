@@ -0,0 +1,59 @@
+import re
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pytest
+
+from qr_code.matrix import QR_BORDER, get_qr_matrix
+from qr_code.models import QR_STYLES, render_qr_svg
+
+DATA = 'https://example.com/some/path'
+SVG = '{http://www.w3.org/2000/svg}'
+
+
+def parse(svg: bytes) -> ET.Element:
+    return ET.fromstring(svg)
+
+
+def find(element, path):
+    found = element.find(path)
+    assert found is not None, path
+    return found
+
+
+@pytest.mark.parametrize('style', QR_STYLES)
+def test_svg_is_well_formed_and_sized_in_modules(style):
+    root = parse(render_qr_svg(DATA, '#2A5E8C', None, '#F5EFE6', style))
+    width = get_qr_matrix(DATA).size + 2 * QR_BORDER
+    assert root.get('viewBox') == f'0 0 {width} {width}'
+    assert find(root, f'{SVG}rect').get('fill') == '#F5EFE6'
+    assert find(root, f'{SVG}path').get('fill') == '#2A5E8C'
+
+
+def test_square_path_merges_runs_and_covers_exactly_the_dark_modules():
+    modules = get_qr_matrix(DATA).modules
+    path = find(parse(render_qr_svg(DATA, '#000000', None, '#ffffff', 'square')), f'{SVG}path').attrib['d']
+    covered = np.zeros_like(modules)
+    x = y = 0
+    for dx, dy, run in re.findall(r'm(-?\d+)[ ]?(-?\d+)h(\d+)v1h-\3z', path):
+        x, y = x + int(dx), y + int(dy)
+        start, end = x - QR_BORDER, x - QR_BORDER + int(run)
+        covered[y - QR_BORDER, start:end] = True
+    assert (covered == modules).all()
+    assert path.count('m') < modules.sum() / 2
+
+
+def test_shapes_are_drawn_with_arcs():
+    square = find(parse(render_qr_svg(DATA, '#000000', None, '#ffffff', 'square')), f'{SVG}path').attrib['d']
+    assert 'a' not in square
+    for style in ('rounded', 'dots'):
+        path = find(parse(render_qr_svg(DATA, '#000000', None, '#ffffff', style)), f'{SVG}path').attrib['d']
+        assert 'a.5.5 0' in path
+
+
+def test_gradient_becomes_radial_gradient():
+    root = parse(render_qr_svg(DATA, '#000000', '#1D4ED8', '#ffffff', 'dots'))
+    gradient = find(root, f'{SVG}defs/{SVG}radialGradient')
+    stops = [stop.get('stop-color') for stop in gradient.findall(f'{SVG}stop')]
+    assert stops == ['#000000', '#1D4ED8']
+    assert find(root, f'{SVG}path').get('fill') == f"url(#{gradient.get('id')})"
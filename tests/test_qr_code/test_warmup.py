@@ -0,0 +1,112 @@
+import asyncio
+import time
+import uuid
+
+import pytest_asyncio
+
+from qr_code.disk_cache import DiskImageCache
+from qr_code.image_cache import RenderedImageCache
+from qr_code.models import QrCode
+from qr_code.render_pool import RenderPool
+from qr_code.rendering import ImageRenderer, ImageWarmer
+
+
+@pytest_asyncio.fixture
+async def warmer():
+    renderer = ImageRenderer(RenderedImageCache(10**7), DiskImageCache(None, 0), RenderPool(workers=0, max_pending=8))
+    return ImageWarmer(renderer, asyncio.get_running_loop())
+
+
+async def wait_idle(warmer):
+    while warmer.pending:
+        await asyncio.sleep(0.01)
+
+
+async def test_schedule_fills_cache_with_default_png_and_svg(warmer):
+    qr_code = QrCode(user_id=uuid.uuid4(), name='test', link='https://example.com')
+    warmer.schedule(qr_code)
+    await wait_idle(warmer)
+
+    cache = warmer.renderer.image_cache
+    assert cache.get(qr_code.id, qr_code.render_params('png')) is not None
+    assert cache.get(qr_code.id, qr_code.render_params('svg')) is not None
+
+
+async def test_newer_edit_supersedes_pending_job(warmer):
+    qr_code = QrCode(user_id=uuid.uuid4(), name='test', link='https://example.com')
+    warmer.schedule(qr_code)
+    warmer.schedule(qr_code)  # same parameters: deduplicated
+    assert warmer.pending == 1
+    old_png = qr_code.render_params('png')
+    qr_code.style = 'dots'
+    warmer.schedule(qr_code)
+    await wait_idle(warmer)
+
+    cache = warmer.renderer.image_cache
+    assert cache.get(qr_code.id, old_png) is None
+    assert cache.get(qr_code.id, qr_code.render_params('png')) is not None
+
+
+async def test_cancel_drops_pending_job(warmer):
+    qr_code = QrCode(user_id=uuid.uuid4(), name='test', link='https://example.com')
+    warmer.schedule(qr_code)
+    warmer.cancel(qr_code.id)
+    await asyncio.sleep(0.05)
+    assert warmer.pending == 0
+    assert len(warmer.renderer.image_cache) == 0
+
+
+async def test_warming_again_leaves_cache_stats_alone(warmer):
+    qr_code = QrCode(user_id=uuid.uuid4(), name='test', link='https://example.com')
+    warmer.schedule(qr_code)
+    await wait_idle(warmer)
+    stats = warmer.renderer.image_cache.metrics()
+    renders = warmer.renderer.renders
+
+    warmer.schedule(qr_code)
+    await wait_idle(warmer)
+    assert warmer.renderer.image_cache.metrics() == stats
+    assert warmer.renderer.renders == renders
+
+
+async def test_images_on_disk_are_not_rendered_again(tmp_path):
+    disk_cache = DiskImageCache(tmp_path, 10**7)
+    qr_code = QrCode(user_id=uuid.uuid4(), name='test', link='https://example.com')
+    first = ImageWarmer(
+        ImageRenderer(RenderedImageCache(10**7), disk_cache, RenderPool(workers=0, max_pending=8)),
+        asyncio.get_running_loop(),
+    )
+    first.schedule(qr_code)
+    await wait_idle(first)
+
+    # another worker: its memory cache is empty, the disk cache is shared
+    renderer = ImageRenderer(RenderedImageCache(10**7), disk_cache, RenderPool(workers=0, max_pending=8))
+    second = ImageWarmer(renderer, asyncio.get_running_loop())
+    second.schedule(qr_code)
+    await wait_idle(second)
+    assert renderer.renders == 0
+
+
+def wait_cached(image_cache, qr_code_id, render):
+    for _ in range(500):
+        if image_cache.get(qr_code_id, render) is not None:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_saving_a_code_warms_its_default_image(test_client, container):
+    response = test_client.post('/user/register', json={'username': 'warmer', 'password': 'pw12345678'})
+    headers = {'Authorization': f"Bearer {response.json()['access_token']}"}
+    image_cache = test_client.portal.call(container.get, RenderedImageCache)
+
+    body = test_client.post('/qr_code/', json={'name': 'test', 'link': 'https://example.com'}, headers=headers).json()
+    del body['image_version']
+    qr_code = QrCode(**{**body, 'id': uuid.UUID(body['id']), 'user_id': uuid.UUID(body['user_id'])})
+    assert wait_cached(image_cache, qr_code.id, qr_code.render_params('png'))
+
+    test_client.put(
+        f'/qr_code/{qr_code.id}', json={'name': 'test', 'link': 'https://example.com', 'style': 'dots'}, headers=headers
+    )
+    qr_code.style = 'dots'
+    assert wait_cached(image_cache, qr_code.id, qr_code.render_params('png'))